@@ -1,7 +1,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import router
+from routes import router, csv_path, job_queue, prune_uploads
+from services.catalog_service import get_catalog
+from services.ingestion import shutdown_ingestion_pool
+from services.openai_client import openai_service
+from services.response_cache import response_cache
 import pymongo
+import asyncio
 import logging
 from contextlib import asynccontextmanager, contextmanager
 from typing import Optional
@@ -57,6 +62,8 @@ def get_db_context():
 
 # Create global database connection instance
 db_connection = DatabaseConnection()
+# The response cache stores its entries in this database when it is reachable
+response_cache.get_db = db_connection.get_db
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -67,12 +74,28 @@ async def lifespan(app: FastAPI):
     # Startup: Initialize database connection
     logger.info("Starting up the application...")
     db_connection.connect()
+    openai_service.start()
+    try:
+        # Parse the equipment catalog once; it is re-read only when the file changes
+        get_catalog(csv_path)
+    except Exception as e:
+        logger.warning(f"Could not preload equipment catalog: {str(e)}")
+    try:
+        # Uploads retired before a restart are otherwise only removed after the next ingestion
+        await asyncio.to_thread(prune_uploads)
+    except Exception as e:
+        logger.warning(f"Could not remove superseded uploads: {str(e)}")
+    await job_queue.start()
     
     yield
     
     # Shutdown: Close database connection
     logger.info("Shutting down the application...")
+    await job_queue.stop()
+    await response_cache.flush()
     db_connection.close()
+    await openai_service.close()
+    shutdown_ingestion_pool()
 
 # Initialize FastAPI with lifespan
 app = FastAPI(
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of catalog loading on a synthetic catalog: the original
+row-by-row process_csv_data against the column-based loader, cold and cached.
+
+Run from the tractian_hackathon directory:
+    python -m benchmarks.bench_catalog_loading --rows 100000
+"""
+import os
+import time
+import argparse
+import tempfile
+import pandas as pd
+from services.catalog_service import get_catalog, read_catalog_frame, format_catalog_text
+
+
+def legacy_process_csv_data(csv_path: str) -> str:
+    # Original implementation, kept here as the reference for output and timing
+    df = pd.read_csv(csv_path, sep=';')
+    text_chunks = ["CATÁLOGO DE EQUIPAMENTOS E MATERIAIS\n"]
+    current_category = None
+    for _, row in df.iterrows():
+        if pd.notna(row['Categoria']):
+            current_category = row['Categoria']
+            text_chunks.append(f"\nCATEGORIA: {current_category}")
+        description = row['Descrição do Material/Equipamento'] if pd.notna(row['Descrição do Material/Equipamento']) else ""
+        code = row['Código SAP'] if pd.notna(row['Código SAP']) else ""
+        if description or code:
+            entry = []
+            if description:
+                entry.append(f"Descrição: {description}")
+            if code:
+                entry.append(f"Código SAP: {code}")
+            if current_category:
+                entry.append(f"Categoria: {current_category}")
+            text_chunks.append(" | ".join(entry))
+    text_chunks.append("\nFIM DO CATÁLOGO DE EQUIPAMENTOS E MATERIAIS\n")
+    return "\n".join(text_chunks)
+
+
+def write_synthetic_catalog(path: str, rows: int, group_size: int = 25):
+    lines = ["Categoria;Descrição do Material/Equipamento;Código SAP;;"]
+    for i in range(rows):
+        category = f"Categoria {i // group_size}" if i % group_size == 0 else ""
+        # A few rows without description or code, like the real export
+        description = "" if i % 97 == 0 else f"Equipamento {i} modelo {i % 13}"
+        code = "" if i % 89 == 0 else f"MAT{i:06d}"
+        lines.append(f"{category};{description};{code};;")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "catalog.csv")
+        write_synthetic_catalog(path, args.rows)
+
+        legacy, legacy_ms = timed(lambda: legacy_process_csv_data(path), args.repeat)
+        current, cold_ms = timed(lambda: format_catalog_text(read_catalog_frame(path)), args.repeat)
+        get_catalog(path).text
+        _, cached_ms = timed(lambda: get_catalog(path).text, args.repeat)
+
+        assert legacy == current, "column-based catalog text differs from the legacy output"
+        print(f"{args.rows} rows")
+        print(f"{'legacy iterrows':<20} {legacy_ms:10.1f}ms")
+        print(f"{'column-based':<20} {cold_ms:10.1f}ms  ({legacy_ms / cold_ms:.1f}x)")
+        print(f"{'cached (mtime)':<20} {cached_ms:10.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
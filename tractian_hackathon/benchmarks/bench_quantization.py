@@ -0,0 +1,43 @@
+"""
+Benchmark of quantized index storage: memory per row, recall against exact
+float32 search and query latency for float32 and int8 rows, with and without
+the exact float32 re-rank of the top candidates.
+
+Run from the tractian_hackathon directory:
+    python -m benchmarks.bench_quantization --rows 100000 --dim 1536
+"""
+import argparse
+from benchmarks.bench_vector_index import make_corpus, recall, timed
+from services.vector_index import VectorIndex
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    data, queries = make_corpus(args.rows, args.dim, args.clusters)
+    exact = VectorIndex(data, precision="float32")
+    print(f"{args.rows} rows x {args.dim} dims, {len(queries)} queries, top_k={args.top_k}")
+
+    truth, p50, p95 = timed(lambda q: exact.search(q, args.top_k)[0], queries)
+    float32_bytes = exact.matrix.nbytes
+    print(f"{'float32':<24} {float32_bytes / args.rows:7.0f} B/row  x1.00  recall=1.000  "
+          f"p50={p50:8.2f}ms  p95={p95:8.2f}ms")
+
+    # The original rows stay available for re-ranking, as the memory-mapped shared index does
+    for rerank_factor in (0, args.rerank_factor):
+        index = VectorIndex(data, precision="int8", source=data, rerank_factor=rerank_factor)
+        results, p50, p95 = timed(lambda q: index.search(q, args.top_k)[0], queries)
+        label = f"int8 + rerank x{rerank_factor}" if rerank_factor else "int8"
+        print(f"{label:<24} {index.matrix.nbytes / args.rows:7.0f} B/row  "
+              f"x{float32_bytes / index.matrix.nbytes:.2f}  recall={recall(results, truth, args.top_k):.3f}  "
+              f"p50={p50:8.2f}ms  p95={p95:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
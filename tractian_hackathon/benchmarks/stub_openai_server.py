@@ -0,0 +1,131 @@
+"""
+Local stand-in for the OpenAI chat completions and embeddings endpoints, to
+exercise the generation cascade without network access or API costs.
+
+The weak model answers after ``--weak-delay`` seconds and, with probability
+``--fail-rate``, returns a service order that fails validation (no steps or
+an unknown SAP code); every other model answers a valid order after
+``--strong-delay`` seconds. Embeddings come from the hashing backend.
+
+Run from the tractian_hackathon directory:
+    python -m benchmarks.stub_openai_server --port 8001 --fail-rate 0.3
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=stub uvicorn app:app
+and read the per-model metrics at GET /generation/stats.
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from services.embeddings import HashingEmbeddingBackend
+
+app = FastAPI(title="OpenAI stub")
+settings = argparse.Namespace(weak_model="gpt-4o-mini", fail_rate=0.3, weak_delay=0.2, strong_delay=1.0, dim=1536)
+
+
+def service_order(prompt: str, valid: bool) -> dict:
+    """A SafetyResponse using the first catalog code of the prompt's context."""
+    codes = re.findall(r"Código SAP: (\S+)", prompt)
+    problem = prompt.rsplit("Problema:", 1)[-1].replace("Resposta:", "").strip()
+    steps = [{
+        "ordem": 1,
+        "descricao": "Bloquear e etiquetar as fontes de energia da máquina",
+        "justificativa": "NR-12, item 12.11",
+        "medidas_seguranca": ["Usar EPI"],
+        "duracao": "20min",
+    }]
+    sap_code = codes[0] if codes else "MAT001"
+    if not valid:
+        if random.random() < 0.5:
+            steps = []
+        else:
+            sap_code = "XXX999"
+    return {"ordem_servico": [{
+        "problema": problem,
+        "passos": steps,
+        "equipamentos_necessarios": [{"nome": "Equipamento", "sap_code": sap_code, "quantidade": 1}],
+        "observacoes": [],
+        "referencias": [],
+        "prioridade": "alta",
+    }]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body["model"]
+    weak = model == settings.weak_model
+    await asyncio.sleep(settings.weak_delay if weak else settings.strong_delay)
+    prompt = body["messages"][-1]["content"]
+    content = json.dumps(
+        service_order(prompt, valid=not (weak and random.random() < settings.fail_rate)), ensure_ascii=False
+    )
+    completion_id, created = f"chatcmpl-stub-{random.getrandbits(32)}", int(time.time())
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(prompt) + len(content)) // 4},
+        }
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        return "data: " + json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+        }, ensure_ascii=False) + "\n\n"
+
+    async def events():
+        yield chunk({"role": "assistant", "content": ""})
+        for start in range(0, len(content), 16):
+            yield chunk({"content": content[start:start + 16]})
+            await asyncio.sleep(0)
+        yield chunk({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    matrix = HashingEmbeddingBackend(dim=settings.dim).embed_sync(texts)
+    return {
+        "object": "list",
+        "model": body["model"],
+        "data": [{"object": "embedding", "index": i, "embedding": row.tolist()} for i, row in enumerate(matrix)],
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--weak-model", default=settings.weak_model)
+    parser.add_argument("--fail-rate", type=float, default=settings.fail_rate)
+    parser.add_argument("--weak-delay", type=float, default=settings.weak_delay)
+    parser.add_argument("--strong-delay", type=float, default=settings.strong_delay)
+    parser.add_argument("--dim", type=int, default=settings.dim)
+    parser.parse_args(namespace=settings)
+    uvicorn.run(app, host="127.0.0.1", port=settings.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Builds the shared index of every corpus (or of the named ones) ahead of time,
+so that API workers only map it instead of building it on their first request.
+
+Run from the tractian_hackathon directory, before or while the API is running:
+    python build_index.py [corpus ...] [--prune]
+"""
+import os
+import asyncio
+import argparse
+from routes import corpora
+from services.ingestion import shutdown_ingestion_pool
+from services.llm_service import load_corpus
+from services.openai_client import openai_service
+from services.shared_index import prune_shared_indexes
+
+
+async def build(names, prune: bool):
+    openai_service.start()
+    try:
+        built = []
+        for name in names or corpora.names():
+            definition = corpora.get(name)
+            corpus = await load_corpus(definition["pdf_paths"], definition["csv_path"], openai_service)
+            print(f"{name}: {corpus.version}, {len(corpus.chunks)} chunks, "
+                  f"{corpus.shared.nbytes / 2**20:.1f} MiB in {corpus.shared.path}")
+            built.append(os.path.basename(corpus.shared.path))
+        if prune:
+            for removed in prune_shared_indexes(built):
+                print(f"Removed superseded index {removed}")
+    finally:
+        await openai_service.close()
+        shutdown_ingestion_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*", help="corpora to build (default: all)")
+    parser.add_argument("--prune", action="store_true", help="remove the indexes not built by this run")
+    args = parser.parse_args()
+    asyncio.run(build(args.corpora, args.prune))
+
+
+if __name__ == "__main__":
+    main()
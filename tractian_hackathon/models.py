@@ -1,6 +1,9 @@
 from typing import List, Literal
 from pydantic import BaseModel
 
+# Corpus used when a request names none
+DEFAULT_CORPUS = "default"
+
 class Equipament(BaseModel):
     nome: str
     sap_code: str
@@ -22,4 +25,9 @@ class SafetySolution(BaseModel):
     prioridade: Literal['baixa', 'media', 'alta', 'maxima']
 
 class SafetyResponse(BaseModel):
-    ordem_servico: List[SafetySolution]
\ No newline at end of file
+    ordem_servico: List[SafetySolution]
+
+class ServiceBatchRequest(BaseModel):
+    problemas: List[str]
+    no_cache: bool = False
+    corpus: str = DEFAULT_CORPUS
@@ -1,28 +1,66 @@
 from bson import ObjectId  # bson = binary JSON, the data format used by MongoDB
 from bson import ObjectId
 from fastapi import APIRouter, HTTPException, File, UploadFile
-from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import List, Optional, Union
 from fastapi.middleware.cors import CORSMiddleware
 import os
-from models import SafetyResponse
-from services.llm_service import process_documents_with_assistant
+from models import SafetyResponse, ServiceBatchRequest
+from services.llm_service import (
+    get_corpus_store, index_document, load_corpus, process_documents_with_assistant, process_problems_batch,
+    stream_safety_response, resident_corpora
+)
+from services.corpus_registry import DEFAULT_CORPUS, CorpusRegistry, UnknownCorpus
 from services.offline_service import generate_service_order_pdf
 from services.audio_service import AudioTranscriber
-from openai import OpenAI
+from services.catalog_service import get_sap_code_index
+from services.response_cache import response_cache
+from services.embeddings import get_embedding_backend
+from services.model_cascade import generation_cascade
+from services.metrics import render_metrics, timed
+from services.openai_client import openai_service
+from services.job_queue import JobQueue, JobQueueFull
+from services.file_locks import file_lock
+import asyncio
+import hashlib
+import time
+import glob
+import uuid
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Initialize OpenAI client
-client = OpenAI()  # Make sure OPENAI_API_KEY is set in your environment variables
+# Shared async OpenAI client, started in the app lifespan (OPENAI_API_KEY must be set)
+client = openai_service
+# Initial documents of the default corpus; uploads to /documents publish new versions to CORPORA_FILE
 pdf_paths = [
     "prompts/nr-12-atualizada-2022-1.pdf",
     "prompts/WEG-w22-three-phase-electric-motor-50029265-brochure-english-web.pdf",
     "prompts/WEG-WMO-iom-installation-operation-and-maintenance-manual-of-electric-motors-50033244-manual-pt-en-es-web.pdf"
 ]
 csv_path = "prompts/equipamentos.csv"
+# Named document sets selected per request; "default" is the list above unless CORPORA_FILE overrides it
+corpora = CorpusRegistry({"pdf_paths": pdf_paths, "csv_path": csv_path})
+# Uploaded audio of background jobs is kept here until the job finishes
+job_audio_dir = "uploads/audio"
+# Uploaded manuals and catalogs, one directory per content hash so published files never change
+documents_dir = "uploads/documents"
+DOCUMENT_KINDS = {".pdf": "pdf", ".csv": "catalog", ".json": "catalog"}
+# Seconds a superseded upload is kept, so requests of any worker that resolved it before the switch can finish
+UPLOAD_RETENTION = float(os.getenv("UPLOAD_RETENTION", "600"))
+_prune_tasks = set()
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
 
 
 class MyJSONEncoder(json.JSONEncoder):
@@ -32,15 +70,19 @@ class MyJSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, o)
 
 
-def save_to_file(data: dict, filename: str = "service_orders.json"):
-    """Save data to a JSON file when MongoDB is unavailable"""
+@timed("save_to_file")
+def save_to_file(data: Union[dict, List[dict]], filename: str = "service_orders.json"):
+    """Save data (one record or a list of records) to a JSON file when MongoDB is unavailable"""
     try:
         existing_data = []
         if os.path.exists(filename):
             with open(filename, 'r', encoding='utf-8') as f:
                 existing_data = json.load(f)
 
-        existing_data.append(data)
+        if isinstance(data, list):
+            existing_data.extend(data)
+        else:
+            existing_data.append(data)
 
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(existing_data, f, ensure_ascii=False, indent=4)
@@ -50,6 +92,7 @@ def save_to_file(data: dict, filename: str = "service_orders.json"):
         return False
 
 
+@timed("load_service_order")
 def load_service_order(item_id: str):
     """Load service order from MongoDB or file system."""
     try:
@@ -76,6 +119,7 @@ def load_service_order(item_id: str):
         logger.error(f"Error loading service order: {str(e)}")
         return None
 
+@timed("load_from_file")
 def load_from_file(filename: str = "service_orders.json") -> list:
     """Load data from JSON file when MongoDB is unavailable"""
     try:
@@ -87,6 +131,234 @@ def load_from_file(filename: str = "service_orders.json") -> list:
         logger.error(f"Error loading from file: {str(e)}")
         return []
 
+@timed("persist_service_order")
+def persist_service_order(response_dict: dict) -> Optional[str]:
+    """Save a service order to MongoDB, or to the backup file when it is unavailable.
+
+    Returns the inserted id when saved to MongoDB.
+    """
+    from app import db_connection
+    db = db_connection.get_db()
+    if db is not None:
+        # If MongoDB is available, save to database
+        mycol = db["serviceOrders"]
+        res = mycol.insert_one(response_dict)
+        logger.info("Service order saved to MongoDB")
+        return str(res.inserted_id)
+
+    # If MongoDB is unavailable, save to file
+    save_success = save_to_file(response_dict)
+    if not save_success:
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to save service order to backup file"
+        )
+    logger.info("Service order saved to file")
+    return None
+
+
+@timed("persist_service_orders")
+def persist_service_orders(response_dicts: List[dict]) -> List[Optional[str]]:
+    """Save several service orders with a single insert_many, or a single backup file write.
+
+    Returns the inserted ids when saved to MongoDB.
+    """
+    if not response_dicts:
+        return []
+    from app import db_connection
+    db = db_connection.get_db()
+    if db is not None:
+        mycol = db["serviceOrders"]
+        res = mycol.insert_many(response_dicts)
+        logger.info(f"{len(res.inserted_ids)} service orders saved to MongoDB")
+        return [str(inserted_id) for inserted_id in res.inserted_ids]
+
+    save_success = save_to_file(response_dicts)
+    if not save_success:
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to save service orders to backup file"
+        )
+    logger.info(f"{len(response_dicts)} service orders saved to file")
+    return [None] * len(response_dicts)
+
+
+def corpus_paths(name: str):
+    """PDF paths and catalog path of a named corpus; unknown names answer 404."""
+    try:
+        definition = corpora.get(name)
+    except UnknownCorpus as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return definition["pdf_paths"], definition["csv_path"]
+
+
+def corpus_files(exclude: Optional[str] = None) -> set:
+    """Manuals and catalogs of the registered corpora, optionally leaving one corpus out."""
+    files = set()
+    for name in corpora.names():
+        if name != exclude:
+            definition = corpora.get(name)
+            files.update(definition["pdf_paths"])
+            files.add(definition["csv_path"])
+    return files
+
+
+def retire_upload(path: str):
+    """Marks a superseded upload; prune_uploads deletes it after UPLOAD_RETENTION unless a corpus uses it again."""
+    if os.path.commonpath([os.path.abspath(path), os.path.abspath(documents_dir)]) != os.path.abspath(documents_dir):
+        return
+    if os.path.exists(path):
+        open(f"{path}.superseded", "w").close()
+
+
+def prune_uploads() -> List[str]:
+    """Deletes the uploads retired more than UPLOAD_RETENTION ago that no corpus refers to."""
+    removed = []
+    if not os.path.isdir(documents_dir):
+        return removed
+    in_use = corpus_files()
+    # save_upload takes the same lock, so an upload published again meanwhile is never deleted
+    with file_lock(os.path.join(documents_dir, ".lock")):
+        for marker in glob.glob(os.path.join(documents_dir, "*", "*.superseded")):
+            path = marker[:-len(".superseded")]
+            if path not in in_use and os.path.exists(path):
+                if time.time() - os.path.getmtime(marker) < UPLOAD_RETENTION:
+                    continue
+                os.remove(path)
+                removed.append(path)
+            os.remove(marker)
+            directory = os.path.dirname(marker)
+            if not os.listdir(directory):
+                os.rmdir(directory)
+    if removed:
+        logger.info(f"Removed superseded uploads {removed}")
+    return removed
+
+
+async def prune_uploads_later():
+    await asyncio.sleep(UPLOAD_RETENTION)
+    try:
+        await asyncio.to_thread(prune_uploads)
+    except Exception as e:
+        logger.error(f"Error removing superseded uploads: {str(e)}")
+
+
+async def run_ingestion_job(job: dict, set_stage) -> dict:
+    """Background job: index an uploaded document and publish the corpus version that includes it."""
+    payload = job["payload"]
+    name = payload["corpus"]
+    # Uploads to the same corpus, in this or another worker process, are applied one at a time so none is lost
+    async with corpora.lock(name):
+        try:
+            definition = dict(corpora.get(name))
+            replaced = [definition["csv_path"]] if payload["document_kind"] == "catalog" else []
+        except UnknownCorpus:
+            # New corpora start with the default catalog and no manuals; they replace none of its files
+            definition = {"pdf_paths": [], "csv_path": corpora.get(DEFAULT_CORPUS)["csv_path"]}
+            replaced = []
+        if payload["document_kind"] == "catalog":
+            definition["csv_path"] = payload["path"]
+        else:
+            # A manual with the same file name is a new revision and replaces the previous one
+            filename = os.path.basename(payload["path"])
+            replaced = [path for path in definition["pdf_paths"] if os.path.basename(path) == filename]
+            definition["pdf_paths"] = [
+                path for path in definition["pdf_paths"] if os.path.basename(path) != filename
+            ] + [payload["path"]]
+        replaced = [path for path in replaced if path != payload["path"]]
+        # Files other corpora still use keep their store entries
+        in_use = corpus_files(exclude=name) | set(definition["pdf_paths"]) | {definition["csv_path"]}
+
+        set_stage("indexing")
+        # Indexed against the revision it replaces, so only its changed pages or rows are embedded
+        await index_document(
+            payload["path"], payload["document_kind"], client, get_corpus_store(),
+            replaces=replaced[0] if replaced else None, in_use=in_use
+        )
+        corpus = await load_corpus(definition["pdf_paths"], definition["csv_path"], client)
+        set_stage("publishing")
+        await asyncio.to_thread(corpora.publish, name, definition)
+        for path in replaced:
+            retire_upload(path)
+    if replaced:
+        task = asyncio.create_task(prune_uploads_later())
+        _prune_tasks.add(task)
+        task.add_done_callback(_prune_tasks.discard)
+    return {"corpus": name, "version": corpus.version, "documents": definition}
+
+
+async def run_service_order_job(job: dict, set_stage) -> dict:
+    """Background job: transcribe (for audio jobs), generate and persist a service order.
+
+    Document jobs are ingestions and are handed to run_ingestion_job.
+    """
+    payload = job["payload"]
+    if job["kind"] == "document":
+        return await run_ingestion_job(job, set_stage)
+    # Jobs queued before corpora existed have no corpus and use the default one
+    definition = corpora.get(payload.get("corpus", DEFAULT_CORPUS))
+    problema = payload.get("problema")
+    if job["kind"] in ("audio", "microphone"):
+        set_stage("transcribing")
+        transcriber = AudioTranscriber()
+        if job["kind"] == "audio":
+            audio_bytes = await asyncio.to_thread(read_file, payload["audio_path"])
+            problema = await asyncio.to_thread(transcriber.transcribe_audio_data, audio_bytes)
+        else:
+            problema = await asyncio.to_thread(transcriber.transcribe_from_microphone)
+
+    set_stage("generating")
+    resposta = await process_documents_with_assistant(
+        definition["pdf_paths"], definition["csv_path"], problema, client, use_cache=payload.get("use_cache", True)
+    )
+
+    set_stage("saving")
+    response_dict = resposta.model_dump()
+    service_id = persist_service_order(response_dict)
+    return {"id": service_id, "problema": problema, "data": json.loads(MyJSONEncoder().encode(response_dict))}
+
+
+def can_resume_job(job: dict) -> bool:
+    # Microphone recordings cannot be replayed after a restart
+    if job["kind"] == "microphone":
+        return False
+    if job["kind"] == "audio":
+        return os.path.exists(job["payload"]["audio_path"])
+    if job["kind"] == "document":
+        return os.path.exists(job["payload"]["path"])
+    return True
+
+
+def discard_job_files(job: dict):
+    # The uploaded audio is only needed until the job succeeded or failed for good
+    if job["kind"] == "audio" and os.path.exists(job["payload"]["audio_path"]):
+        os.remove(job["payload"]["audio_path"])
+
+
+job_queue = JobQueue(run_service_order_job, can_resume=can_resume_job, on_finished=discard_job_files)
+
+
+def submit_job(kind: str, payload: dict) -> JSONResponse:
+    """Queue a service-order job and answer 202 with its id."""
+    try:
+        job = job_queue.submit(kind, payload)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending jobs, try again later")
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}"}
+    )
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Stage, status and result of a background service-order job."""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {key: value for key, value in job.items() if key != "payload"}
+
+
 @router.get("/service/{item_id}/pdf")
 async def generate_pdf(item_id: str, download: Optional[bool] = False):
     """
@@ -204,28 +476,25 @@ async def generate_bulk_pdf(service_ids: str):
 
 
 @router.get("/addService")
-async def add_service(problema: str = "Preciso de uma manutenção na minha máquina de prensa"):
-    """Add a new service order based on the safety analysis."""
+async def add_service(
+    problema: str = "Preciso de uma manutenção na minha máquina de prensa",
+    no_cache: bool = False,
+    background: bool = False,
+    corpus: str = DEFAULT_CORPUS
+):
+    """Add a new service order based on the safety analysis of the ``corpus`` documents.
+
+    With ``background``, answers 202 with a job id to poll at /jobs/{job_id}.
+    """
+    corpus_pdf_paths, corpus_csv_path = corpus_paths(corpus)
+    if background:
+        return submit_job("problem", {"problema": problema, "use_cache": not no_cache, "corpus": corpus})
     try:
-        from app import db_connection
-        resposta = await process_documents_with_assistant(pdf_paths, csv_path, problema, client)
+        resposta = await process_documents_with_assistant(
+            corpus_pdf_paths, corpus_csv_path, problema, client, use_cache=not no_cache
+        )
         response_dict = resposta.model_dump()
-
-        db = db_connection.get_db()
-        if db is not None:
-            # If MongoDB is available, save to database
-            mycol = db["serviceOrders"]
-            mycol.insert_one(response_dict)
-            logger.info("Service order saved to MongoDB")
-        else:
-            # If MongoDB is unavailable, save to file
-            save_success = save_to_file(response_dict)
-            if not save_success:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to save service order to backup file"
-                )
-            logger.info("Service order saved to file")
+        persist_service_order(response_dict)
 
         return {"message": "Added with success!", "data": response_dict}
 
@@ -235,6 +504,80 @@ async def add_service(problema: str = "Preciso de uma manutenção na minha máq
             status_code=500, detail=f"Error processing request: {str(e)}")
 
 
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=MyJSONEncoder, ensure_ascii=False)}\n\n"
+
+
+@router.get("/addService/stream")
+async def add_service_stream(
+    problema: str = "Preciso de uma manutenção na minha máquina de prensa",
+    no_cache: bool = False,
+    corpus: str = DEFAULT_CORPUS
+):
+    """Add a new service order, streaming it as server-sent events.
+
+    Emits a ``step`` event for each SafetyStep and a ``solution`` event for each
+    SafetySolution as soon as they are generated, then a ``done`` event with
+    the persisted id and the final order, or an ``error`` event.
+    """
+    corpus_pdf_paths, corpus_csv_path = corpus_paths(corpus)
+
+    async def events():
+        try:
+            async for kind, index, item in stream_safety_response(
+                corpus_pdf_paths, corpus_csv_path, problema, client, use_cache=not no_cache
+            ):
+                if kind == "response":
+                    response_dict = item.model_dump()
+                    service_id = persist_service_order(response_dict)
+                    yield sse_event("done", {"id": service_id, "data": response_dict})
+                else:
+                    yield sse_event(kind, {"solution": index, kind: item.model_dump()})
+        except Exception as e:
+            logger.error(f"Error in add_service_stream: {str(e)}")
+            yield sse_event("error", {"detail": f"Error processing request: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/addServices")
+async def add_services(request: ServiceBatchRequest):
+    """Add one service order per problem, retrieving context for all of them in one pass.
+
+    Problems whose generation failed are reported with their error and not saved.
+    """
+    corpus_pdf_paths, corpus_csv_path = corpus_paths(request.corpus)
+    try:
+        respostas = await process_problems_batch(
+            corpus_pdf_paths, corpus_csv_path, request.problemas, client, use_cache=not request.no_cache
+        )
+        response_dicts = [
+            resposta.model_dump() for resposta in respostas if not isinstance(resposta, BaseException)
+        ]
+        service_ids = iter(persist_service_orders(response_dicts))
+        saved = iter(response_dicts)
+
+        results = []
+        for problema, resposta in zip(request.problemas, respostas):
+            if isinstance(resposta, BaseException):
+                logger.error(f"Error generating service order for '{problema}': {str(resposta)}")
+                results.append({"problema": problema, "error": str(resposta)})
+            else:
+                results.append({"problema": problema, "id": next(service_ids), "data": next(saved)})
+
+        return json.loads(MyJSONEncoder().encode({"message": "Added with success!", "results": results}))
+
+    except Exception as e:
+        logger.error(f"Error in add_services: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Error processing request: {str(e)}")
+
+
 @router.get("/getServices")
 async def get_services():
     """Retrieve all service orders."""
@@ -258,32 +601,17 @@ async def get_services():
 
 
 @router.post("/transcribe")
-async def transcribe_audio():
+async def transcribe_audio(background: bool = False, corpus: str = DEFAULT_CORPUS):
     """Endpoint to handle audio transcription."""
+    corpus_pdf_paths, corpus_csv_path = corpus_paths(corpus)
+    if background:
+        return submit_job("microphone", {"corpus": corpus})
     try:
-        from app import db_connection
-        db = db_connection.get_db()
-
         transcriber = AudioTranscriber()
         transcription = transcriber.transcribe_from_microphone()
-        resposta = await process_documents_with_assistant(pdf_paths, csv_path, transcription, client)
+        resposta = await process_documents_with_assistant(corpus_pdf_paths, corpus_csv_path, transcription, client)
         response_dict = resposta.model_dump()
-
-        db = db_connection.get_db()
-        if db is not None:
-            # If MongoDB is available, save to database
-            mycol = db["serviceOrders"]
-            mycol.insert_one(response_dict)
-            logger.info("Service order saved to MongoDB")
-        else:
-            # If MongoDB is unavailable, save to file
-            save_success = save_to_file(response_dict)
-            if not save_success:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to save service order to backup file"
-                )
-            logger.info("Service order saved to file")
+        persist_service_order(response_dict)
 
         return {"message": "Added with success!", "data": response_dict}
     except Exception as e:
@@ -292,6 +620,108 @@ async def transcribe_audio():
             status_code=500, detail=f"Error transcribing audio: {str(e)}")
 
 
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the semantic response cache."""
+    return response_cache.stats()
+
+
+@router.get("/embeddings/stats")
+async def embedding_stats():
+    """Texts, batches, tokens and tokens/s embedded by this process, in total and for the last document."""
+    return get_embedding_backend(client).stats()
+
+
+def publish_upload(tmp_path: str, digest: str, filename: str) -> str:
+    """Moves a written upload under the hash of its content; an earlier retirement of that file is cancelled."""
+    target_dir = os.path.join(documents_dir, digest[:16])
+    path = os.path.join(target_dir, os.path.basename(filename))
+    with file_lock(os.path.join(documents_dir, ".lock")):
+        os.makedirs(target_dir, exist_ok=True)
+        os.replace(tmp_path, path)
+        if os.path.exists(f"{path}.superseded"):
+            os.remove(f"{path}.superseded")
+    return path
+
+
+async def save_upload(file: UploadFile) -> str:
+    """Streams an upload to disk and moves it under the hash of its content."""
+    os.makedirs(documents_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(documents_dir, f".{uuid.uuid4().hex}.upload")
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                block = await file.read(1 << 20)
+                if not block:
+                    break
+                digest.update(block)
+                f.write(block)
+        path = await asyncio.to_thread(publish_upload, tmp_path, digest.hexdigest(), file.filename)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+@router.post("/documents")
+async def upload_document(file: UploadFile, corpus: str = DEFAULT_CORPUS):
+    """Add a manual (PDF) or equipment catalog (CSV or JSON) to a corpus.
+
+    The file is indexed in the background and the corpus switches to the new
+    document set once its index is published; requests keep using the current
+    version meanwhile. Answers 202 with a job id to poll at /jobs/{job_id}.
+    """
+    kind = DOCUMENT_KINDS.get(os.path.splitext(file.filename or "")[1].lower())
+    if kind is None:
+        raise HTTPException(status_code=415, detail="Expected a .pdf manual or a .csv/.json catalog")
+    try:
+        path = await save_upload(file)
+    except Exception as e:
+        logger.error(f"Error in upload_document: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Error saving document: {str(e)}")
+    return submit_job("document", {"corpus": corpus, "path": path, "document_kind": kind})
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage and model latency histograms of this process, in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/generation/stats")
+async def generation_stats():
+    """Calls, latency percentiles and escalation rates of each model of the generation cascade."""
+    return generation_cascade.stats()
+
+
+@router.get("/corpora")
+async def list_corpora():
+    """Names and documents of the corpora that can be selected with ``corpus``."""
+    return {name: corpora.get(name) for name in corpora.names()}
+
+
+@router.get("/corpora/stats")
+async def corpora_stats():
+    """Resident corpora with their size and load time, and the LRU hit/miss/eviction counters."""
+    return resident_corpora.stats()
+
+
+@router.get("/sap/autocomplete")
+async def sap_autocomplete(q: str, limit: int = 10, corpus: str = DEFAULT_CORPUS):
+    """Suggest catalog items for a partial SAP code or equipment description."""
+    _, corpus_csv_path = corpus_paths(corpus)
+    try:
+        sap_index = get_sap_code_index(corpus_csv_path)
+        return [item.to_dict() for item in sap_index.autocomplete(q, limit)]
+    except Exception as e:
+        logger.error(f"Error in sap_autocomplete: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Error searching SAP codes: {str(e)}")
+
+
 @router.get("/service/{item_id}")
 async def read_item(item_id):
     from app import db_connection
@@ -303,31 +733,24 @@ async def read_item(item_id):
 
 
 @router.post("/audioupload/")
-async def create_upload_file(file: UploadFile):
-    from app import db_connection
+async def create_upload_file(file: UploadFile, background: bool = False, corpus: str = DEFAULT_CORPUS):
+    corpus_pdf_paths, corpus_csv_path = corpus_paths(corpus)
+    if background:
+        # The audio is kept on disk so the job can be resumed after a restart
+        os.makedirs(job_audio_dir, exist_ok=True)
+        audio_path = os.path.join(job_audio_dir, f"{uuid.uuid4().hex}.audio")
+        await asyncio.to_thread(write_file, audio_path, await file.read())
+        return submit_job("audio", {"audio_path": audio_path, "corpus": corpus})
     try:
         transcriber = AudioTranscriber()
         audio_bytes = await file.read()
         transcription = transcriber.transcribe_audio_data(audio_bytes)
-        resposta = await process_documents_with_assistant(pdf_paths, csv_path, transcription, client)
+        resposta = await process_documents_with_assistant(corpus_pdf_paths, corpus_csv_path, transcription, client)
         response_dict = resposta.model_dump()
 
-        db = db_connection.get_db()
-        if db is not None:
-            # If MongoDB is available, save to database
-            mycol = db["serviceOrders"]
-            res = mycol.insert_one(response_dict)
-            logger.info("Service order saved to MongoDB")
-            return {"transcription": transcription, "id": str(res.inserted_id)}
-        else:
-            # If MongoDB is unavailable, save to file
-            save_success = save_to_file(response_dict)
-            if not save_success:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to save service order to backup file"
-                )
-            logger.info("Service order saved to file")
+        service_id = persist_service_order(response_dict)
+        if service_id is not None:
+            return {"transcription": transcription, "id": service_id}
 
         return {"message": "Added with success!", "data": response_dict}
     except Exception as e:
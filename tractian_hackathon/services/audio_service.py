@@ -5,6 +5,7 @@ from typing import Optional
 import speech_recognition as sr
 from openai import OpenAI
 from openai.types.audio import Transcription
+from services.metrics import timed
 
 # Configure logging
 logging.basicConfig(
@@ -35,6 +36,7 @@ class AudioTranscriber:
         self.client = OpenAI(api_key=self.api_key)
         self.recognizer = sr.Recognizer()
     
+    @timed("audio_record")
     def record_speech(self) -> bytes:
         """Record speech from microphone and return the audio data."""
         try:
@@ -55,6 +57,7 @@ class AudioTranscriber:
         except Exception as e:
             raise AudioRecognitionError(f"Error recording audio: {str(e)}")
     
+    @timed("audio_transcribe")
     def transcribe_audio_data(self, audio_data: bytes) -> str:
         """Transcribe audio data using OpenAI's Whisper model."""
         try:
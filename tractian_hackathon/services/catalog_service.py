@@ -0,0 +1,340 @@
+import os
+import re
+import json
+import math
+import unicodedata
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from typing import Dict, List, Optional
+from services.vector_index import VectorIndex, normalize_rows, top_k_from_scores
+
+# Catalog items sent to the model per request
+CATALOG_TOP_N = int(os.getenv("CATALOG_TOP_N", "15"))
+# Weight of the lexical match relative to the cosine similarity
+CATALOG_LEXICAL_WEIGHT = float(os.getenv("CATALOG_LEXICAL_WEIGHT", "0.3"))
+
+CATEGORY_COLUMN = 'Categoria'
+DESCRIPTION_COLUMN = 'Descrição do Material/Equipamento'
+SAP_CODE_COLUMN = 'Código SAP'
+
+_STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "na", "no", "nas", "nos",
+    "um", "uma", "para", "por", "com", "sem", "que", "se", "minha", "meu", "preciso",
+}
+
+
+def normalize_token_text(text: str) -> str:
+    """Lowercases and strips accents so that 'Manômetro' matches 'manometro'."""
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in re.findall(r"\w+", normalize_token_text(text)) if token not in _STOPWORDS]
+
+
+class CatalogItem:
+    """One equipment/material row of the SAP catalog."""
+
+    def __init__(self, description: str, sap_code: str, category: str):
+        self.description = description
+        self.sap_code = sap_code
+        self.category = category
+
+    def to_text(self) -> str:
+        """Same line format as the catalog text built by process_csv_data."""
+        entry = []
+        if self.description:
+            entry.append(f"Descrição: {self.description}")
+        if self.sap_code:
+            entry.append(f"Código SAP: {self.sap_code}")
+        if self.category:
+            entry.append(f"Categoria: {self.category}")
+        return " | ".join(entry)
+
+    def to_dict(self) -> dict:
+        return {"descricao": self.description, "sap_code": self.sap_code, "categoria": self.category}
+
+
+def read_catalog_frame(path: str) -> pd.DataFrame:
+    """
+    Parses the ';'-separated CSV or the grouped JSON export into a frame with
+    ``category``, ``description``, ``sap_code`` and ``starts_category`` columns,
+    using column operations only.
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            grouped = json.load(f)
+        rows = [
+            (category, description, code, position == 0)
+            for category, entries in grouped.items()
+            for position, (description, code) in enumerate(entries.items())
+        ]
+        return pd.DataFrame(rows, columns=["category", "description", "sap_code", "starts_category"])
+
+    df = pd.read_csv(path, sep=';', usecols=[CATEGORY_COLUMN, DESCRIPTION_COLUMN, SAP_CODE_COLUMN], dtype=str)
+    # In the CSV a category is only written on the first row of its group
+    return pd.DataFrame({
+        "category": df[CATEGORY_COLUMN].ffill().fillna(""),
+        "description": df[DESCRIPTION_COLUMN].fillna(""),
+        "sap_code": df[SAP_CODE_COLUMN].fillna(""),
+        "starts_category": df[CATEGORY_COLUMN].notna(),
+    })
+
+
+def format_catalog_text(frame: pd.DataFrame) -> str:
+    """Builds the catalog text (category headers and one line per item) in a single join."""
+    description = frame["description"].astype(str)
+    code = frame["sap_code"].astype(str)
+    category = frame["category"].astype(str)
+    has_description, has_code, has_category = description != "", code != "", category != ""
+
+    entries = (
+        ("Descrição: " + description).where(has_description, "")
+        + pd.Series(" | ", index=frame.index).where(has_description & (has_code | has_category), "")
+        + ("Código SAP: " + code).where(has_code, "")
+        + pd.Series(" | ", index=frame.index).where(has_code & has_category, "")
+        + ("Categoria: " + category).where(has_category, "")
+    )
+    headers = ("\nCATEGORIA: " + category).where(frame["starts_category"].astype(bool), None)
+    entries = entries.where(has_description | has_code, None)
+
+    # Interleave header and entry of each row, then drop the missing ones
+    lines = np.column_stack([headers.to_numpy(dtype=object), entries.to_numpy(dtype=object)]).ravel()
+    lines = lines[pd.notna(lines)]
+    return "\n".join(
+        ["CATÁLOGO DE EQUIPAMENTOS E MATERIAIS\n"]
+        + lines.tolist()
+        + ["\nFIM DO CATÁLOGO DE EQUIPAMENTOS E MATERIAIS\n"]
+    )
+
+
+class Catalog:
+    """Parsed catalog file; the item list, prompt text and SAP index are derived once, on demand."""
+
+    def __init__(self, frame: pd.DataFrame):
+        frame = frame.copy()
+        frame["category"] = frame["category"].astype("category")
+        self.frame = frame
+        self._items: Optional[List[CatalogItem]] = None
+        self._text: Optional[str] = None
+        self._sap_codes: Optional["SapCodeIndex"] = None
+
+    @property
+    def items(self) -> List[CatalogItem]:
+        if self._items is None:
+            frame = self.frame[(self.frame["description"] != "") | (self.frame["sap_code"] != "")]
+            self._items = [
+                CatalogItem(description.strip(), code.strip(), str(category).strip())
+                for category, description, code in zip(frame["category"], frame["description"], frame["sap_code"])
+            ]
+        return self._items
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = format_catalog_text(self.frame)
+        return self._text
+
+    @property
+    def sap_codes(self) -> "SapCodeIndex":
+        if self._sap_codes is None:
+            self._sap_codes = SapCodeIndex(self.items)
+        return self._sap_codes
+
+
+# path -> ((size, mtime_ns), Catalog)
+_catalogs: Dict[str, tuple] = {}
+
+
+def get_catalog(path: str) -> Catalog:
+    """Returns the parsed catalog, re-reading the file only when its mtime or size changes."""
+    stat = os.stat(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    cached = _catalogs.get(path)
+    if cached is None or cached[0] != version:
+        cached = (version, Catalog(read_catalog_frame(path)))
+        _catalogs[path] = cached
+    return cached[1]
+
+
+def load_catalog(path: str) -> List[CatalogItem]:
+    """Loads the catalog items from the ';'-separated CSV or the grouped JSON export."""
+    return get_catalog(path).items
+
+
+class CatalogIndex:
+    """
+    Retrieval index over catalog items: one embedding and one lexical entry per row.
+
+    Scores combine the cosine similarity with an IDF-weighted token overlap, so
+    exact matches on codes and equipment names are not lost by dense search.
+    """
+
+    def __init__(self, items: List[CatalogItem], embeddings: np.ndarray):
+        self.items = items
+        self.vectors = VectorIndex(embeddings)
+
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        for item_id, item in enumerate(items):
+            for token in set(tokenize(f"{item.description} {item.sap_code} {item.category}")):
+                self.postings[token].append(item_id)
+        self.idf = {
+            token: math.log(1 + len(items) / len(ids)) for token, ids in self.postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _lexical_scores(self, query: str) -> Dict[int, float]:
+        tokens = set(tokenize(query))
+        total = sum(self.idf.get(token, 0.0) for token in tokens)
+        if total == 0:
+            return {}
+        scores: Dict[int, float] = defaultdict(float)
+        for token in tokens:
+            for item_id in self.postings.get(token, ()):
+                scores[item_id] += self.idf[token] / total
+        return scores
+
+    def search(self, query: str, query_embedding: Optional[np.ndarray], top_n: int = CATALOG_TOP_N) -> List[CatalogItem]:
+        """Returns the ``top_n`` items most relevant to the query, best first."""
+        if not self.items:
+            return []
+        lexical = self._lexical_scores(query)
+        if query_embedding is None or len(self.vectors) == 0:
+            dense = np.zeros(len(self.items), dtype=np.float32)
+        else:
+            dense = self.vectors.matrix.scores(normalize_rows(query_embedding)[0])
+
+        scores = dense.copy()
+        for item_id, score in lexical.items():
+            scores[item_id] += CATALOG_LEXICAL_WEIGHT * score
+        return [self.items[i] for i in top_k_from_scores(scores, top_n)]
+
+    @staticmethod
+    def format_for_prompt(items: List[CatalogItem]) -> str:
+        return "\n".join(item.to_text() for item in items)
+
+
+def normalize_sap_code(code: str) -> str:
+    return re.sub(r"[\s\-_.]", "", str(code)).upper()
+
+
+def char_ngrams(text: str, n: int = 3) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class SapCodeIndex:
+    """
+    Exact and fuzzy lookup of SAP codes: a dict for O(1) validation and
+    character-trigram postings over codes and descriptions for fuzzy matches.
+    """
+
+    def __init__(self, items: List[CatalogItem]):
+        self.items = [item for item in items if item.sap_code]
+        self.by_code: Dict[str, CatalogItem] = {}
+        self.code_grams: Dict[str, List[int]] = defaultdict(list)
+        self.name_grams: Dict[str, List[int]] = defaultdict(list)
+        self._code_gram_counts: List[int] = []
+        self._name_gram_counts: List[int] = []
+
+        for item_id, item in enumerate(self.items):
+            code = normalize_sap_code(item.sap_code)
+            self.by_code.setdefault(code, item)
+            grams = char_ngrams(code)
+            for gram in grams:
+                self.code_grams[gram].append(item_id)
+            self._code_gram_counts.append(len(grams))
+
+            grams = char_ngrams(normalize_token_text(item.description))
+            for gram in grams:
+                self.name_grams[gram].append(item_id)
+            self._name_gram_counts.append(len(grams))
+
+    def __contains__(self, code: str) -> bool:
+        return normalize_sap_code(code) in self.by_code
+
+    def lookup(self, code: str) -> Optional[CatalogItem]:
+        return self.by_code.get(normalize_sap_code(code))
+
+    def _fuzzy(self, grams: set, postings: Dict[str, List[int]], counts: List[int], limit: int) -> List[tuple]:
+        overlap: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for item_id in postings.get(gram, ()):
+                overlap[item_id] += 1
+        # Jaccard similarity between trigram sets
+        scored = [
+            (self.items[item_id], shared / (len(grams) + counts[item_id] - shared))
+            for item_id, shared in overlap.items()
+        ]
+        scored.sort(key=lambda pair: pair[1], reverse=True)
+        return scored[:limit]
+
+    def fuzzy_codes(self, code: str, limit: int = 5) -> List[tuple]:
+        """Catalog items whose code is closest to ``code``, as (item, similarity) pairs."""
+        return self._fuzzy(char_ngrams(normalize_sap_code(code)), self.code_grams, self._code_gram_counts, limit)
+
+    def fuzzy_names(self, name: str, limit: int = 5) -> List[tuple]:
+        """Catalog items whose description is closest to ``name``, as (item, similarity) pairs."""
+        return self._fuzzy(char_ngrams(normalize_token_text(name)), self.name_grams, self._name_gram_counts, limit)
+
+    def resolve(self, code: str, name: str = "", min_similarity: float = 0.5) -> Optional[CatalogItem]:
+        """
+        Best catalog item for a possibly wrong code: the exact code, else the item
+        whose description matches ``name``, else the closest code.
+        """
+        item = self.lookup(code)
+        if item is not None:
+            return item
+        for candidates in (self.fuzzy_names(name, 1) if name else [], self.fuzzy_codes(code, 1)):
+            if candidates and candidates[0][1] >= min_similarity:
+                return candidates[0][0]
+        return None
+
+    def autocomplete(self, query: str, limit: int = 10) -> List[CatalogItem]:
+        """Codes starting with ``query`` first, then fuzzy matches on codes and descriptions."""
+        prefix = normalize_sap_code(query)
+        results = [item for code, item in self.by_code.items() if prefix and code.startswith(prefix)][:limit]
+        if len(results) < limit:
+            scores: Dict[int, tuple] = {}
+            for item, score in self.fuzzy_codes(query, limit) + self.fuzzy_names(query, limit):
+                if item not in results and (id(item) not in scores or scores[id(item)][1] < score):
+                    scores[id(item)] = (item, score)
+            ranked = sorted(scores.values(), key=lambda pair: pair[1], reverse=True)
+            results.extend(item for item, _ in ranked[:limit - len(results)])
+        return results
+
+
+def validate_sap_codes(response, sap_index: SapCodeIndex) -> dict:
+    """
+    Checks every equipment SAP code of a SafetyResponse against the catalog.
+
+    Codes that do not exist are replaced by the catalog item resolved from the
+    code and equipment name; codes that cannot be resolved are kept and flagged
+    in the solution's ``observacoes``. Returns a report of what was done.
+    """
+    report = {"valid": 0, "fixed": [], "unknown": []}
+    for solution in response.ordem_servico:
+        for equipment in solution.equipamentos_necessarios:
+            if equipment.sap_code in sap_index:
+                report["valid"] += 1
+                continue
+            item = sap_index.resolve(equipment.sap_code, equipment.nome)
+            if item is not None:
+                report["fixed"].append({"from": equipment.sap_code, "to": item.sap_code, "nome": equipment.nome})
+                equipment.sap_code = item.sap_code
+                equipment.nome = item.description
+            else:
+                report["unknown"].append({"sap_code": equipment.sap_code, "nome": equipment.nome})
+                solution.observacoes.append(
+                    f"Código SAP {equipment.sap_code} ({equipment.nome}) não encontrado no catálogo; verificar."
+                )
+    return report
+
+
+def get_sap_code_index(path: str) -> SapCodeIndex:
+    """SAP code index of a catalog file, rebuilt only when the file changes."""
+    return get_catalog(path).sap_codes
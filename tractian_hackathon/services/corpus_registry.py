@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from models import DEFAULT_CORPUS
+from services.single_flight import SingleFlight
+from services.file_locks import async_file_lock, file_lock, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Named document sets, one per plant or asset class: {"name": {"pdf_paths": [...], "csv_path": "..."}}
+CORPORA_FILE = os.getenv("CORPORA_FILE", "corpora.json")
+# Memory allowed to the resident corpora before the least recently used ones are evicted
+CORPUS_MEMORY_BUDGET = int(float(os.getenv("CORPUS_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024)
+
+
+class UnknownCorpus(Exception):
+    """Raised when a request names a corpus that is not defined."""
+    pass
+
+
+class CorpusRegistry:
+    """
+    Definitions of the named corpora, read from ``CORPORA_FILE``.
+
+    The ``default`` corpus is always defined, from the file or from the
+    built-in document lists. The file is re-read when it changes, so a corpus
+    version published by any worker process is picked up by all of them;
+    publications are serialized across processes with a lock file.
+    """
+
+    def __init__(self, default: dict, filename: str = CORPORA_FILE):
+        self.default = default
+        self.filename = filename
+        self.definitions: Dict[str, dict] = {}
+        self._mtime: Optional[tuple] = None
+        self._refresh()
+        logger.info(f"{len(self.definitions)} corpora defined")
+
+    def _file_mtime(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        # Every publication renames a new file into place, so the inode changes even within one mtime tick
+        return stat.st_mtime_ns, stat.st_ino
+
+    def _refresh(self, force: bool = False):
+        mtime = self._file_mtime()
+        if self.definitions and mtime == self._mtime and not force:
+            return
+        self._mtime = mtime
+        definitions = {DEFAULT_CORPUS: self.default}
+        if mtime is not None:
+            try:
+                with open(self.filename, "r", encoding="utf-8") as f:
+                    definitions.update(json.load(f))
+            except Exception as e:
+                logger.error(f"Error loading corpora from {self.filename}: {str(e)}")
+        self.definitions = definitions
+
+    def names(self) -> List[str]:
+        self._refresh()
+        return sorted(self.definitions)
+
+    def get(self, name: str) -> dict:
+        self._refresh()
+        definition = self.definitions.get(name or DEFAULT_CORPUS)
+        if definition is None:
+            raise UnknownCorpus(f"Unknown corpus: {name}")
+        return definition
+
+    def lock(self, name: str):
+        """
+        Async context manager held while a corpus definition is read, updated
+        and published, so concurrent updates of a corpus in any process apply
+        one after the other.
+        """
+        digest = hashlib.sha256(name.encode()).hexdigest()[:16]
+        return async_file_lock(f"{self.filename}.{digest}.lock")
+
+    def publish(self, name: str, definition: dict):
+        """
+        Points a corpus at a new document set. The file is replaced atomically;
+        requests that already resolved the previous set finish with it.
+        """
+        with file_lock(f"{self.filename}.lock"):
+            self._refresh(force=True)
+            definitions = dict(self.definitions, **{name: definition})
+            write_json_atomic(self.filename, definitions)
+            self.definitions = definitions
+            self._mtime = self._file_mtime()
+        logger.info(f"Published corpus {name}: {len(definition['pdf_paths'])} manuals, catalog {definition['csv_path']}")
+
+
+class ResidentCorpora:
+    """
+    Memory-budgeted LRU of loaded corpora.
+
+    A miss loads the corpus (concurrent misses for the same key share one load)
+    and then evicts least recently used corpora until the resident size is back
+    under ``memory_budget``; the corpus just loaded is never evicted. Values
+    must expose ``resident_bytes``.
+    """
+
+    def __init__(self, memory_budget: int = CORPUS_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.load_seconds: Dict[Hashable, float] = {}
+        self.flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_load_seconds = 0.0
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(corpus.resident_bytes for corpus in self.entries.values())
+
+    async def get(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        corpus = self.entries.get(key)
+        if corpus is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return corpus
+        self.misses += 1
+        return await self.flights.do(key, lambda: self._load(key, load))
+
+    async def _load(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        start = time.perf_counter()
+        corpus = await load()
+        elapsed = time.perf_counter() - start
+        self.total_load_seconds += elapsed
+        self.load_seconds[key] = elapsed
+        self.entries[key] = corpus
+        logger.info(f"Loaded corpus {corpus.version} in {elapsed:.2f}s ({corpus.resident_bytes / 2**20:.1f} MiB)")
+        self._evict(keep=key)
+        return corpus
+
+    def _evict(self, keep: Hashable):
+        while self.resident_bytes > self.memory_budget and len(self.entries) > 1:
+            oldest = next(iter(self.entries))
+            if oldest == keep:
+                break
+            corpus = self.entries.pop(oldest)
+            self.load_seconds.pop(oldest, None)
+            self.evictions += 1
+            logger.info(f"Evicted corpus {corpus.version} ({corpus.resident_bytes / 2**20:.1f} MiB)")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "resident": [
+                {
+                    "version": corpus.version,
+                    "resident_bytes": corpus.resident_bytes,
+                    "load_seconds": self.load_seconds.get(key),
+                }
+                for key, corpus in self.entries.items()
+            ],
+            "resident_bytes": self.resident_bytes,
+            "memory_budget": self.memory_budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "total_load_seconds": self.total_load_seconds,
+        }
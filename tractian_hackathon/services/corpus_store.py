@@ -0,0 +1,277 @@
+import os
+import json
+import errno
+import shutil
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from typing import Collection, Dict, List, Optional, Tuple
+from services.file_locks import file_lock, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.getenv("CORPUS_INDEX_DIR", "index")
+# Fraction of tombstoned rows above which an entry is rewritten without them
+COMPACTION_THRESHOLD = float(os.getenv("CORPUS_COMPACTION_THRESHOLD", "0.3"))
+
+# (path, size, mtime_ns) -> sha256, so unchanged files are not re-read on every request
+_hash_memo: Dict[Tuple[str, int, int], str] = {}
+
+
+def file_sha256(path: str) -> str:
+    """Returns the SHA-256 of a file's content, memoized on its size and mtime."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    cached = _hash_memo.get(key)
+    if cached is not None:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    _hash_memo[key] = digest.hexdigest()
+    return _hash_memo[key]
+
+
+class DocumentIndex:
+    """
+    Extracted pages, chunks and embeddings of a single source document.
+
+    Rows of ``chunks`` and ``embeddings`` are aligned. Rows of pages that changed
+    in a later revision are kept in place with ``"deleted": True`` (tombstones)
+    until the entry is compacted.
+    """
+
+    def __init__(
+        self,
+        content_hash: str,
+        meta: dict,
+        pages: List[str],
+        chunks: List[dict],
+        embeddings: np.ndarray
+    ):
+        self.content_hash = content_hash
+        self.meta = meta
+        self.pages = pages
+        self.chunks = chunks
+        self.embeddings = embeddings
+
+    @property
+    def live_mask(self) -> np.ndarray:
+        return np.array([not chunk.get("deleted") for chunk in self.chunks], dtype=bool)
+
+    @property
+    def dead_fraction(self) -> float:
+        if not self.chunks:
+            return 0.0
+        return sum(1 for chunk in self.chunks if chunk.get("deleted")) / len(self.chunks)
+
+    @property
+    def page_hashes(self) -> List[str]:
+        return self.meta.get("page_hashes", [])
+
+    @property
+    def live_chunks(self) -> List[dict]:
+        return [chunk for chunk in self.chunks if not chunk.get("deleted")]
+
+    @property
+    def chunk_texts(self) -> List[str]:
+        """Text of the live chunks."""
+        return [chunk["text"] for chunk in self.live_chunks]
+
+    @property
+    def live_embeddings(self) -> np.ndarray:
+        """Embedding rows of the live chunks."""
+        if not self.chunks:
+            return self.embeddings
+        mask = self.live_mask
+        return self.embeddings if mask.all() else self.embeddings[mask]
+
+    @property
+    def text(self) -> str:
+        return "".join(self.pages)
+
+
+class CorpusStore:
+    """
+    On-disk store of processed documents, keyed by the SHA-256 of the file content.
+
+    Each entry is a directory holding:
+        meta.json       build parameters (source, chunk size, embedding model, ...)
+                        and the hash of every page
+        pages.json      extracted text of every page
+        chunks.json     chunk text, its page and token boundaries within the page
+        embeddings.npy  float32 matrix, one row per chunk, loaded memory-mapped
+
+    ``sources.json`` maps each source path to the hash of its latest entry, so a
+    revised file can be re-indexed incrementally from its previous version.
+    """
+
+    def __init__(self, root: str = INDEX_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self.sources_path = os.path.join(self.root, "sources.json")
+
+    def entry_dir(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash)
+
+    def _read_meta(self, content_hash: str) -> Optional[dict]:
+        meta_path = os.path.join(self.entry_dir(content_hash), "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable index entry {content_hash}: {str(e)}")
+            return None
+
+    def has(self, content_hash: str, build_params: dict) -> bool:
+        """True when an entry exists and was built with the same parameters."""
+        meta = self._read_meta(content_hash)
+        if meta is None:
+            return False
+        return all(meta.get(key) == value for key, value in build_params.items())
+
+    def _read_sources(self) -> Dict[str, str]:
+        if not os.path.exists(self.sources_path):
+            return {}
+        try:
+            with open(self.sources_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable sources file: {str(e)}")
+            return {}
+
+    def find_source(self, source: str, build_params: dict) -> Optional[DocumentIndex]:
+        """Returns the latest entry indexed from ``source`` with the same build parameters."""
+        content_hash = self._read_sources().get(source)
+        if content_hash is None or not self.has(content_hash, build_params):
+            return None
+        return self.load(content_hash)
+
+    def publish_source(
+        self,
+        source: str,
+        content_hash: str,
+        replaces: Optional[str] = None,
+        in_use: Collection[str] = ()
+    ) -> None:
+        """
+        Points ``source`` at a new entry and removes the entry it superseded.
+        ``replaces`` names an earlier source of the same document, stored under
+        another path, that is dropped along with its entry unless it is one of
+        the ``in_use`` sources (files of the registered corpora).
+        """
+        # Worker processes indexing other documents update the same file
+        with file_lock(f"{self.sources_path}.lock"):
+            sources = self._read_sources()
+            superseded = [sources.get(source)]
+            if replaces and replaces != source and replaces not in in_use:
+                superseded.append(sources.pop(replaces, None))
+            sources[source] = content_hash
+            write_json_atomic(self.sources_path, sources)
+
+        for previous in superseded:
+            if previous and previous != content_hash and previous not in sources.values():
+                # Readers that already mapped the old files keep them until they drop them
+                shutil.rmtree(self.entry_dir(previous), ignore_errors=True)
+
+    def save(
+        self,
+        content_hash: str,
+        meta: dict,
+        pages: List[str],
+        chunks: List[dict],
+        embeddings: np.ndarray
+    ) -> None:
+        """Writes an entry to a temporary directory and swaps it in atomically."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        meta = dict(meta, num_chunks=len(chunks), dim=int(embeddings.shape[1]) if embeddings.ndim == 2 else 0)
+
+        tmp_dir = tempfile.mkdtemp(prefix=f".{content_hash}-", dir=self.root)
+        try:
+            with open(os.path.join(tmp_dir, "pages.json"), "w", encoding="utf-8") as f:
+                json.dump(pages, f, ensure_ascii=False)
+            with open(os.path.join(tmp_dir, "chunks.json"), "w", encoding="utf-8") as f:
+                json.dump(chunks, f, ensure_ascii=False)
+            np.save(os.path.join(tmp_dir, "embeddings.npy"), embeddings)
+            # meta.json is written last: an entry without it is never considered complete
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=4)
+
+            if self._read_meta(content_hash) == meta:
+                # Another process already published the same build
+                shutil.rmtree(tmp_dir)
+                return
+            self._swap_in(tmp_dir, self.entry_dir(content_hash))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def _swap_in(self, tmp_dir: str, target: str) -> None:
+        """
+        Renames a finished entry into place. An older entry (other build
+        parameters, or rows since compacted) is first moved aside, so readers
+        never see a half-removed directory; when another process publishes the
+        entry in between, its copy is kept and ours is discarded.
+        """
+        try:
+            os.rename(tmp_dir, target)
+            return
+        except OSError as e:
+            if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                raise
+        stale = tempfile.mkdtemp(prefix=f".{os.path.basename(target)}-stale-", dir=self.root)
+        try:
+            os.rename(target, stale)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rename(tmp_dir, target)
+        except OSError as e:
+            if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                raise
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        # Readers that already mapped the old files keep them until they drop them
+        shutil.rmtree(stale, ignore_errors=True)
+
+    def load(self, content_hash: str) -> DocumentIndex:
+        """Loads an entry; the embedding matrix is memory-mapped read-only."""
+        entry = self.entry_dir(content_hash)
+        meta = self._read_meta(content_hash)
+        if meta is None:
+            raise FileNotFoundError(f"No index entry for {content_hash}")
+
+        with open(os.path.join(entry, "pages.json"), "r", encoding="utf-8") as f:
+            pages = json.load(f)
+        with open(os.path.join(entry, "chunks.json"), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        # numpy cannot memory-map an empty array, so entries without chunks are read eagerly
+        embeddings = np.load(
+            os.path.join(entry, "embeddings.npy"),
+            mmap_mode="r" if meta.get("num_chunks") else None
+        )
+
+        return DocumentIndex(content_hash, meta, pages, chunks, embeddings)
+
+    def compact(self, content_hash: str) -> DocumentIndex:
+        """Rewrites an entry without its tombstoned rows."""
+        doc = self.load(content_hash)
+        mask = doc.live_mask
+        if mask.all():
+            return doc
+
+        chunks = [chunk for chunk in doc.chunks if not chunk.get("deleted")]
+        embeddings = np.array(doc.embeddings[mask], dtype=np.float32)
+        logger.info(f"Compacting {content_hash}: dropping {len(doc.chunks) - len(chunks)} tombstoned rows")
+        self.save(content_hash, doc.meta, doc.pages, chunks, embeddings)
+        return self.load(content_hash)
+
+    def compact_if_needed(self, content_hash: str) -> DocumentIndex:
+        doc = self.load(content_hash)
+        if doc.dead_fraction > COMPACTION_THRESHOLD:
+            return self.compact(content_hash)
+        return doc
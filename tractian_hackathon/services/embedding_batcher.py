@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import logging
+from typing import List, Optional
+from services.ingestion import get_encoding
+
+logger = logging.getLogger(__name__)
+
+# Provider limits for a single embeddings request
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "2048"))
+# Batches of one embedding job sent at the same time
+EMBEDDING_BATCH_CONCURRENCY = int(os.getenv("EMBEDDING_BATCH_CONCURRENCY", "4"))
+# Rounds in which only the batches that failed are sent again
+EMBEDDING_BATCH_ATTEMPTS = int(os.getenv("EMBEDDING_BATCH_ATTEMPTS", "3"))
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    return [len(tokens) for tokens in get_encoding().encode_ordinary_batch(texts)]
+
+
+def pack_batches(
+    token_counts: List[int],
+    max_tokens: int = EMBEDDING_BATCH_TOKENS,
+    max_inputs: int = EMBEDDING_BATCH_MAX_INPUTS
+) -> List[range]:
+    """
+    Groups consecutive inputs into batches that stay under the token and input
+    limits of one request. An input larger than ``max_tokens`` gets a batch of its own.
+    """
+    batches = []
+    start, batch_tokens = 0, 0
+    for i, tokens in enumerate(token_counts):
+        if i > start and (batch_tokens + tokens > max_tokens or i - start >= max_inputs):
+            batches.append(range(start, i))
+            start, batch_tokens = i, 0
+        batch_tokens += tokens
+    if start < len(token_counts):
+        batches.append(range(start, len(token_counts)))
+    return batches
+
+
+class EmbeddingBatcher:
+    """
+    Embeds a list of texts in token-budgeted batches sent concurrently.
+
+    A batch that still fails after the client's own retries is sent again in a
+    later round; batches that succeeded are never re-sent.
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        max_tokens: int = EMBEDDING_BATCH_TOKENS,
+        max_inputs: int = EMBEDDING_BATCH_MAX_INPUTS,
+        concurrency: int = EMBEDDING_BATCH_CONCURRENCY,
+        attempts: int = EMBEDDING_BATCH_ATTEMPTS
+    ):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_inputs = max_inputs
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.last_stats: dict = {}
+        self.jobs = 0
+        self.total_texts = 0
+        self.total_batches = 0
+        self.total_tokens = 0
+        self.total_seconds = 0.0
+
+    async def _embed_batch(self, texts: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        async with semaphore:
+            response = await self.client.create_embeddings(input=texts, model=self.model)
+        return [data.embedding for data in sorted(response.data, key=lambda data: data.index)]
+
+    async def embed(self, texts: List[str], token_counts: Optional[List[int]] = None) -> List[List[float]]:
+        if not texts:
+            return []
+        if token_counts is None:
+            token_counts = count_tokens(texts)
+
+        start_time = time.perf_counter()
+        batches = pack_batches(token_counts, self.max_tokens, self.max_inputs)
+        results: List[Optional[List[List[float]]]] = [None] * len(batches)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        pending = list(range(len(batches)))
+        for attempt in range(1, self.attempts + 1):
+            outcomes = await asyncio.gather(
+                *(self._embed_batch([texts[i] for i in batches[b]], semaphore) for b in pending),
+                return_exceptions=True
+            )
+            failed = []
+            for b, outcome in zip(pending, outcomes):
+                if isinstance(outcome, BaseException):
+                    logger.warning(f"Embedding batch {b} failed on attempt {attempt}: {str(outcome)}")
+                    failed.append((b, outcome))
+                else:
+                    results[b] = outcome
+            if not failed:
+                break
+            if attempt == self.attempts:
+                raise failed[0][1]
+            pending = [b for b, _ in failed]
+
+        elapsed = time.perf_counter() - start_time
+        total_tokens = sum(token_counts)
+        self.last_stats = {
+            "texts": len(texts),
+            "batches": len(batches),
+            "tokens": total_tokens,
+            "seconds": elapsed,
+            "tokens_per_second": total_tokens / elapsed if elapsed > 0 else 0.0,
+        }
+        self.jobs += 1
+        self.total_texts += len(texts)
+        self.total_batches += len(batches)
+        self.total_tokens += total_tokens
+        self.total_seconds += elapsed
+        logger.info(
+            f"Embedded {len(texts)} texts ({total_tokens} tokens) in {len(batches)} batches, "
+            f"{elapsed:.2f}s, {self.last_stats['tokens_per_second']:.0f} tokens/s"
+        )
+        return [embedding for batch in results for embedding in batch]
+
+    def stats(self) -> dict:
+        return {
+            "jobs": self.jobs,
+            "texts": self.total_texts,
+            "batches": self.total_batches,
+            "tokens": self.total_tokens,
+            "seconds": self.total_seconds,
+            "tokens_per_second": self.total_tokens / self.total_seconds if self.total_seconds > 0 else 0.0,
+            "last": self.last_stats,
+        }
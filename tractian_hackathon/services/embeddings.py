@@ -0,0 +1,141 @@
+import os
+import asyncio
+import logging
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from services.embedding_batcher import EmbeddingBatcher
+from services.catalog_service import normalize_token_text
+
+logger = logging.getLogger(__name__)
+
+# "openai" calls the embeddings API; "hashing" embeds locally, without network access
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBEDDING_MODEL = "text-embedding-ada-002"
+HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "1024"))
+HASHING_NGRAM_SIZES = (3, 4, 5)
+
+
+class EmbeddingBackend(ABC):
+    """
+    Turns texts into embedding rows.
+
+    ``name`` identifies the embedding space: it is part of the index build
+    parameters and of the corpus version, so vectors of different backends are
+    never compared with each other.
+    """
+
+    name: str = ""
+
+    @abstractmethod
+    async def embed(self, texts: List[str], token_counts: Optional[List[int]] = None) -> np.ndarray:
+        """Embeds the texts of a document or batch as a float32 matrix, one row per text."""
+
+    async def embed_query(self, text: str) -> np.ndarray:
+        """Embeds a single query."""
+        return (await self.embed([text]))[0]
+
+    async def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Embeds a batch of queries; unlike ``embed``, they do not count as document throughput."""
+        return await self.embed(texts)
+
+    def stats(self) -> dict:
+        """Throughput counters of the document embeddings, when the backend keeps any."""
+        return {}
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """OpenAI embeddings API, with token-budgeted concurrent batches for documents."""
+
+    def __init__(self, client, model: str = EMBEDDING_MODEL):
+        self.client = client
+        self.model = model
+        self.name = model
+        self.batcher = EmbeddingBatcher(client, model)
+        # Queries of batch requests are counted apart from the documents
+        self.query_batcher = EmbeddingBatcher(client, model)
+
+    @staticmethod
+    def _matrix(embeddings: List[List[float]]) -> np.ndarray:
+        if not embeddings:
+            # A revision that only removes pages has nothing to embed
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.array(embeddings, dtype=np.float32)
+
+    async def embed(self, texts: List[str], token_counts: Optional[List[int]] = None) -> np.ndarray:
+        return self._matrix(await self.batcher.embed(texts, token_counts))
+
+    async def embed_queries(self, texts: List[str]) -> np.ndarray:
+        return self._matrix(await self.query_batcher.embed(texts))
+
+    async def embed_query(self, text: str) -> np.ndarray:
+        response = await self.client.create_embeddings(input=text, model=self.model)
+        return np.array(response.data[0].embedding, dtype=np.float32)
+
+    def stats(self) -> dict:
+        return dict(self.batcher.stats(), queries=self.query_batcher.stats())
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    Offline embeddings: character 3- to 5-grams of the accent-stripped,
+    lowercased text are hashed into ``dim`` signed buckets, with sublinear
+    counts and unit-norm rows.
+
+    There is no vocabulary to fit, so documents and queries embedded at
+    different times always share the same space. Semantic recall is lower
+    than the API model's; lexical overlap is what it captures.
+    """
+
+    def __init__(self, dim: int = HASHING_EMBEDDING_DIM, ngram_sizes=HASHING_NGRAM_SIZES):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+        self.name = f"hashing-char{min(ngram_sizes)}-{max(ngram_sizes)}-{dim}"
+
+    def embed_text(self, text: str) -> np.ndarray:
+        text = " ".join(normalize_token_text(text).split())
+        codes = np.frombuffer(f" {text} ".encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        # Polynomial rolling hash of every n-gram, computed for all positions at once
+        ngram_hash = np.zeros(len(codes), dtype=np.uint64)
+        for n in range(1, max(self.ngram_sizes) + 1):
+            if n > len(codes):
+                break
+            ngram_hash = (ngram_hash[:len(codes) - n + 1] * np.uint64(1000003) + codes[n - 1:]) & np.uint64(0xFFFFFFFF)
+            if n in self.ngram_sizes:
+                mixed = (ngram_hash * np.uint64(2654435761)) & np.uint64(0xFFFFFFFF)
+                buckets = (mixed % np.uint64(self.dim)).astype(np.int64)
+                signs = np.where(mixed & np.uint64(1 << 31), -1.0, 1.0)
+                vector += np.bincount(buckets, weights=signs, minlength=self.dim).astype(np.float32)
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            matrix[i] = self.embed_text(text)
+        return matrix
+
+    async def embed(self, texts: List[str], token_counts: Optional[List[int]] = None) -> np.ndarray:
+        return await asyncio.to_thread(self.embed_sync, texts)
+
+    async def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_text(text)
+
+
+_backends: Dict[str, EmbeddingBackend] = {}
+
+
+def get_embedding_backend(client, backend: str = EMBEDDING_BACKEND) -> EmbeddingBackend:
+    """The configured embedding backend; the OpenAI one embeds through ``client``."""
+    if backend == "openai":
+        # One instance per client, so the batcher's counters accumulate across documents
+        if backend not in _backends or _backends[backend].client is not client:
+            _backends[backend] = OpenAIEmbeddingBackend(client)
+        return _backends[backend]
+    if backend == "hashing":
+        if backend not in _backends:
+            _backends[backend] = HashingEmbeddingBackend()
+        return _backends[backend]
+    raise ValueError(f"Unknown embedding backend: {backend}")
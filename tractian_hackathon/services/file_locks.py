@@ -0,0 +1,41 @@
+import os
+import json
+import fcntl
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager, contextmanager
+
+
+@contextmanager
+def file_lock(path: str):
+    """Holds an exclusive flock on ``path``, which serializes worker processes as well as threads."""
+    with open(path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+@asynccontextmanager
+async def async_file_lock(path: str):
+    """file_lock for coroutines: the lock is waited for in a worker thread, not on the event loop."""
+    with open(path, "w") as lock:
+        await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def write_json_atomic(path: str, data, indent: int = 4) -> None:
+    """Writes JSON to a temporary file of its own next to ``path`` and renames it into place."""
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}-", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,234 @@
+import os
+import re
+import asyncio
+import hashlib
+import logging
+import tiktoken
+import PyPDF2
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from services.catalog_service import get_catalog
+from services.language import detect_language
+from services.near_duplicates import minhash
+
+logger = logging.getLogger(__name__)
+
+CHUNK_MAX_TOKENS = 500
+# Tokens of whole trailing blocks repeated at the start of the next chunk of a page
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+# Number of worker processes for CPU-bound ingestion; 0 runs the stages in a thread instead
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", str(os.cpu_count() or 1)))
+# Pages handed to a worker per task when extracting a PDF
+PAGES_PER_TASK = int(os.getenv("INGESTION_PAGES_PER_TASK", "16"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_encoding = None
+
+# Paragraphs are separated by lines holding only whitespace
+_BLANK_LINE = re.compile(r"\n[ \t]*\n")
+# Numbered items ("12.5.3.1 "), annex/chapter titles and all-caps lines
+_HEADING = re.compile(
+    r"^[ \t]*(?:\d+(?:\.\d+)+\.?[ \t]|(?:ANEXO|CAP[IÍ]TULO|SEÇÃO|SECTION|CHAPTER|SECCIÓN)\b|[A-ZÀ-Ý0-9][A-ZÀ-Ý0-9 ,\-–]{5,}[ \t]*$)",
+    re.MULTILINE
+)
+# Places where an over-long paragraph can be cut, tried in order
+_SPLITTERS = [re.compile(r"(?<=[.;:!?])\s+"), re.compile(r"\s+")]
+
+def extract_pages_from_pdf(pdf_path: str, page_numbers: Optional[List[int]] = None) -> List[str]:
+    """Extracts the text of the given pages (all pages by default) of a PDF file."""
+    with open(pdf_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        if page_numbers is None:
+            page_numbers = range(len(reader.pages))
+        return [reader.pages[page_num].extract_text() for page_num in page_numbers]
+
+def count_pdf_pages(pdf_path: str) -> int:
+    with open(pdf_path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+def hash_pdf_pages(pdf_path: str) -> List[str]:
+    """Hashes the raw content stream of every page, without extracting its text."""
+    hashes = []
+    with open(pdf_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        for page in reader.pages:
+            contents = page.get_contents()
+            digest = hashlib.sha256(contents.get_data() if contents is not None else b"")
+            digest.update(str(page.mediabox).encode())
+            hashes.append(digest.hexdigest())
+    return hashes
+
+def extract_text_from_pdf(pdf_path: str) -> str:
+    """Extracts text from a PDF file."""
+    # A single join instead of repeated concatenation, which copies the text once per page
+    return "".join(extract_pages_from_pdf(pdf_path))
+
+def process_csv_data(csv_path: str) -> str:
+    """Processes CSV data into a structured text format preserving all information."""
+    return get_catalog(csv_path).text
+
+class ApproximateEncoding:
+    """
+    Stand-in for cl100k_base when its file cannot be loaded (no network and no
+    ``TIKTOKEN_CACHE_DIR``): words count one token per 4 characters, every
+    other non-space run one per character. Only token counts are used by
+    chunking and batching, and these stay close to the real ones.
+    """
+
+    # Recorded with the chunking parameters, so chunks cut with approximate counts are rebuilt with real ones
+    name = "approximate"
+    _PIECE = re.compile(r"\w+|[^\w\s]")
+
+    def encode_ordinary(self, text: str) -> List[int]:
+        count = sum(-(-len(piece) // 4) for piece in self._PIECE.findall(text))
+        return [0] * count
+
+    def encode_ordinary_batch(self, texts: List[str]) -> List[List[int]]:
+        return [self.encode_ordinary(text) for text in texts]
+
+
+def get_encoding():
+    """The cl100k_base encoder, loaded once per process; approximated when it cannot be loaded."""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"Could not load the cl100k_base encoding ({str(e)}), approximating token counts")
+            _encoding = ApproximateEncoding()
+    return _encoding
+
+def split_blocks(text: str) -> List[Tuple[int, int]]:
+    """Character spans of the paragraphs of a page; a heading line always starts a new block."""
+    cuts = {0, len(text)}
+    cuts.update(match.end() for match in _BLANK_LINE.finditer(text))
+    cuts.update(match.start() for match in _HEADING.finditer(text))
+    cuts = sorted(cuts)
+    return [(start, end) for start, end in zip(cuts, cuts[1:]) if text[start:end].strip()]
+
+def _split_long_span(text: str, start: int, end: int, max_tokens: int, level: int = 0) -> List[Tuple[int, int, int]]:
+    """Cuts a span above ``max_tokens`` at sentence ends, then at whitespace, into (start, end, tokens) parts."""
+    if level == len(_SPLITTERS):
+        # A single "word" longer than the limit is kept whole
+        return [(start, end, len(get_encoding().encode_ordinary(text[start:end])))]
+    cuts = sorted({start, end, *(match.end() for match in _SPLITTERS[level].finditer(text, start, end))})
+    spans = list(zip(cuts, cuts[1:]))
+    counts = [len(tokens) for tokens in get_encoding().encode_ordinary_batch([text[a:b] for a, b in spans])]
+    parts = []
+    for (a, b), count in zip(spans, counts):
+        if count > max_tokens:
+            parts.extend(_split_long_span(text, a, b, max_tokens, level + 1))
+        else:
+            parts.append((a, b, count))
+    return parts
+
+def split_text_with_boundaries(
+    text: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+) -> List[dict]:
+    """
+    Splits text into chunks of at most ``max_tokens`` tokens along paragraph and
+    heading boundaries, cutting inside a paragraph only when it is too long.
+
+    Consecutive chunks share up to ``overlap_tokens`` tokens of whole trailing
+    blocks. Each chunk keeps its [start, end) character offsets in ``text`` and
+    its token count (the sum of the counts of its blocks).
+    """
+    spans = split_blocks(text)
+    counts = [len(tokens) for tokens in get_encoding().encode_ordinary_batch([text[a:b] for a, b in spans])]
+    pieces = []
+    for (start, end), count in zip(spans, counts):
+        if count > max_tokens:
+            pieces.extend(_split_long_span(text, start, end, max_tokens))
+        else:
+            pieces.append((start, end, count))
+
+    chunks = []
+    current: List[Tuple[int, int, int]] = []
+    current_tokens = 0
+    for piece in pieces:
+        if current and current_tokens + piece[2] > max_tokens:
+            chunks.append(_make_chunk(text, current, current_tokens))
+            carried, carried_tokens = [], 0
+            for previous in reversed(current):
+                if carried_tokens + previous[2] > min(overlap_tokens, max_tokens - piece[2]):
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous[2]
+            current, current_tokens = carried, carried_tokens
+        current.append(piece)
+        current_tokens += piece[2]
+    if current:
+        chunks.append(_make_chunk(text, current, current_tokens))
+    return chunks
+
+def _make_chunk(text: str, pieces: List[Tuple[int, int, int]], tokens: int) -> dict:
+    start, end = pieces[0][0], pieces[-1][1]
+    return {"text": text[start:end], "start": start, "end": end, "tokens": tokens}
+
+def split_text(text: str, max_tokens: int = CHUNK_MAX_TOKENS) -> List[str]:
+    """Splits text into chunks of a specified maximum number of tokens."""
+    return [chunk["text"] for chunk in split_text_with_boundaries(text, max_tokens)]
+
+def chunk_pages(
+    pages: Dict[int, str],
+    page_hashes: List[str],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+) -> List[dict]:
+    """Chunks pages independently so that each chunk belongs to exactly one page."""
+    chunks = []
+    for page_num, page_text in pages.items():
+        for chunk in split_text_with_boundaries(page_text, max_tokens=max_tokens, overlap_tokens=overlap_tokens):
+            chunk["page"] = page_num
+            chunk["page_hash"] = page_hashes[page_num]
+            chunk["language"] = detect_language(chunk["text"])
+            chunk["minhash"] = minhash(chunk["text"])
+            chunks.append(chunk)
+    return chunks
+
+def get_ingestion_pool() -> Optional[ProcessPoolExecutor]:
+    """Returns the shared process pool, creating it on first use."""
+    global _pool
+    if _pool is None and INGESTION_WORKERS > 0:
+        logger.info(f"Starting ingestion pool with {INGESTION_WORKERS} workers")
+        _pool = ProcessPoolExecutor(max_workers=INGESTION_WORKERS)
+    return _pool
+
+def shutdown_ingestion_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+async def run_in_pool(fn: Callable, *args):
+    """Runs a CPU-bound function off the event loop, in the process pool when enabled."""
+    pool = get_ingestion_pool()
+    if pool is None:
+        return await asyncio.to_thread(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+def _batches(items: List, size: int) -> List[List]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+async def extract_pages_parallel(pdf_path: str, page_numbers: Optional[List[int]] = None) -> List[str]:
+    """Extracts PDF pages across the worker processes, preserving page order."""
+    if page_numbers is None:
+        page_numbers = list(range(await run_in_pool(count_pdf_pages, pdf_path)))
+    batches = _batches(list(page_numbers), PAGES_PER_TASK)
+    results = await asyncio.gather(*(run_in_pool(extract_pages_from_pdf, pdf_path, batch) for batch in batches))
+    return [text for batch in results for text in batch]
+
+async def chunk_pages_parallel(
+    pages: Dict[int, str],
+    page_hashes: List[str],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+) -> List[dict]:
+    """Tokenizes and chunks pages in the worker processes, preserving page order."""
+    batches = _batches(list(pages.items()), PAGES_PER_TASK)
+    results = await asyncio.gather(*(
+        run_in_pool(chunk_pages, dict(batch), page_hashes, max_tokens, overlap_tokens) for batch in batches
+    ))
+    return [chunk for batch in results for chunk in batch]
@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+# Seconds a worker process holds a job without renewing it before another process may take it over
+JOB_LEASE = float(os.getenv("JOB_LEASE", "60"))
+# Seconds finished jobs stay in memory; with MongoDB they remain readable there until JOB_RETENTION
+JOB_MEMORY_TTL = float(os.getenv("JOB_MEMORY_TTL", "3600"))
+JOBS_FILE = os.getenv("JOBS_FILE", "jobs.json")
+JOBS_COLLECTION = "jobs"
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+    pass
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue with a fixed pool of worker tasks.
+
+    Job state is persisted in MongoDB, or in a local JSON file when the database
+    is unavailable at start. Writes go through a single writer task, off the
+    event loop, so a stage change never waits on storage.
+
+    Each job is leased by the process that owns it and the lease is renewed
+    while the process is alive. Jobs left queued or running with an expired
+    lease (their process died) are claimed atomically by one process and
+    re-queued when ``can_resume`` accepts them, or marked failed otherwise.
+    The file backend serves a single process, which owns every job in it.
+
+    ``on_finished`` is called once a job succeeded or failed, including jobs
+    that could not be resumed, to release what its payload refers to.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict, Callable[[str], None]], Awaitable[dict]],
+        can_resume: Callable[[dict], bool] = lambda job: True,
+        on_finished: Callable[[dict], None] = lambda job: None,
+        workers: int = JOB_WORKERS,
+        max_size: int = JOB_QUEUE_MAX,
+        filename: str = JOBS_FILE
+    ):
+        self.handler = handler
+        self.can_resume = can_resume
+        self.on_finished = on_finished
+        self.workers = workers
+        self.max_size = max_size
+        self.filename = filename
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, dict] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self.collection = None
+        self._pending: Dict[str, dict] = {}
+        self._dirty: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _get_collection(self):
+        from app import db_connection
+        db = db_connection.get_db()
+        if db is None:
+            return None
+        collection = db[JOBS_COLLECTION]
+        collection.create_index("id", unique=True)
+        return collection
+
+    def _load_file(self) -> List[dict]:
+        try:
+            if os.path.exists(self.filename):
+                with open(self.filename, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading jobs: {str(e)}")
+        return []
+
+    def _write(self, pending: Dict[str, dict], snapshot: Optional[List[dict]]):
+        """Runs in a worker thread: stores the pending job records."""
+        if self.collection is None:
+            try:
+                tmp_path = f"{self.filename}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f, ensure_ascii=False, indent=4)
+                os.replace(tmp_path, self.filename)
+            except Exception as e:
+                logger.error(f"Error saving jobs: {str(e)}")
+            return
+        for job_id, job in pending.items():
+            try:
+                # Only the lease owner may write a job; a process that lost its lease gets a duplicate key
+                self.collection.replace_one({"id": job_id, "owner": self.owner}, job, upsert=True)
+            except DuplicateKeyError:
+                logger.warning(f"Job {job_id} was taken over by another worker, dropping its update")
+            except Exception as e:
+                logger.error(f"Error saving job {job_id}: {str(e)}")
+
+    def _persist(self, job: dict):
+        self._pending[job["id"]] = dict(job)
+        self._dirty.set()
+
+    async def _flush(self):
+        pending, self._pending = self._pending, {}
+        self._dirty.clear()
+        snapshot = [dict(job) for job in self.jobs.values()] if self.collection is None else None
+        await asyncio.to_thread(self._write, pending, snapshot)
+
+    async def _writer(self):
+        while True:
+            await self._dirty.wait()
+            await self._flush()
+
+    def _update(self, job: dict, **fields):
+        job.update(fields, updated_at=time.time())
+        self._persist(job)
+        if job["status"] in (SUCCEEDED, FAILED):
+            try:
+                self.on_finished(job)
+            except Exception as e:
+                logger.error(f"Error cleaning up job {job['id']}: {str(e)}")
+
+    def _claim_expired(self, limit: int) -> List[dict]:
+        """Runs in a worker thread: takes over up to ``limit`` unfinished jobs whose lease expired."""
+        claimed = []
+        now = time.time()
+        while len(claimed) < limit:
+            job = self.collection.find_one_and_update(
+                {
+                    "status": {"$in": [QUEUED, RUNNING]},
+                    "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}],
+                },
+                {"$set": {"owner": self.owner, "lease_until": now + JOB_LEASE}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                break
+            claimed.append(job)
+        return claimed
+
+    def _resume(self, jobs: List[dict]):
+        resumed = 0
+        for job in jobs:
+            job.update(owner=self.owner, lease_until=time.time() + JOB_LEASE)
+            self.jobs[job["id"]] = job
+            if self.can_resume(job) and self.queue.qsize() < self.max_size:
+                self._update(job, status=QUEUED, stage="queued")
+                self.queue.put_nowait(job["id"])
+                resumed += 1
+            else:
+                self._update(job, status=FAILED, stage="failed", error="Interrupted by a server restart")
+        if resumed:
+            logger.info(f"Resumed {resumed} jobs from a stopped worker")
+
+    async def _claim(self):
+        if self.collection is None:
+            return
+        try:
+            claimed = await asyncio.to_thread(self._claim_expired, self.max_size - self.queue.qsize())
+        except Exception as e:
+            logger.error(f"Error claiming jobs: {str(e)}")
+            return
+        self._resume(claimed)
+
+    async def _heartbeat(self):
+        """Renews the leases of this process, takes over abandoned jobs and evicts finished ones from memory."""
+        while True:
+            await asyncio.sleep(JOB_LEASE / 3)
+            now = time.time()
+            for job_id, job in list(self.jobs.items()):
+                if job["status"] in (QUEUED, RUNNING):
+                    job["lease_until"] = now + JOB_LEASE
+                elif now - job["updated_at"] > JOB_MEMORY_TTL:
+                    del self.jobs[job_id]
+            if self.collection is None:
+                continue
+            try:
+                await asyncio.to_thread(
+                    self.collection.update_many,
+                    {"owner": self.owner, "status": {"$in": [QUEUED, RUNNING]}},
+                    {"$set": {"lease_until": now + JOB_LEASE}}
+                )
+            except Exception as e:
+                logger.error(f"Error renewing job leases: {str(e)}")
+            await self._claim()
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self._dirty = asyncio.Event()
+        # The backend is chosen once: a missing database must not stall every write
+        self.collection = await asyncio.to_thread(self._get_collection)
+        now = time.time()
+        if self.collection is None:
+            jobs = self._load_file()
+            unfinished = []
+            for job in jobs:
+                if job["status"] in (QUEUED, RUNNING):
+                    unfinished.append(job)
+                elif now - job.get("updated_at", now) <= min(JOB_RETENTION, JOB_MEMORY_TTL):
+                    self.jobs[job["id"]] = job
+            self._resume(unfinished)
+        else:
+            await asyncio.to_thread(
+                self.collection.delete_many,
+                {"status": {"$in": [SUCCEEDED, FAILED]}, "updated_at": {"$lt": now - JOB_RETENTION}}
+            )
+            await self._claim()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks += [asyncio.create_task(self._writer()), asyncio.create_task(self._heartbeat())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Jobs still queued or running are released, so the next start() of any worker picks them up
+        for job in self.jobs.values():
+            if job["status"] in (QUEUED, RUNNING):
+                job["lease_until"] = 0
+                self._persist(job)
+        await self._flush()
+
+    def submit(self, kind: str, payload: dict) -> dict:
+        """Queues a job and returns its record; raises JobQueueFull at capacity."""
+        if self.queue is None or self.queue.full():
+            raise JobQueueFull("Job queue is full")
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "payload": payload,
+            "status": QUEUED,
+            "stage": "queued",
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "owner": self.owner,
+            "lease_until": now + JOB_LEASE,
+        }
+        self.jobs[job["id"]] = job
+        self._persist(job)
+        self.queue.put_nowait(job["id"])
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        if job is None and self.collection is not None:
+            # Jobs of other worker processes, and finished jobs evicted from memory
+            job = await asyncio.to_thread(self.collection.find_one, {"id": job_id}, {"_id": 0})
+        return job
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job is not None:
+                    await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: dict):
+        self._update(job, status=RUNNING, stage="running")
+        try:
+            result = await self.handler(job, lambda stage: self._update(job, stage=stage))
+            self._update(job, status=SUCCEEDED, stage="done", result=result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}")
+            self._update(job, status=FAILED, stage="failed", error=str(e))
@@ -0,0 +1,70 @@
+import os
+import re
+from typing import Dict, Iterable, List, Set
+from services.catalog_service import normalize_token_text
+
+# Languages whose chunks are embedded and indexed; documents with no chunk in
+# any of them (such as an English-only brochure) are indexed in full
+INDEX_LANGUAGES = [language for language in os.getenv("INDEX_LANGUAGES", "pt").split(",") if language]
+# Language assumed for requests too short to be detected
+DEFAULT_LANGUAGE = os.getenv("DEFAULT_LANGUAGE", "pt")
+UNDETERMINED = "und"
+
+# Function words and endings that tell the manual's languages apart (accents
+# stripped); words shared by Portuguese and Spanish ("que", "para", "no") are left out
+_PROFILES: Dict[str, Set[str]] = {
+    "pt": {
+        "os", "da", "do", "das", "dos", "em", "na", "nas", "nos", "um", "uma", "com", "nao", "pelo",
+        "pela", "ao", "aos", "sao", "deve", "devem", "ou", "seu", "sua", "quando", "tambem", "mais",
+        "isso", "estas", "estes", "pode", "podem", "sobre", "sem",
+    },
+    "en": {
+        "the", "of", "and", "to", "in", "is", "are", "be", "for", "with", "on", "by", "or", "this", "that",
+        "it", "as", "from", "must", "should", "not", "at", "an", "which", "when", "can", "if", "all",
+    },
+    "es": {
+        "el", "los", "las", "del", "y", "en", "un", "una", "con", "por", "es", "son", "debe", "deben",
+        "su", "sus", "cuando", "tambien", "mas", "al", "lo", "puede", "pueden", "sobre", "sin",
+    },
+}
+_SUFFIXES: Dict[str, tuple] = {
+    "pt": ("cao", "coes", "gem", "dade"),
+    "es": ("cion", "ciones", "dad"),
+}
+_WORD = re.compile(r"[a-z]+")
+
+
+def detect_language(text: str, min_hits: int = 3) -> str:
+    """
+    Guesses the language of a text from its function words.
+
+    Returns the code of the profile with most hits, or ``UNDETERMINED`` when
+    no profile has at least ``min_hits`` (tables, part numbers, short texts).
+    """
+    hits = dict.fromkeys(_PROFILES, 0)
+    for word in _WORD.findall(normalize_token_text(text)):
+        for language, words in _PROFILES.items():
+            if word in words:
+                hits[language] += 1
+        for language, suffixes in _SUFFIXES.items():
+            if word.endswith(suffixes):
+                hits[language] += 1
+    best = max(hits, key=hits.get)
+    return best if hits[best] >= min_hits else UNDETERMINED
+
+
+def request_language(text: str) -> str:
+    """Language of a user request, falling back to ``DEFAULT_LANGUAGE``."""
+    language = detect_language(text, min_hits=2)
+    return DEFAULT_LANGUAGE if language == UNDETERMINED else language
+
+
+def language_keep_mask(chunk_languages: List[str], languages: Iterable[str]) -> List[bool]:
+    """
+    Chunks of one document to keep: those in ``languages`` or undetermined.
+    A document without any chunk in ``languages`` is kept whole.
+    """
+    languages = set(languages)
+    if not languages or not languages.intersection(chunk_languages):
+        return [True] * len(chunk_languages)
+    return [language in languages or language == UNDETERMINED for language in chunk_languages]
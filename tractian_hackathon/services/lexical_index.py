@@ -0,0 +1,143 @@
+import os
+import re
+import bisect
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from services.catalog_service import normalize_token_text, tokenize
+from services.vector_index import Mask, top_k_from_scores
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Constant of reciprocal rank fusion: higher values flatten the weight of the top ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Dotted or dashed identifiers such as NR-12 items ("12.38.1"), frame sizes ("225s/m") or codes
+_COMPOUND_TOKEN = re.compile(r"\w+(?:[.\-/]\w+)+")
+
+
+def technical_tokens(text: str) -> List[str]:
+    """Word tokens plus whole compound identifiers, so '12.38' matches exactly as well as by parts."""
+    return tokenize(text) + _COMPOUND_TOKEN.findall(normalize_token_text(text))
+
+
+class SortedVocabulary:
+    """
+    Read-only term -> id lookup by binary search over sorted terms, so the
+    vocabulary can live in a memory-mapped text blob instead of a dict.
+    """
+
+    def __init__(self, terms: Sequence[str], term_ids: np.ndarray):
+        self.terms = terms
+        self.term_ids = term_ids
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def get(self, token: str) -> Optional[int]:
+        position = bisect.bisect_left(self.terms, token)
+        if position < len(self.terms) and self.terms[position] == token:
+            return int(self.term_ids[position])
+        return None
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed list of texts, with postings stored CSR-style.
+
+    ``doc_ids[offsets[t]:offsets[t + 1]]`` are the texts containing term ``t``
+    and ``term_freqs`` holds the matching frequencies, so a query only touches
+    the postings of its own terms.
+    """
+
+    def __init__(self, texts: Sequence[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.vocabulary: Union[Dict[str, int], SortedVocabulary] = {}
+        term_ids, doc_ids = [], []
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            tokens = technical_tokens(text)
+            lengths[doc_id] = len(tokens)
+            term_ids.extend(self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens)
+            doc_ids.extend([doc_id] * len(tokens))
+
+        # One (term, doc) pair per occurrence, collapsed into frequencies and sorted by term
+        pairs = np.array(term_ids, dtype=np.int64) * max(len(texts), 1) + np.array(doc_ids, dtype=np.int64)
+        pairs, counts = np.unique(pairs, return_counts=True)
+        terms = pairs // max(len(texts), 1)
+        self.doc_ids = (pairs % max(len(texts), 1)).astype(np.int32)
+        self.term_freqs = counts.astype(np.float32)
+        self.offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self.vocabulary)), out=self.offsets[1:])
+
+        n = len(texts)
+        doc_freqs = np.diff(self.offsets).astype(np.float32)
+        self.idf = np.log(1.0 + (n - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        average_length = float(lengths.mean()) if n else 0.0
+        # Per-text part of the BM25 denominator
+        self.length_norm = (k1 * (1.0 - b + b * lengths / max(average_length, 1.0))).astype(np.float32)
+        self.k1 = k1
+        self.n = n
+
+    @classmethod
+    def from_arrays(
+        cls,
+        vocabulary: SortedVocabulary,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        offsets: np.ndarray,
+        idf: np.ndarray,
+        length_norm: np.ndarray,
+        k1: float = BM25_K1
+    ) -> "BM25Index":
+        """Restores an index from its arrays, such as the memory-mapped ones of a shared index."""
+        index = cls([], k1)
+        index.vocabulary = vocabulary
+        index.doc_ids, index.term_freqs, index.offsets = doc_ids, term_freqs, offsets
+        index.idf, index.length_norm = idf, length_norm
+        index.n = len(length_norm)
+        return index
+
+    def sorted_vocabulary(self) -> Tuple[List[str], np.ndarray]:
+        """Terms in sorted order and their ids, as stored by SortedVocabulary."""
+        terms = sorted(self.vocabulary)
+        return terms, np.array([self.vocabulary.get(term) for term in terms], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.n, dtype=np.float32)
+        for token in set(technical_tokens(query)):
+            term = self.vocabulary.get(token)
+            if term is None:
+                continue
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs, tf = self.doc_ids[start:end], self.term_freqs[start:end]
+            scores[docs] += self.idf[term] * tf * (self.k1 + 1.0) / (tf + self.length_norm[docs])
+        return scores
+
+    def search(self, query: str, top_k: int = 10, mask: Mask = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and BM25 scores of the best texts that share at least one term with the query."""
+        scores = self.scores(query)
+        if mask is not None:
+            allowed = np.zeros(self.n, dtype=bool)
+            allowed[mask] = True
+            scores[~allowed] = 0.0
+        best = top_k_from_scores(scores, min(top_k, int(np.count_nonzero(scores))))
+        return best, scores[best]
+
+
+def reciprocal_rank_fusion(
+    rankings: List[np.ndarray],
+    top_k: int = 10,
+    k: int = RRF_K
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merges rankings (best first) by summing 1 / (k + rank) over the rankings
+    each item appears in; returns the best items and their fused scores.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, index in enumerate(ranking):
+            fused[int(index)] = fused.get(int(index), 0.0) + 1.0 / (k + rank + 1)
+    best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return np.array(best, dtype=np.int64), np.array([fused[index] for index in best], dtype=np.float32)
@@ -1,158 +1,438 @@
+import os
+import re
 import json
 import asyncio
+import hashlib
+import logging
 import numpy as np
-import tiktoken
-import PyPDF2
-import pandas as pd
-from typing import List, Dict, Union
-from openai import OpenAI
-from models import SafetyResponse
-
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extracts text from a PDF file."""
-    text = ""
-    with open(pdf_path, "rb") as f:
-        reader = PyPDF2.PdfReader(f)
-        for page_num in range(len(reader.pages)):
-            page = reader.pages[page_num]
-            text += page.extract_text()
-    return text
-
-def process_csv_data(csv_path: str) -> str:
-    """Processes CSV data into a structured text format preserving all information."""
-    df = pd.read_csv(csv_path, sep=';')
-    
-    # Start with a header for the equipment catalog
-    text_chunks = ["CATÁLOGO DE EQUIPAMENTOS E MATERIAIS\n"]
-    
-    # Initialize variables
-    current_category = None
-    
-    # Process each row
-    for _, row in df.iterrows():
-        # If there's a category, add it
-        if pd.notna(row['Categoria']):
-            current_category = row['Categoria']
-            text_chunks.append(f"\nCATEGORIA: {current_category}")
-            
-        # Add all item information, including any empty fields
-        description = row['Descrição do Material/Equipamento'] if pd.notna(row['Descrição do Material/Equipamento']) else ""
-        code = row['Código SAP'] if pd.notna(row['Código SAP']) else ""
-        
-        # Format the item entry
-        if description or code:  # Add entry if there's either a description or code
-            entry = []
-            if description:
-                entry.append(f"Descrição: {description}")
-            if code:
-                entry.append(f"Código SAP: {code}")
-            if current_category:
-                entry.append(f"Categoria: {current_category}")
-                
-            text_chunks.append(" | ".join(entry))
-    
-    # Add a footer to separate the catalog from other content
-    text_chunks.append("\nFIM DO CATÁLOGO DE EQUIPAMENTOS E MATERIAIS\n")
-    
-    # Join all chunks with newlines
-    return "\n".join(text_chunks)
-
-def split_text(text: str, max_tokens: int = 500) -> List[str]:
-    """Splits text into chunks of a specified maximum number of tokens."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    tokens = encoding.encode(text)
-    chunks = []
-    start = 0
-    while start < len(tokens):
-        end = start + max_tokens
-        chunk_tokens = tokens[start:end]
-        chunk_text = encoding.decode(chunk_tokens)
-        chunks.append(chunk_text)
-        start = end
-    return chunks
-
-async def get_embeddings(texts: List[str], client: OpenAI) -> List[List[float]]:
-    """Generates embeddings for a list of texts."""
-    embeddings = []
-    batch_size = 1000
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
-        response = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: client.embeddings.create(
-                input=batch,
-                model="text-embedding-ada-002"
+from typing import AsyncIterator, Collection, List, Dict, Tuple, Union, Optional
+from models import SafetyResponse, SafetySolution, SafetyStep
+from services.openai_client import AsyncOpenAIService
+from services.embeddings import get_embedding_backend
+from services.single_flight import SingleFlight
+from services.model_cascade import generation_cascade
+from services.metrics import span, timed
+from services.corpus_registry import ResidentCorpora
+from services.stream_parser import ServiceOrderStreamParser
+from services.response_cache import RESPONSE_CACHE_ENABLED, response_cache
+from services.catalog_service import (
+    CatalogIndex,
+    get_sap_code_index,
+    load_catalog,
+    normalize_token_text,
+    validate_sap_codes,
+)
+from services.corpus_store import CorpusStore, DocumentIndex, file_sha256
+from services.shared_index import SharedIndex, publish_once, shared_index_path, write_shared_index
+from services.vector_index import (
+    VECTOR_INDEX_PRECISION,
+    IVFIndex,
+    QuantizedMatrix,
+    VectorIndex,
+    maximal_marginal_relevance,
+)
+from services.lexical_index import BM25Index, SortedVocabulary, reciprocal_rank_fusion
+from services.near_duplicates import NEAR_DUPLICATE_THRESHOLD, near_duplicate_mask
+from services.language import INDEX_LANGUAGES, UNDETERMINED, language_keep_mask, request_language
+from services.ingestion import (
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    chunk_pages_parallel,
+    extract_pages_parallel,
+    get_encoding,
+    hash_pdf_pages,
+    run_in_pool,
+)
+
+logger = logging.getLogger(__name__)
+
+# Manual chunks retrieved per problem
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+# Candidates taken from each of the dense and BM25 rankings before fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "50"))
+# Weight of relevance against novelty when re-ranking the fused chunks; 1 disables re-ranking
+MMR_RELEVANCE_WEIGHT = float(os.getenv("MMR_RELEVANCE_WEIGHT", "0.7"))
+# Fused chunks considered by the re-ranking, as a multiple of the chunks returned
+MMR_CANDIDATE_FACTOR = int(os.getenv("MMR_CANDIDATE_FACTOR", "3"))
+# Generations in flight at once for a batch of problems
+BATCH_GENERATION_CONCURRENCY = int(os.getenv("BATCH_GENERATION_CONCURRENCY", "8"))
+
+async def get_embeddings(
+    texts: List[str],
+    client: AsyncOpenAIService,
+    token_counts: Optional[List[int]] = None
+) -> np.ndarray:
+    """Generates embeddings for a list of texts with the configured embedding backend."""
+    return await get_embedding_backend(client).embed(texts, token_counts)
+
+def catalog_embeddings(catalog_doc: DocumentIndex, csv_path: str) -> np.ndarray:
+    """Aligns the stored row embeddings of the catalog with its parsed items."""
+    items = load_catalog(csv_path)
+    live_chunks = [chunk for chunk in catalog_doc.chunks if not chunk.get("deleted")]
+    embeddings = catalog_doc.live_embeddings
+    rows = np.zeros((len(items), embeddings.shape[1] if embeddings.ndim == 2 else 0), dtype=np.float32)
+    for row, chunk in zip(embeddings, live_chunks):
+        # Every catalog row is a single "page" and fits in a single chunk
+        if chunk["start"] == 0:
+            rows[chunk["page"]] = row
+    return rows
+
+def shared_index_name(key: tuple, embedding_model: str) -> str:
+    """Name of the shared index of a set of files under the current chunking and index settings."""
+    params = {
+        "files": list(key),
+        "chunker": "blocks",
+        "max_tokens": CHUNK_MAX_TOKENS,
+        "overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        "tokenizer": get_encoding().name,
+        "languages": sorted(INDEX_LANGUAGES),
+        "near_duplicate_threshold": NEAR_DUPLICATE_THRESHOLD,
+        "embedding_model": embedding_model,
+        "precision": VECTOR_INDEX_PRECISION,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
+
+@timed("build_shared_index")
+def write_corpus_index(path: str, catalog_doc: DocumentIndex, pdf_docs: List[DocumentIndex], csv_path: str) -> None:
+    """Builds the retrieval structures of a corpus and publishes them as a shared index at ``path``."""
+    live_chunks = [doc.live_chunks for doc in pdf_docs]
+    chunks = [chunk["text"] for doc_chunks in live_chunks for chunk in doc_chunks]
+    labels = [
+        f"{os.path.basename(doc.meta.get('source', ''))}, página {chunk['page'] + 1}"
+        for doc, doc_chunks in zip(pdf_docs, live_chunks) for chunk in doc_chunks
+    ]
+    languages = [chunk.get("language", UNDETERMINED) for doc_chunks in live_chunks for chunk in doc_chunks]
+    # Rows are quantized document by document
+    embeddings = [doc.live_embeddings for doc in pdf_docs if doc.chunk_texts]
+    index = VectorIndex.for_corpus(embeddings)
+    lexical = BM25Index(chunks)
+    terms, term_ids = lexical.sorted_vocabulary()
+
+    arrays = {
+        "vectors": index.matrix.data,
+        "chunk_languages": np.array(languages, dtype="U8"),
+        "catalog_embeddings": catalog_embeddings(catalog_doc, csv_path),
+        "bm25_doc_ids": lexical.doc_ids,
+        "bm25_term_freqs": lexical.term_freqs,
+        "bm25_offsets": lexical.offsets,
+        "bm25_idf": lexical.idf,
+        "bm25_length_norm": lexical.length_norm,
+        "bm25_term_ids": term_ids,
+    }
+    if index.matrix.scales is not None:
+        arrays["scales"] = index.matrix.scales
+        # Original float32 rows, read only to re-rank the best quantized candidates
+        arrays["embeddings"] = np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+    if index.ivf is not None:
+        arrays.update(ivf_centroids=index.ivf.centroids, ivf_order=index.ivf.order, ivf_offsets=index.ivf.offsets)
+
+    # Content hashes alone would let cached responses match queries embedded by another backend
+    version = "-".join(doc.content_hash[:12] for doc in [catalog_doc] + pdf_docs)
+    version += f"@{catalog_doc.meta.get('embedding_model', '')}"
+    meta = {
+        "version": version,
+        "precision": index.matrix.precision,
+        "ivf": index.ivf is not None,
+        "bm25_k1": lexical.k1,
+        "doc_languages": [sorted({chunk.get("language", UNDETERMINED) for chunk in doc_chunks}) for doc_chunks in live_chunks],
+        "doc_sizes": [len(doc_chunks) for doc_chunks in live_chunks],
+        "sources": [doc.meta.get("source", "") for doc in [catalog_doc] + pdf_docs],
+    }
+    write_shared_index(path, arrays, {"chunks": chunks, "chunk_labels": labels, "bm25_terms": terms}, meta)
+
+class Corpus:
+    """
+    Retrieval view of the indexed documents over their shared index.
+
+    Chunk texts, vectors and postings stay memory-mapped, so every worker
+    process serving the corpus shares the same pages.
+    """
+
+    def __init__(self, shared: SharedIndex, csv_path: str):
+        self.shared = shared
+        meta = shared.meta
+        self.catalog = CatalogIndex(load_catalog(csv_path), shared.array("catalog_embeddings"))
+        self.sap_codes = get_sap_code_index(csv_path)
+        self.chunks = shared.texts("chunks")
+        # Source document and 1-based page of each chunk, shown to the model for "referencias"
+        self.chunk_labels = shared.texts("chunk_labels")
+        # Chunks searched for each request language: the chunks in that language,
+        # undetermined ones and every chunk of documents lacking that language
+        self.chunk_languages = shared.array("chunk_languages")
+        self.doc_languages = [set(languages) for languages in meta["doc_languages"]]
+        self.doc_sizes = meta["doc_sizes"]
+        self._language_masks: Dict[str, np.ndarray] = {}
+        matrix = QuantizedMatrix.from_codes(
+            shared.array("vectors"),
+            shared.array("scales") if meta["precision"] == "int8" else None,
+            meta["precision"]
+        )
+        # The re-rank rows stay memory-mapped: only the few candidates of each query are ever read
+        self.index = VectorIndex(matrix, source=shared.array("embeddings") if meta["precision"] == "int8" else None)
+        if meta["ivf"]:
+            self.index.ivf = IVFIndex.from_arrays(
+                matrix, shared.array("ivf_centroids"), shared.array("ivf_order"), shared.array("ivf_offsets")
             )
+        self.lexical = BM25Index.from_arrays(
+            SortedVocabulary(shared.texts("bm25_terms"), shared.array("bm25_term_ids")),
+            shared.array("bm25_doc_ids"),
+            shared.array("bm25_term_freqs"),
+            shared.array("bm25_offsets"),
+            shared.array("bm25_idf"),
+            shared.array("bm25_length_norm"),
+            k1=meta["bm25_k1"]
         )
-        embeddings.extend([data.embedding for data in response.data])
-    return embeddings
+        self.version = meta["version"]
+
+    def language_mask(self, language: str) -> np.ndarray:
+        if language not in self._language_masks:
+            whole_docs = np.repeat([language not in languages for languages in self.doc_languages], self.doc_sizes)
+            self._language_masks[language] = (
+                (self.chunk_languages == language) | (self.chunk_languages == UNDETERMINED) | whole_docs.astype(bool)
+            )
+        return self._language_masks[language]
+
+    @property
+    def resident_bytes(self) -> int:
+        """
+        Mapped index files, whose pages are shared between workers, plus the
+        private catalog vectors. The float32 re-rank rows are left out: a query
+        only pages in the rows of its candidates.
+        """
+        mapped = self.shared.nbytes - self.shared.file_sizes.get("embeddings.npy", 0)
+        return mapped + self.catalog.vectors.matrix.nbytes
+
+_corpus_store: Optional[CorpusStore] = None
+# Loaded corpora, keyed by the hashes of their files and evicted least recently used first
+resident_corpora = ResidentCorpora()
+
+def get_corpus_store() -> CorpusStore:
+    global _corpus_store
+    if _corpus_store is None:
+        _corpus_store = CorpusStore()
+    return _corpus_store
+
+def _embedding_matrix(embeddings) -> np.ndarray:
+    if len(embeddings) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.array(embeddings, dtype=np.float32)
+
+def select_chunks_to_index(new_chunks: List[dict], indexed_chunks: List[dict]) -> List[dict]:
+    """
+    Drops new PDF chunks that are not worth embedding: translations of
+    multilingual manuals and near-duplicates of a chunk of the same document
+    (repeated clauses, tables split across windows).
+    """
+    # Translations of multilingual manuals are neither embedded nor searched
+    languages = [chunk["language"] for chunk in indexed_chunks + new_chunks]
+    keep = language_keep_mask(languages, INDEX_LANGUAGES)[len(indexed_chunks):]
+    skipped = keep.count(False)
+    new_chunks = [chunk for chunk, kept in zip(new_chunks, keep) if kept]
+    if skipped:
+        logger.info(f"Skipped {skipped} chunks not in {INDEX_LANGUAGES}")
+
+    signatures = [chunk.get("minhash") for chunk in indexed_chunks + new_chunks]
+    duplicates = near_duplicate_mask(signatures, known=len(indexed_chunks))[len(indexed_chunks):]
+    if any(duplicates):
+        logger.info(f"Skipped {sum(duplicates)} near-duplicate chunks")
+    return [chunk for chunk, duplicate in zip(new_chunks, duplicates) if not duplicate]
+
+def reuse_pages(old_hashes: List[str], new_hashes: List[str]) -> Dict[int, int]:
+    """
+    Maps each page of a new revision to the page of the previous one it can
+    reuse. Repeated hashes (identical pages, duplicate catalog rows) are paired
+    in order, so every copy keeps rows of its own; copies beyond those of the
+    previous revision are processed as new pages.
+    """
+    old_pages: Dict[str, List[int]] = {}
+    for old_num, page_hash in enumerate(old_hashes):
+        old_pages.setdefault(page_hash, []).append(old_num)
+    reused_from: Dict[int, int] = {}
+    for num, page_hash in enumerate(new_hashes):
+        candidates = old_pages.get(page_hash)
+        if candidates:
+            reused_from[num] = candidates.pop(0)
+    return reused_from
+
+async def index_document(
+    path: str,
+    kind: str,
+    client: AsyncOpenAIService,
+    store: CorpusStore,
+    incremental: bool = True,
+    replaces: Optional[str] = None,
+    in_use: Collection[str] = ()
+) -> DocumentIndex:
+    """
+    Loads a document from the store, extracting and embedding it only on a miss.
 
-def vector_search(query_embedding: List[float], embeddings: List[List[float]], top_k: int = 5) -> List[int]:
+    When an earlier revision of the same file is in the store and ``incremental``
+    is set, only pages whose hash changed are extracted, chunked and embedded.
+    Rows of untouched pages are reused in place and rows of removed or changed
+    pages are tombstoned; the entry is compacted once too many rows are dead.
+    The earlier revision is the one indexed from ``path``, or from ``replaces``
+    when the new revision is stored under another path (uploads); ``replaces``
+    keeps its store entry while it is one of the ``in_use`` files.
+    """
+    content_hash = file_sha256(path)
+    build_params = {
+        "kind": kind,
+        "chunker": "blocks",
+        "max_tokens": CHUNK_MAX_TOKENS,
+        "overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        "tokenizer": get_encoding().name,
+        "embedding_model": get_embedding_backend(client).name,
+    }
+    if kind == "pdf":
+        build_params["languages"] = sorted(INDEX_LANGUAGES)
+        build_params["near_duplicate_threshold"] = NEAR_DUPLICATE_THRESHOLD
+    if store.has(content_hash, build_params):
+        return store.load(content_hash)
+
+    with span("hash_pages"):
+        if kind == "catalog":
+            # Every equipment row is a "page", so a catalog edit only re-embeds the rows that changed
+            row_texts = [item.to_text() for item in await run_in_pool(load_catalog, path)]
+            page_hashes = [hashlib.sha256(text.encode()).hexdigest() for text in row_texts]
+        else:
+            page_hashes = await run_in_pool(hash_pdf_pages, path)
+    previous = store.find_source(replaces or path, build_params) if incremental else None
+
+    reused_from = reuse_pages(previous.page_hashes if previous is not None else [], page_hashes)
+    changed = [num for num in range(len(page_hashes)) if num not in reused_from]
+
+    logger.info(f"Indexing {path}: {len(changed)} of {len(page_hashes)} pages to process...")
+    # Extraction and tokenization are CPU-bound and run in the ingestion pool
+    if kind == "catalog":
+        extracted = [row_texts[num] for num in changed]
+    else:
+        with span("extract_pages"):
+            extracted = await extract_pages_parallel(path, changed)
+    with span("chunk_pages"):
+        new_chunks = await chunk_pages_parallel(dict(zip(changed, extracted)), page_hashes)
+    if kind == "pdf":
+        indexed_chunks = []
+        if previous is not None:
+            kept_pages = set(reused_from.values())
+            indexed_chunks = [chunk for chunk in previous.live_chunks if chunk["page"] in kept_pages]
+        new_chunks = select_chunks_to_index(new_chunks, indexed_chunks)
+
+    logger.info("Creating embeddings for chunks...")
+    with span("embed_chunks"):
+        new_embeddings = _embedding_matrix(await get_embeddings(
+            [chunk["text"] for chunk in new_chunks],
+            client,
+            token_counts=[chunk["tokens"] for chunk in new_chunks]
+        ))
+
+    pages = [""] * len(page_hashes)
+    for num, text in zip(changed, extracted):
+        pages[num] = text
+
+    if previous is None:
+        chunks, embeddings = new_chunks, new_embeddings
+    else:
+        new_page_nums: Dict[int, int] = {}
+        for num, old_num in reused_from.items():
+            pages[num] = previous.pages[old_num]
+            new_page_nums[old_num] = num
+
+        chunks = []
+        for chunk in previous.chunks:
+            chunk = dict(chunk)
+            if not chunk.get("deleted"):
+                if chunk["page"] in new_page_nums:
+                    # Pages can move when others are inserted or removed
+                    chunk["page"] = new_page_nums[chunk["page"]]
+                else:
+                    chunk["deleted"] = True
+            chunks.append(chunk)
+        chunks.extend(new_chunks)
+
+        blocks = [block for block in (previous.embeddings, new_embeddings) if len(block)]
+        embeddings = np.concatenate(blocks) if blocks else new_embeddings
+
+    meta = dict(build_params, source=path, page_hashes=page_hashes)
+    with span("save_index_entry"):
+        store.save(content_hash, meta, pages, chunks, embeddings)
+    store.publish_source(path, content_hash, replaces=replaces, in_use=in_use)
+    return store.compact_if_needed(content_hash)
+
+@timed("load_corpus")
+async def load_corpus(pdf_paths: List[str], csv_path: str, client: AsyncOpenAIService) -> Corpus:
+    """
+    Returns the corpus for the given files, mapping its shared index.
+
+    A missing shared index is built once across all worker processes from the
+    store entries, which are themselves only extracted and embedded on a miss.
+    Changed files hash to a new index directory, so workers switch to the new
+    version on their next request while in-flight ones finish on the old one.
+    """
+    key = tuple(file_sha256(path) for path in [csv_path] + list(pdf_paths))
+    path = shared_index_path(shared_index_name(key, get_embedding_backend(client).name))
+
+    async def build_index():
+        store = get_corpus_store()
+        catalog_doc = await index_document(csv_path, "catalog", client, store)
+        pdf_docs = list(await asyncio.gather(
+            *(index_document(path, "pdf", client, store) for path in pdf_paths)
+        ))
+        await asyncio.to_thread(write_corpus_index, path, catalog_doc, pdf_docs, csv_path)
+
+    async def load() -> Corpus:
+        return Corpus(await publish_once(path, build_index), csv_path)
+
+    # Superseded file versions are no longer requested and age out of the LRU
+    return await resident_corpora.get(key, load)
+
+def vector_search(
+    query_embedding: List[float],
+    embeddings: Union[VectorIndex, List[List[float]]],
+    top_k: int = 5,
+    mask: Optional[np.ndarray] = None
+) -> List[int]:
     """Performs a vector search to find the most similar embeddings."""
-    embeddings = np.array(embeddings)
-    query_embedding = np.array(query_embedding)
-    similarities = np.dot(embeddings, query_embedding)
-    top_k_indices = similarities.argsort()[-top_k:][::-1]
+    index = embeddings if isinstance(embeddings, VectorIndex) else VectorIndex(np.asarray(embeddings), precision="float32")
+    top_k_indices, _ = index.search(np.asarray(query_embedding), top_k=top_k, mask=mask)
     return top_k_indices
 
-async def process_documents_with_assistant(
-    pdf_paths: List[str],
-    csv_path: str,
+@timed("retrieve")
+def retrieve_chunks(
+    corpus: Corpus,
     problema: str,
-    client: OpenAI
-) -> SafetyResponse:
-    """Process multiple PDFs and CSV data to generate response using OpenAI."""
-    
-    # Process CSV data first to ensure it's always included in the context
-    csv_text = process_csv_data(csv_path)
-    
-    # Process all PDFs
-    pdf_texts = []
-    for pdf_path in pdf_paths:
-        pdf_text = extract_text_from_pdf(pdf_path)
-        pdf_texts.append(pdf_text)
-    
-    # Split CSV text into chunks while preserving its structure
-    csv_chunks = split_text(csv_text, max_tokens=500)
-    
-    # Split PDF texts into chunks
-    pdf_chunks = []
-    for pdf_text in pdf_texts:
-        chunks = split_text(pdf_text, max_tokens=500)
-        pdf_chunks.extend(chunks)
-    
-    # Combine all chunks, ensuring CSV chunks are at the beginning
-    all_chunks = csv_chunks + pdf_chunks
-    
-    print("Creating embeddings for chunks...")
-    chunk_embeddings = await get_embeddings(all_chunks, client)
-
-    query_embedding_response = await asyncio.get_event_loop().run_in_executor(
-        None,
-        lambda: client.embeddings.create(
-            input=problema,
-            model="text-embedding-ada-002"
+    query_embedding,
+    top_k: int = RETRIEVAL_TOP_K,
+    dense_indices: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Hybrid retrieval: the dense and BM25 rankings of the chunks are merged with
+    reciprocal rank fusion, so exact technical tokens (NR-12 items, frame sizes,
+    SAP codes) are found even when the embeddings miss them.
+
+    Only chunks in the language of the problem are searched (see
+    ``Corpus.language_mask``); precomputed ``dense_indices`` are filtered the same way.
+    The fused list is re-ranked with maximal marginal relevance over the chunk
+    embeddings, so overlapping chunks do not fill the prompt with the same text.
+    """
+    mask = corpus.language_mask(request_language(problema)) if len(corpus.chunks) else None
+    if dense_indices is None:
+        with span("dense_search"):
+            dense_indices = vector_search(query_embedding, corpus.index, top_k=RETRIEVAL_CANDIDATES, mask=mask)
+    elif mask is not None:
+        dense_indices = np.asarray(dense_indices)[mask[dense_indices]]
+    with span("lexical_search"):
+        lexical_indices, _ = corpus.lexical.search(problema, top_k=RETRIEVAL_CANDIDATES, mask=mask)
+    with span("rank_fusion"):
+        fused, fused_scores = reciprocal_rank_fusion(
+            [dense_indices, lexical_indices], top_k=top_k * MMR_CANDIDATE_FACTOR
         )
-    )
-    query_embedding = query_embedding_response.data[0].embedding
-
-    # Always include at least one chunk of CSV data in the context
-    top_k_indices = vector_search(query_embedding, chunk_embeddings, top_k=10)
-    
-    # Ensure at least one CSV chunk is included
-    has_csv_chunk = any(i < len(csv_chunks) for i in top_k_indices)
-    if not has_csv_chunk:
-        # Replace the last chunk with the most relevant CSV chunk
-        csv_similarities = np.dot(np.array(chunk_embeddings[:len(csv_chunks)]), query_embedding)
-        best_csv_index = csv_similarities.argmax()
-        top_k_indices = list(top_k_indices[:-1]) + [best_csv_index]
-    
-    relevant_chunks = [all_chunks[i] for i in top_k_indices]
-    
-    # Always include the full equipment catalog at the end of the context
-    context = "\n\n".join(relevant_chunks) + "\n\nCATÁLOGO COMPLETO DE EQUIPAMENTOS:\n" + csv_text
-
-    instructions = """
+        if MMR_RELEVANCE_WEIGHT >= 1.0 or len(fused) <= top_k:
+            return fused[:top_k]
+        return maximal_marginal_relevance(
+            corpus.index.matrix, fused, fused_scores / fused_scores[0], top_k, MMR_RELEVANCE_WEIGHT
+        )
+
+INSTRUCTIONS = """
 Você é um especialista em análise de normas técnicas e segurança.
 Use o conteúdo dos documentos fornecidos para responder problemas específicos.
 Os códigos SAP e equipamentos mencionados devem corresponder *EXATAMENTE* aos listados no catálogo fornecido.
@@ -208,24 +488,244 @@ Suas respostas devem ser em português e estruturadas no seguinte formato JSON:
 }
 Mantenha suas respostas técnicas e precisas, fundamentadas no conteúdo do documento.
 Certifique-se de usar apenas equipamentos e códigos SAP que existam no catálogo fornecido.
+Cada trecho do contexto começa com o documento e a página de origem entre colchetes; cite-os em "referencias".
 Todos os equipamentos mencionados DEVEM ter seus códigos SAP correspondentes do catálogo. 
 Para a prioridade, se atente ao nível de gravidade e urgência no problema especificado,
 caso não tenha essas informações, compare as atividades existentes para classificar as
 mais urgentes.
 """
-    prompt = f"{instructions}\n\nContexto:\n{context}\n\nProblema: {problema}\nResposta:"
-
-    print("Generating assistant's response...")
-    response = await asyncio.get_event_loop().run_in_executor(
-        None,
-        lambda: client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1500,
-            response_format=SafetyResponse,
-        )
+
+# Identical generations in flight at the same time share a single model call
+generation_flights = SingleFlight()
+
+def normalize_problem(problema: str) -> str:
+    """Case-, accent-, punctuation- and whitespace-insensitive form of a problem."""
+    return " ".join(re.findall(r"\w+", normalize_token_text(problema)))
+
+async def process_documents_with_assistant(
+    pdf_paths: List[str],
+    csv_path: str,
+    problema: str,
+    client: AsyncOpenAIService,
+    use_cache: bool = True
+) -> SafetyResponse:
+    """
+    Process multiple PDFs and CSV data to generate response using OpenAI.
+
+    With ``use_cache``, a response generated earlier for a near-identical problem
+    against the same corpus version is returned without calling the model.
+    Concurrent calls for the same normalized problem and document versions are
+    coalesced into one generation; each caller gets its own copy of the result.
+    """
+    corpus_key = tuple(file_sha256(path) for path in [csv_path] + list(pdf_paths))
+    key = (normalize_problem(problema), corpus_key, use_cache)
+    response = await generation_flights.do(
+        key,
+        lambda: _generate_safety_response(pdf_paths, csv_path, problema, client, use_cache)
+    )
+    return response.model_copy(deep=True)
+
+async def _generate_safety_response(
+    pdf_paths: List[str],
+    csv_path: str,
+    problema: str,
+    client: AsyncOpenAIService,
+    use_cache: bool
+) -> SafetyResponse:
+    """
+    One generation for a problem: cache lookup, hybrid retrieval, model
+    cascade and cache store. Called through ``generation_flights`` only.
+    """
+    # Extracted text, chunks and embeddings come from the persistent index;
+    # only the query is embedded per request
+    corpus = await load_corpus(pdf_paths, csv_path, client)
+
+    with span("embed_query"):
+        query_embedding = await get_embedding_backend(client).embed_query(problema)
+
+    use_cache = use_cache and RESPONSE_CACHE_ENABLED
+    if use_cache:
+        cached_response = await response_cache.lookup(query_embedding, corpus.version)
+        if cached_response is not None:
+            return cached_response
+
+    top_k_indices = retrieve_chunks(corpus, problema, query_embedding)
+    context = build_context(corpus, problema, query_embedding, top_k_indices)
+    safety_response = await generate_from_context(corpus, problema, context, client)
+
+    if use_cache:
+        await response_cache.store(query_embedding, corpus.version, problema, safety_response)
+    return safety_response
+
+@timed("build_context")
+def build_context(corpus: Corpus, problema: str, query_embedding, chunk_indices) -> str:
+    """Retrieved manual chunks followed by the catalog items relevant to the problem."""
+    relevant_chunks = [f"[{corpus.chunk_labels[i]}]\n{corpus.chunks[i]}" for i in chunk_indices]
+
+    # Only the catalog items relevant to the problem are sent, so the prompt
+    # does not grow with the catalog
+    catalog_items = corpus.catalog.search(problema, np.asarray(query_embedding))
+    return (
+        "\n\n".join(relevant_chunks)
+        + "\n\nCATÁLOGO DE EQUIPAMENTOS RELEVANTES:\n"
+        + CatalogIndex.format_for_prompt(catalog_items)
+    )
+
+def completion_request(problema: str, context: str, model: str = generation_cascade.final_model) -> dict:
+    """Arguments of the structured-output completion call for a problem."""
+    prompt = f"{INSTRUCTIONS}\n\nContexto:\n{context}\n\nProblema: {problema}\nResposta:"
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.7,
+        "max_tokens": 1500,
+        "response_format": SafetyResponse,
+    }
+
+def check_sap_codes(safety_response: SafetyResponse, corpus: Corpus) -> dict:
+    # SAP codes are checked locally instead of relying on the full catalog in the prompt
+    report = validate_sap_codes(safety_response, corpus.sap_codes)
+    if report["fixed"] or report["unknown"]:
+        logger.info(f"SAP codes fixed: {report['fixed']}, not found: {report['unknown']}")
+    return report
+
+def response_problems(safety_response: SafetyResponse, corpus: Corpus) -> List[str]:
+    """
+    Fixes the SAP codes of a response and lists what makes it unusable:
+    solutions without steps or without any safety measure, and SAP codes
+    missing from the catalog.
+    """
+    problems = []
+    if not safety_response.ordem_servico:
+        problems.append("no solutions")
+    for solution in safety_response.ordem_servico:
+        if not solution.passos:
+            problems.append(f"no steps for '{solution.problema}'")
+        elif not any(step.medidas_seguranca for step in solution.passos):
+            problems.append(f"no safety measures for '{solution.problema}'")
+    unknown = check_sap_codes(safety_response, corpus)["unknown"]
+    if unknown:
+        problems.append(f"unknown SAP codes {[item['sap_code'] for item in unknown]}")
+    return problems
+
+@timed("generate")
+async def generate_from_context(
+    corpus: Corpus,
+    problema: str,
+    context: str,
+    client: AsyncOpenAIService
+) -> SafetyResponse:
+    """
+    Generates the structured response for a problem through the model cascade:
+    cheaper models answer first and the next model is only called when their
+    response fails the checks of response_problems.
+    """
+    logger.info("Generating assistant's response...")
+    return await generation_cascade.generate(
+        lambda model: client.parse_completion(**completion_request(problema, context, model)),
+        lambda safety_response: response_problems(safety_response, corpus)
     )
 
-    safety_response = response.choices[0].message.parsed
-    return safety_response
\ No newline at end of file
+async def process_problems_batch(
+    pdf_paths: List[str],
+    csv_path: str,
+    problemas: List[str],
+    client: AsyncOpenAIService,
+    use_cache: bool = True,
+    concurrency: int = BATCH_GENERATION_CONCURRENCY
+) -> List[Union[SafetyResponse, Exception]]:
+    """
+    Generates responses for many problems with a single retrieval pass.
+
+    All problems are embedded in one pass and scored against the chunk
+    matrix with one matrix-matrix product per request language, over the same
+    chunks as the single-problem path; generations then run with at most
+    ``concurrency`` in flight. Failures are returned in place of the response.
+    """
+    corpus = await load_corpus(pdf_paths, csv_path, client)
+    corpus_key = tuple(file_sha256(path) for path in [csv_path] + list(pdf_paths))
+    with span("embed_query_batch"):
+        query_embeddings = await get_embedding_backend(client).embed_queries(problemas)
+    with span("dense_search_batch"):
+        # Each problem is searched with the language mask of the single-problem path, one pass per language
+        dense_rows: List[np.ndarray] = [None] * len(problemas)
+        by_language: Dict[str, List[int]] = {}
+        for i, problema in enumerate(problemas):
+            by_language.setdefault(request_language(problema), []).append(i)
+        for language, positions in by_language.items():
+            mask = corpus.language_mask(language) if len(corpus.chunks) else None
+            rows, _ = corpus.index.search_batch(query_embeddings[positions], top_k=RETRIEVAL_CANDIDATES, mask=mask)
+            for i, row in zip(positions, rows):
+                dense_rows[i] = row
+
+    use_cache = use_cache and RESPONSE_CACHE_ENABLED
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(i: int) -> SafetyResponse:
+        problema, query_embedding = problemas[i], query_embeddings[i]
+        if use_cache:
+            cached_response = await response_cache.lookup(query_embedding, corpus.version)
+            if cached_response is not None:
+                return cached_response
+        async with semaphore:
+            top_k_indices = retrieve_chunks(corpus, problema, query_embedding, dense_indices=dense_rows[i])
+            context = build_context(corpus, problema, query_embedding, top_k_indices)
+            safety_response = await generate_from_context(corpus, problema, context, client)
+        if use_cache:
+            await response_cache.store(query_embedding, corpus.version, problema, safety_response)
+        return safety_response
+
+    async def generate_coalesced(i: int) -> SafetyResponse:
+        # Repeated problems, in this batch or in concurrent requests, share one generation
+        key = (normalize_problem(problemas[i]), corpus_key, use_cache)
+        response = await generation_flights.do(key, lambda: generate(i))
+        return response.model_copy(deep=True)
+
+    return list(await asyncio.gather(*(generate_coalesced(i) for i in range(len(problemas))), return_exceptions=True))
+
+async def stream_safety_response(
+    pdf_paths: List[str],
+    csv_path: str,
+    problema: str,
+    client: AsyncOpenAIService,
+    use_cache: bool = True
+) -> AsyncIterator[Tuple[str, int, Union[SafetySolution, SafetyStep, SafetyResponse]]]:
+    """
+    Streaming variant of process_documents_with_assistant.
+
+    Yields ``("step", i, SafetyStep)`` and ``("solution", i, SafetySolution)``
+    as soon as each object of ``ordem_servico[i]`` is complete in the model
+    output, then ``("response", -1, SafetyResponse)`` with the full response
+    after its SAP codes were checked. Cached responses are replayed the same way.
+    """
+    corpus = await load_corpus(pdf_paths, csv_path, client)
+
+    with span("embed_query"):
+        query_embedding = await get_embedding_backend(client).embed_query(problema)
+
+    use_cache = use_cache and RESPONSE_CACHE_ENABLED
+    if use_cache:
+        cached_response = await response_cache.lookup(query_embedding, corpus.version)
+        if cached_response is not None:
+            for i, solution in enumerate(cached_response.ordem_servico):
+                for step in solution.passos:
+                    yield "step", i, step
+                yield "solution", i, solution
+            yield "response", -1, cached_response
+            return
+
+    top_k_indices = retrieve_chunks(corpus, problema, query_embedding)
+    context = build_context(corpus, problema, query_embedding, top_k_indices)
+
+    logger.info("Streaming assistant's response...")
+    parser = ServiceOrderStreamParser()
+    # Streamed steps cannot be taken back, so streaming goes straight to the last model of the cascade
+    async for delta in client.stream_completion(**completion_request(problema, context)):
+        for event in parser.feed(delta):
+            yield event
+
+    safety_response = SafetyResponse.model_validate_json(parser.text)
+    check_sap_codes(safety_response, corpus)
+    if use_cache:
+        await response_cache.store(query_embedding, corpus.version, problema, safety_response)
+    yield "response", -1, safety_response
@@ -0,0 +1,119 @@
+import time
+import asyncio
+import bisect
+import functools
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Upper bounds in seconds, from a cache lookup to a full generation or ingestion
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Histogram:
+    """
+    In-process Prometheus histogram with one series per label combination.
+
+    An observation is a bisect and three additions under a lock, so it can be
+    recorded from the event loop and from worker threads alike. Bucket counts
+    are kept per bucket and only made cumulative when rendered.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts (+Inf last), sum]
+        self.series: Dict[Tuple[str, ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in sorted(self.series.items())]
+        for labels, counts, total in snapshot:
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels))
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            braces = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.name}_sum{braces} {total}")
+            lines.append(f"{self.name}_count{braces} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "gearing_stage_duration_seconds",
+    "Duration of the stages of the service-order pipeline.",
+    ("stage", "status")
+)
+GENERATION_MODEL_SECONDS = Histogram(
+    "gearing_generation_model_duration_seconds",
+    "Duration of the completion calls of each model of the generation cascade.",
+    ("model", "outcome")
+)
+HISTOGRAMS = [STAGE_SECONDS, GENERATION_MODEL_SECONDS]
+
+
+class Span:
+    """
+    Times a block as a pipeline stage: ``with span("retrieve"): ...``.
+
+    Works inside coroutines too, since awaits within the block are part of
+    it. Blocks that raise are recorded with ``status="error"``.
+    """
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.stage, "ok" if exc_type is None else "error")
+        return False
+
+
+span = Span
+
+
+def timed(stage: str) -> Callable:
+    """Decorator recording every call of a function or coroutine function as a stage span."""
+    def decorate(fn: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def render_metrics() -> str:
+    """All histograms in the Prometheus text exposition format."""
+    return "\n".join(line for histogram in HISTOGRAMS for line in histogram.render()) + "\n"
@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+import numpy as np
+from models import SafetyResponse
+from services.metrics import GENERATION_MODEL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Generation models, cheapest first; a response failing validation is regenerated by the next one
+GENERATION_MODELS = [
+    model.strip()
+    for model in os.getenv("GENERATION_MODELS", "gpt-4o-mini,gpt-4o-2024-08-06").split(",")
+    if model.strip()
+]
+# Latencies kept per model for the percentiles reported by stats()
+LATENCY_WINDOW = 1024
+
+
+class TierMetrics:
+    """Calls, outcomes and recent latencies of one model of the cascade."""
+
+    def __init__(self):
+        self.calls = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def stats(self) -> dict:
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            "calls": self.calls,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "escalation_rate": (self.rejected + self.errors) / self.calls if self.calls else 0.0,
+            "latency_p50": float(np.percentile(latencies, 50)),
+            "latency_p95": float(np.percentile(latencies, 95)),
+            "latency_max": float(latencies.max()),
+        }
+
+
+class ModelCascade:
+    """
+    Runs a generation on the first model and moves to the next one only when
+    the call fails or ``validate`` finds problems in the parsed response.
+
+    The last model's response is returned even when it does not validate, as a
+    single-model setup always did; its errors are raised.
+    """
+
+    def __init__(self, models: List[str] = GENERATION_MODELS):
+        if not models:
+            raise ValueError("At least one generation model is required")
+        self.models = models
+        self.metrics: Dict[str, TierMetrics] = {model: TierMetrics() for model in models}
+        self.requests = 0
+        self.escalated = 0
+
+    @property
+    def final_model(self) -> str:
+        return self.models[-1]
+
+    async def generate(
+        self,
+        complete: Callable[[str], Awaitable[Any]],
+        validate: Callable[[SafetyResponse], List[str]]
+    ) -> Optional[SafetyResponse]:
+        """
+        ``complete(model)`` performs the structured-output call and
+        ``validate(response)`` returns the problems found, if any.
+        """
+        self.requests += 1
+        for tier, model in enumerate(self.models):
+            metrics = self.metrics[model]
+            last = tier == len(self.models) - 1
+            metrics.calls += 1
+            start = time.perf_counter()
+            try:
+                response = await complete(model)
+            except Exception as e:
+                metrics.errors += 1
+                metrics.latencies.append(time.perf_counter() - start)
+                GENERATION_MODEL_SECONDS.observe(metrics.latencies[-1], model, "error")
+                if last:
+                    raise
+                logger.warning(f"{model} failed ({type(e).__name__}: {str(e)}), escalating to {self.models[tier + 1]}")
+                if tier == 0:
+                    self.escalated += 1
+                continue
+            metrics.latencies.append(time.perf_counter() - start)
+
+            parsed = response.choices[0].message.parsed
+            problems = validate(parsed) if parsed is not None else ["no parsed response"]
+            GENERATION_MODEL_SECONDS.observe(metrics.latencies[-1], model, "rejected" if problems else "accepted")
+            if not problems:
+                metrics.accepted += 1
+                return parsed
+            metrics.rejected += 1
+            if last:
+                logger.warning(f"{model} response kept despite: {'; '.join(problems)}")
+                return parsed
+            logger.info(f"{model} response rejected ({'; '.join(problems)}), escalating to {self.models[tier + 1]}")
+            if tier == 0:
+                self.escalated += 1
+
+    def stats(self) -> dict:
+        return {
+            "models": self.models,
+            "requests": self.requests,
+            "escalated": self.escalated,
+            "escalation_rate": self.escalated / self.requests if self.requests else 0.0,
+            "tiers": {model: metrics.stats() for model, metrics in self.metrics.items()},
+        }
+
+
+# Create global generation cascade instance
+generation_cascade = ModelCascade()
@@ -0,0 +1,76 @@
+import os
+import base64
+import hashlib
+import numpy as np
+from typing import Dict, List, Optional
+from services.catalog_service import tokenize
+
+# Estimated Jaccard similarity of word shingles above which two chunks are near-duplicates; 0 disables
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+SHINGLE_SIZE = 3
+# Texts with fewer shingles than this are too short to be compared reliably
+MIN_SHINGLES = 8
+# Signature length and LSH banding (bands * rows = permutations)
+NUM_PERMUTATIONS = 64
+LSH_BANDS, LSH_ROWS = 16, 4
+
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(12345)
+_A = _rng.integers(1, int(_PRIME), NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, int(_PRIME), NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def minhash(text: str, shingle_size: int = SHINGLE_SIZE) -> Optional[str]:
+    """
+    MinHash signature of the word shingles of a text, base64-encoded so that it
+    can be stored with the chunk; None for texts too short to compare.
+    """
+    words = tokenize(text)
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "little") for shingle in shingles],
+        dtype=np.uint64
+    ) % _PRIME
+    # One universal hash per permutation: (a * h + b) mod p stays below 2^63
+    signature = ((np.outer(_A, hashes) + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+    return base64.b64encode(signature.tobytes()).decode("ascii")
+
+
+def decode_signature(signature: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(signature), dtype=np.uint32)
+
+
+def near_duplicate_mask(
+    signatures: List[Optional[str]],
+    known: int = 0,
+    threshold: float = NEAR_DUPLICATE_THRESHOLD
+) -> List[bool]:
+    """
+    Marks the texts that nearly duplicate an earlier one, in order.
+
+    Candidates are found through LSH buckets over the signature bands and
+    confirmed with the estimated Jaccard similarity. The first ``known``
+    signatures belong to texts already indexed; they are compared against but
+    never marked. Texts without a signature are kept.
+    """
+    duplicates = [False] * len(signatures)
+    if threshold <= 0:
+        return duplicates
+    buckets: Dict[tuple, List[int]] = {}
+    kept: Dict[int, np.ndarray] = {}
+    for i, encoded in enumerate(signatures):
+        if encoded is None:
+            continue
+        signature = decode_signature(encoded)
+        keys = [(band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()) for band in range(LSH_BANDS)]
+        if i >= known:
+            candidates = {j for key in keys for j in buckets.get(key, ())}
+            if any(np.mean(kept[j] == signature) >= threshold for j in candidates):
+                duplicates[i] = True
+                continue
+        kept[i] = signature
+        for key in keys:
+            buckets.setdefault(key, []).append(i)
+    return duplicates
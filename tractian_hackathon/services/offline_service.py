@@ -9,6 +9,7 @@ from reportlab.platypus import Image, ListFlowable, ListItem
 from datetime import datetime
 from typing import Dict, List, Any
 import os
+from services.metrics import timed
 
 class ServiceOrderPDFGenerator:
     def __init__(self):
@@ -237,6 +238,7 @@ class ServiceOrderPDFGenerator:
         return elements
 
 # Example usage function
+@timed("service_order_pdf")
 def generate_service_order_pdf(safety_response: Dict[str, Any], output_dir: str = "output") -> str:
     """
     Generate a PDF from a safety response.
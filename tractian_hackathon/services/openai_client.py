@@ -0,0 +1,172 @@
+import os
+import re
+import random
+import asyncio
+import logging
+import httpx
+import openai
+from openai import AsyncOpenAI
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+# Concurrent in-flight calls allowed per API endpoint
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "16"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parses rate-limit durations such as '20ms', '1.5s' or '6m0s' into seconds."""
+    units = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    parts = re.findall(r"([\d.]+)(ms|s|m|h)", value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay requested by the provider in the headers of a failed response, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if "retry-after-ms" in headers:
+        return _parse_duration(headers["retry-after-ms"] + "ms")
+    if "retry-after" in headers:
+        return _parse_duration(headers["retry-after"])
+    resets = [
+        _parse_duration(headers[name])
+        for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        if name in headers
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+
+class AsyncOpenAIService:
+    """
+    Shared AsyncOpenAI client with a pooled HTTP connection, per-endpoint
+    concurrency limits and retries with jittered exponential backoff.
+
+    Like the database connection, a single instance is created at import time
+    and started/closed by the application lifespan.
+    """
+
+    def __init__(
+        self,
+        llm_concurrency: int = LLM_CONCURRENCY,
+        embedding_concurrency: int = EMBEDDING_CONCURRENCY,
+        max_retries: int = OPENAI_MAX_RETRIES
+    ):
+        self.client: Optional[AsyncOpenAI] = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.llm_semaphore = asyncio.Semaphore(llm_concurrency)
+        self.embedding_semaphore = asyncio.Semaphore(embedding_concurrency)
+        self.max_retries = max_retries
+
+    def start(self):
+        if self.client is None:
+            self.http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                ),
+                timeout=OPENAI_TIMEOUT
+            )
+            # Retries are handled here so that they respect the semaphores
+            self.client = AsyncOpenAI(http_client=self.http_client, max_retries=0)
+            logger.info("OpenAI client started")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+            self.http_client = None
+
+    def get_client(self) -> AsyncOpenAI:
+        if self.client is None:
+            self.start()
+        return self.client
+
+    @staticmethod
+    def _retry_delay(attempt: int, error: Exception) -> float:
+        # Full jitter, but never earlier than the provider asked for
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+        requested = retry_after_seconds(error)
+        if requested is not None:
+            delay = max(delay, min(requested, RETRY_MAX_DELAY) + random.uniform(0, RETRY_BASE_DELAY))
+        return delay
+
+    async def _call_with_retries(self, semaphore: asyncio.Semaphore, call: Callable[[], Awaitable[Any]]) -> Any:
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    return await call()
+            except _RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                attempt += 1
+                logger.warning(f"OpenAI call failed ({type(e).__name__}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def create_embeddings(self, **kwargs):
+        """``embeddings.create`` bounded by the embedding semaphore."""
+        client = self.get_client()
+        return await self._call_with_retries(
+            self.embedding_semaphore, lambda: client.embeddings.create(**kwargs)
+        )
+
+    async def parse_completion(self, **kwargs):
+        """``beta.chat.completions.parse`` bounded by the LLM semaphore."""
+        client = self.get_client()
+        return await self._call_with_retries(
+            self.llm_semaphore, lambda: client.beta.chat.completions.parse(**kwargs)
+        )
+
+    async def stream_completion(self, **kwargs) -> AsyncIterator[str]:
+        """
+        Content deltas of ``beta.chat.completions.stream``, bounded by the LLM semaphore.
+
+        A failed stream is retried only while nothing has been yielded yet, so
+        callers never see the same output twice.
+        """
+        client = self.get_client()
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self.llm_semaphore:
+                    async with client.beta.chat.completions.stream(**kwargs) as stream:
+                        async for event in stream:
+                            if event.type == "content.delta":
+                                started = True
+                                yield event.delta
+                return
+            except _RETRYABLE_ERRORS as e:
+                if started or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                attempt += 1
+                logger.warning(f"OpenAI stream failed ({type(e).__name__}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+
+# Create global OpenAI service instance
+openai_service = AsyncOpenAIService()
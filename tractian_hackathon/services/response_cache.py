@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import uuid
+import base64
+import asyncio
+import logging
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional, Set
+from pymongo import UpdateOne
+from models import SafetyResponse
+from services.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+# Minimum cosine similarity between two problems for a cached answer to be reused
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.97"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_FILE = os.getenv("RESPONSE_CACHE_FILE", "response_cache.jsonl")
+# Seconds over which cache changes are batched into one write
+RESPONSE_CACHE_FLUSH_DELAY = float(os.getenv("RESPONSE_CACHE_FLUSH_DELAY", "1"))
+RESPONSE_CACHE_COLLECTION = "responseCache"
+
+
+def _encode_embedding(embedding: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_embedding(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+
+def _encode_entry(entry: dict) -> dict:
+    return dict(entry, embedding=_encode_embedding(entry["embedding"]))
+
+
+class SemanticResponseCache:
+    """
+    Cache of generated SafetyResponses keyed by the embedding of the problem.
+
+    A lookup hits when a non-expired entry of the same corpus version has a
+    cosine similarity above the threshold. Entries expire after ``ttl`` seconds
+    and the least recently used ones are evicted beyond ``max_entries``.
+
+    Entries are persisted in MongoDB, or in a local JSON Lines log when the
+    database is unavailable on first use, and loaded back then. ``get_db``
+    returns the database handle (or None); the application sets it at startup. Additions,
+    removals and ``last_used`` updates are batched for ``flush_delay`` seconds
+    and written in a worker thread; the log is compacted once it holds mostly
+    superseded records.
+    """
+
+    def __init__(
+        self,
+        threshold: float = RESPONSE_CACHE_THRESHOLD,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        filename: str = RESPONSE_CACHE_FILE,
+        flush_delay: float = RESPONSE_CACHE_FLUSH_DELAY,
+        get_db: Callable[[], Any] = lambda: None
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.filename = filename
+        self.flush_delay = flush_delay
+        self.get_db = get_db
+        self.entries: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.collection = None
+        self._loaded = False
+        self._load_lock: Optional[asyncio.Lock] = None
+        # Changes not yet written: entries added, ids removed, last_used by id
+        self._added: Dict[str, dict] = {}
+        self._removed: Set[str] = set()
+        self._touched: Dict[str, float] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._log_records = 0
+        # corpus version -> (entry ids, normalized embedding matrix)
+        self._matrices: Dict[str, tuple] = {}
+
+    def _get_collection(self):
+        db = self.get_db()
+        return db[RESPONSE_CACHE_COLLECTION] if db is not None else None
+
+    def _read(self) -> List[dict]:
+        """Runs in a worker thread: picks the backend once and reads the stored entries."""
+        self.collection = self._get_collection()
+        if self.collection is not None:
+            return list(self.collection.find({}, {"_id": 0}))
+        if not os.path.exists(self.filename):
+            return []
+        entries: Dict[str, dict] = {}
+        with open(self.filename, "r", encoding="utf-8") as f:
+            for line in f:
+                self._log_records += 1
+                record = json.loads(line)
+                if record["op"] == "add":
+                    entries[record["entry"]["id"]] = record["entry"]
+                elif record["op"] == "remove":
+                    for entry_id in record["ids"]:
+                        entries.pop(entry_id, None)
+                elif record["op"] == "touch":
+                    for entry_id, last_used in record["last_used"].items():
+                        if entry_id in entries:
+                            entries[entry_id]["last_used"] = last_used
+        return list(entries.values())
+
+    async def _load(self):
+        if self._loaded:
+            return
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                documents = await asyncio.to_thread(self._read)
+            except Exception as e:
+                logger.error(f"Error loading response cache: {str(e)}")
+                documents = []
+            for document in documents:
+                document["embedding"] = _decode_embedding(document["embedding"])
+                self.entries[document["id"]] = document
+            self._loaded = True
+            self._removed.update(self._expire())
+            logger.info(f"Loaded {len(self.entries)} cached responses")
+
+    def _write(self, added: List[dict], removed: List[str], touched: Dict[str, float], snapshot: Optional[List[dict]]):
+        """Runs in a worker thread: stores one batch of changes."""
+        if self.collection is not None:
+            if removed:
+                self.collection.delete_many({"id": {"$in": removed}})
+            if added:
+                self.collection.insert_many([_encode_entry(entry) for entry in added])
+            if touched:
+                self.collection.bulk_write([
+                    UpdateOne({"id": entry_id}, {"$set": {"last_used": last_used}})
+                    for entry_id, last_used in touched.items()
+                ], ordered=False)
+            return
+        if snapshot is not None:
+            # Compaction: the log is rewritten with one record per live entry
+            tmp_path = f"{self.filename}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in snapshot:
+                    f.write(json.dumps({"op": "add", "entry": _encode_entry(entry)}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.filename)
+            return
+        with open(self.filename, "a", encoding="utf-8") as f:
+            if removed:
+                f.write(json.dumps({"op": "remove", "ids": removed}) + "\n")
+            for entry in added:
+                f.write(json.dumps({"op": "add", "entry": _encode_entry(entry)}, ensure_ascii=False) + "\n")
+            if touched:
+                f.write(json.dumps({"op": "touch", "last_used": touched}) + "\n")
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    async def flush(self):
+        """Writes the pending changes now."""
+        added = [entry for entry_id, entry in self._added.items() if entry_id not in self._removed]
+        removed = [entry_id for entry_id in self._removed if entry_id not in self._added]
+        touched = {entry_id: last_used for entry_id, last_used in self._touched.items() if entry_id in self.entries}
+        self._added, self._removed, self._touched = {}, set(), {}
+        if not (added or removed or touched):
+            return
+        snapshot = None
+        if self.collection is None:
+            self._log_records += len(added) + bool(removed) + bool(touched)
+            if self._log_records > 2 * len(self.entries) + 100:
+                snapshot = [dict(entry) for entry in self.entries.values()]
+                self._log_records = len(snapshot)
+        try:
+            await asyncio.to_thread(self._write, added, removed, touched, snapshot)
+        except Exception as e:
+            logger.error(f"Error saving response cache: {str(e)}")
+
+    def _remove(self, entry_ids: List[str]) -> List[str]:
+        for entry_id in entry_ids:
+            entry = self.entries.pop(entry_id, None)
+            if entry is not None:
+                self._matrices.pop(entry["corpus_version"], None)
+        return entry_ids
+
+    def _expire(self) -> List[str]:
+        now = time.time()
+        return self._remove([
+            entry_id for entry_id, entry in self.entries.items() if now - entry["created_at"] > self.ttl
+        ])
+
+    def _matrix(self, corpus_version: str) -> tuple:
+        if corpus_version not in self._matrices:
+            ids = [entry_id for entry_id, entry in self.entries.items() if entry["corpus_version"] == corpus_version]
+            matrix = np.array([self.entries[entry_id]["embedding"] for entry_id in ids], dtype=np.float32)
+            self._matrices[corpus_version] = (ids, matrix)
+        return self._matrices[corpus_version]
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    @timed("cache_lookup")
+    async def lookup(self, embedding, corpus_version: str) -> Optional[SafetyResponse]:
+        """Returns the cached response of the most similar problem, if close enough."""
+        await self._load()
+        ids, matrix = self._matrix(corpus_version)
+        if ids:
+            similarities = matrix @ self._normalize(embedding)
+            best = int(np.argmax(similarities))
+            entry = self.entries.get(ids[best])
+            if (
+                entry is not None
+                and similarities[best] >= self.threshold
+                and time.time() - entry["created_at"] <= self.ttl
+            ):
+                self.hits += 1
+                entry["last_used"] = self._touched[entry["id"]] = time.time()
+                self._schedule_flush()
+                logger.info(f"Response cache hit (similarity {similarities[best]:.3f})")
+                return SafetyResponse.model_validate(entry["response"])
+        self.misses += 1
+        return None
+
+    @timed("cache_store")
+    async def store(self, embedding, corpus_version: str, problema: str, response: SafetyResponse):
+        await self._load()
+        now = time.time()
+        entry = {
+            "id": uuid.uuid4().hex,
+            "corpus_version": corpus_version,
+            "problema": problema,
+            "embedding": self._normalize(embedding),
+            "response": response.model_dump(),
+            "created_at": now,
+            "last_used": now,
+        }
+        self.entries[entry["id"]] = entry
+        self._matrices.pop(corpus_version, None)
+
+        removed = self._expire()
+        overflow = len(self.entries) - self.max_entries
+        if overflow > 0:
+            least_recent = sorted(self.entries, key=lambda entry_id: self.entries[entry_id]["last_used"])
+            removed += self._remove(least_recent[:overflow])
+            self.evictions += overflow
+        self._added[entry["id"]] = entry
+        self._removed.update(removed)
+        self._schedule_flush()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Create global response cache instance
+response_cache = SemanticResponseCache()
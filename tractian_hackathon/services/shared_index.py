@@ -0,0 +1,143 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+import numpy as np
+from typing import Awaitable, Callable, Dict, List, Sequence
+from services.corpus_store import INDEX_DIR
+from services.file_locks import async_file_lock
+
+logger = logging.getLogger(__name__)
+
+# Read-only file sets shared by all worker processes, one directory per corpus version
+SHARED_INDEX_DIR = os.getenv("SHARED_INDEX_DIR", os.path.join(INDEX_DIR, "shared"))
+
+
+def _load_array(path: str) -> np.ndarray:
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # numpy cannot memory-map an empty array
+        return np.load(path)
+
+
+class TextBlob(Sequence):
+    """
+    Texts stored as one UTF-8 blob plus an offset table: text ``i`` is
+    ``blob[offsets[i]:offsets[i + 1]]``. Both are memory-mapped, so the texts
+    only take page cache, shared between processes, and are decoded on access.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("text index out of range")
+        return bytes(self.blob[self.offsets[index]:self.offsets[index + 1]]).decode("utf-8")
+
+
+class SharedIndex:
+    """
+    A published index file set, mapped read-only.
+
+    The directory holds ``meta.json``, one ``.npy`` file per array and, per text
+    list, a ``.bin`` blob with its ``_offsets.npy`` table. Directories are never
+    modified after publication: a new version is a new directory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        # Size of each mapped file
+        self.file_sizes = {entry.name: entry.stat().st_size for entry in os.scandir(path) if entry.is_file()}
+        self.nbytes = sum(self.file_sizes.values())
+
+    def array(self, name: str) -> np.ndarray:
+        return _load_array(os.path.join(self.path, f"{name}.npy"))
+
+    def texts(self, name: str) -> TextBlob:
+        offsets = _load_array(os.path.join(self.path, f"{name}_offsets.npy"))
+        blob_path = os.path.join(self.path, f"{name}.bin")
+        if os.path.getsize(blob_path) == 0:
+            blob = np.zeros(0, dtype=np.uint8)
+        else:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        return TextBlob(blob, offsets)
+
+
+def shared_index_path(name: str, root: str = SHARED_INDEX_DIR) -> str:
+    return os.path.join(root, name)
+
+
+def write_shared_index(
+    path: str,
+    arrays: Dict[str, np.ndarray],
+    texts: Dict[str, List[str]],
+    meta: dict
+) -> None:
+    """Writes a file set to a temporary directory and publishes it with an atomic rename."""
+    root = os.path.dirname(path)
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(path)}-", dir=root)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+        for name, values in texts.items():
+            encoded = [value.encode("utf-8") for value in values]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            with open(os.path.join(tmp_dir, f"{name}.bin"), "wb") as f:
+                f.write(b"".join(encoded))
+            np.save(os.path.join(tmp_dir, f"{name}_offsets.npy"), offsets)
+        # meta.json is written last: a directory without it is never opened
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_dir, path)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+async def publish_once(path: str, build: Callable[[], Awaitable[None]]) -> SharedIndex:
+    """
+    Opens the file set at ``path``, building it first if it does not exist.
+
+    Builders in every process serialize on a lock file, so with several
+    workers the first one builds and publishes the index and the others wait
+    and then map what it wrote.
+    """
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        async with async_file_lock(f"{path}.lock"):
+            if not os.path.exists(os.path.join(path, "meta.json")):
+                logger.info(f"Building shared index {path}")
+                await build()
+    return SharedIndex(path)
+
+
+def prune_shared_indexes(keep: List[str], root: str = SHARED_INDEX_DIR) -> List[str]:
+    """
+    Removes published file sets other than ``keep``. Processes that still map
+    a removed set keep reading it until they drop it.
+    """
+    if not os.path.isdir(root):
+        return []
+    removed = []
+    for entry in os.scandir(root):
+        if entry.is_dir() and not entry.name.startswith(".") and entry.name not in keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            if os.path.exists(f"{entry.path}.lock"):
+                os.remove(f"{entry.path}.lock")
+            removed.append(entry.name)
+    return removed
@@ -0,0 +1,35 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the
+    work and every caller arriving while it is in flight awaits the same result.
+
+    The shared task is shielded, so a caller that is cancelled (e.g. a client
+    disconnecting) does not cancel the work for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            self.started += 1
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+            logger.info("Joining in-flight request for the same key")
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "started": self.started, "coalesced": self.coalesced}
@@ -0,0 +1,86 @@
+import json
+from typing import List, Optional, Tuple, Union
+from pydantic import ValidationError
+from models import SafetySolution, SafetyStep
+
+# Container paths, as the keys leading to them, of the objects emitted while streaming
+_SOLUTION_PATH = [None, "ordem_servico"]
+_STEP_PATH = [None, "ordem_servico", None, "passos"]
+
+
+class ServiceOrderStreamParser:
+    """
+    Incremental scanner over the streamed JSON of a SafetyResponse.
+
+    ``feed`` takes the next piece of model output and returns the SafetyStep
+    and SafetySolution objects it completed, as ``("step", solution_index,
+    step)`` and ``("solution", solution_index, solution)`` tuples. Each
+    character is scanned once; objects that do not validate are skipped, the
+    complete response is validated separately at the end of the stream.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.position = 0
+        # Open containers as (opening char, start offset, key in the parent)
+        self.stack: List[Tuple[str, int, Optional[str]]] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.last_string: Optional[str] = None
+        self.pending_key: Optional[str] = None
+        self.solution_index = -1
+
+    def _path(self) -> List[Optional[str]]:
+        return [key for _, _, key in self.stack]
+
+    def feed(self, delta: str) -> List[Tuple[str, int, Union[SafetySolution, SafetyStep]]]:
+        self.text += delta
+        text = self.text
+        events = []
+        for i in range(self.position, len(text)):
+            c = text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    self.last_string = text[self.string_start:i + 1]
+                continue
+
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+            elif c == ":":
+                self.pending_key = json.loads(self.last_string)
+            elif c == ",":
+                self.pending_key = None
+            elif c in "{[":
+                if c == "{" and self._path() == _SOLUTION_PATH:
+                    self.solution_index += 1
+                self.stack.append((c, i, self.pending_key))
+                self.pending_key = None
+            elif c in "}]" and self.stack:
+                _, start, _ = self.stack.pop()
+                self.pending_key = None
+                if c == "}":
+                    event = self._completed(text[start:i + 1])
+                    if event is not None:
+                        events.append(event)
+        self.position = len(text)
+        return events
+
+    def _completed(self, fragment: str):
+        path = self._path()
+        if path == _STEP_PATH:
+            kind, model = "step", SafetyStep
+        elif path == _SOLUTION_PATH:
+            kind, model = "solution", SafetySolution
+        else:
+            return None
+        try:
+            return kind, self.solution_index, model.model_validate_json(fragment)
+        except ValidationError:
+            return None
@@ -0,0 +1,430 @@
+import os
+import logging
+import numpy as np
+from typing import List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Corpora with at least this many rows get an approximate (IVF) index on top of the exact one
+ANN_MIN_ROWS = int(os.getenv("VECTOR_INDEX_ANN_MIN_ROWS", "100000"))
+
+# Storage of the index rows: "float32" or "int8" (4x smaller)
+VECTOR_INDEX_PRECISION = os.getenv("VECTOR_INDEX_PRECISION", "int8")
+# Quantized searches re-score this many times top_k candidates at float32; 0 disables
+VECTOR_INDEX_RERANK_FACTOR = int(os.getenv("VECTOR_INDEX_RERANK_FACTOR", "4"))
+PRECISIONS = ("float32", "int8")
+# Size of the float32 buffer each block of int8 rows is converted into; it must stay in the CPU cache
+SCORE_BLOCK_BYTES = 256 * 1024
+
+Mask = Union[np.ndarray, slice, None]
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Returns a contiguous float32 copy of ``matrix`` with unit-norm rows."""
+    matrix = np.array(matrix, dtype=np.float32, copy=True, order="C")
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def top_k_from_scores(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Positions of the ``top_k`` highest scores, best first, in O(n + k log k)."""
+    n = scores.shape[0]
+    if top_k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < n:
+        candidates = np.argpartition(scores, n - top_k)[n - top_k:]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+def maximal_marginal_relevance(
+    matrix: np.ndarray,
+    candidates: np.ndarray,
+    relevance: np.ndarray,
+    top_k: int,
+    relevance_weight: float = 0.7
+) -> np.ndarray:
+    """
+    Greedily picks ``top_k`` of the candidate rows of a unit-norm matrix, each
+    maximizing ``relevance_weight * relevance - (1 - relevance_weight) * max
+    similarity to the rows already picked``, so near-identical rows are not
+    returned together. ``relevance`` is aligned with ``candidates``.
+    """
+    candidates = np.asarray(candidates)
+    vectors = matrix[candidates]
+    similarity = vectors @ vectors.T
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    picked = []
+    for _ in range(min(top_k, len(candidates))):
+        scores = relevance_weight * relevance - (1.0 - relevance_weight) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return candidates[picked]
+
+
+class QuantizedMatrix:
+    """
+    Unit-norm rows stored as float32, or as int8 with one float32 scale per
+    row (``row ~= codes * scale``), in one contiguous array.
+
+    Indexing returns dequantized float32 rows, so it can stand in for a float32
+    matrix. int8 rows are scored block by block: each block is converted into
+    a small float32 buffer that stays in the CPU cache and multiplied there,
+    so a search reads one byte per value from memory instead of four and no
+    float32 copy of the matrix is ever materialized. This makes int8 searches
+    about as fast as float32 ones (see benchmarks/bench_quantization.py);
+    numpy has no integer BLAS to multiply the codes directly.
+    """
+
+    def __init__(self, blocks: List[np.ndarray], precision: str = "float32", block_size: Optional[int] = None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
+        self.precision = precision
+        self._block_size = block_size
+        data, scales = [], []
+        for block in blocks:
+            if len(block) == 0:
+                continue
+            # Blocks (one per document) are normalized and quantized one at a time
+            block = normalize_rows(block)
+            if precision == "int8":
+                scale = np.abs(block).max(axis=1) / 127.0
+                scale[scale == 0] = 1.0
+                data.append(np.rint(block / scale[:, None]).astype(np.int8))
+                scales.append(scale.astype(np.float32))
+            else:
+                data.append(block)
+        self.data = np.concatenate(data) if data else np.zeros((0, 0), dtype=precision)
+        self.scales = (np.concatenate(scales) if scales else np.zeros(0, dtype=np.float32)) if precision == "int8" else None
+
+    @classmethod
+    def from_codes(
+        cls,
+        data: np.ndarray,
+        scales: Optional[np.ndarray],
+        precision: str,
+        block_size: Optional[int] = None
+    ) -> "QuantizedMatrix":
+        """Wraps rows that are already normalized and quantized, such as memory-mapped ones."""
+        matrix = cls([], precision, block_size)
+        matrix.data = data
+        matrix.scales = scales if precision == "int8" else None
+        return matrix
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.data.shape
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @property
+    def block_size(self) -> int:
+        """Rows converted to float32 at a time."""
+        if self._block_size:
+            return self._block_size
+        return max(16, SCORE_BLOCK_BYTES // (4 * max(1, self.data.shape[1] if self.data.ndim == 2 else 1)))
+
+    def __getitem__(self, index) -> np.ndarray:
+        rows = self.data[index]
+        if self.precision == "float32":
+            return rows
+        rows = rows.astype(np.float32)
+        rows *= np.asarray(self.scales[index], dtype=np.float32)[..., None]
+        return rows
+
+    def _blocks(self, rows: Optional[np.ndarray]):
+        """Yields ``(start, end, float32 rows)`` for consecutive blocks; the buffer is reused between blocks."""
+        n = len(self) if rows is None else len(rows)
+        block_size = self.block_size
+        buffer = np.empty((min(block_size, n), self.data.shape[1]), dtype=np.float32)
+        for start in range(0, n, block_size):
+            end = min(start + block_size, n)
+            block = buffer[:end - start]
+            block[...] = self.data[start:end] if rows is None else self.data[rows[start:end]]
+            yield start, end, block
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Dot products of the query with all rows, or with ``rows`` only."""
+        if self.precision == "float32":
+            return (self.data if rows is None else self.data[rows]) @ query
+        out = np.empty(len(self) if rows is None else len(rows), dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32)
+        for start, end, block in self._blocks(rows):
+            np.dot(block, query, out=out[start:end])
+        out *= self.scales if rows is None else self.scales[rows]
+        return out
+
+    def scores_batch(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """(queries x rows) dot products, one matrix-matrix product per block of rows."""
+        if self.precision == "float32":
+            return queries @ (self.data if rows is None else self.data[rows]).T
+        out = np.empty((len(queries), len(self) if rows is None else len(rows)), dtype=np.float32)
+        queries = np.asarray(queries, dtype=np.float32)
+        for start, end, block in self._blocks(rows):
+            out[:, start:end] = queries @ block.T
+        out *= self.scales if rows is None else self.scales[rows]
+        return out
+
+
+class VectorIndex:
+    """
+    Cosine-similarity search over pre-normalized rows, stored at the given
+    precision (see QuantizedMatrix); search itself runs on the stored codes.
+
+    With a quantized precision and a ``source`` holding the original float32
+    rows (usually memory-mapped), the ``rerank_factor * top_k`` best candidates
+    are re-scored exactly, which recovers nearly all of the float32 recall
+    while only the quantized matrix stays resident.
+
+    Queries can be restricted to a subset of rows with a boolean mask, an array
+    of row indices or a slice; returned indices always refer to the full matrix.
+    An already built QuantizedMatrix is used as is.
+    """
+
+    def __init__(
+        self,
+        embeddings: Union[np.ndarray, List[np.ndarray], QuantizedMatrix],
+        precision: str = VECTOR_INDEX_PRECISION,
+        source=None,
+        rerank_factor: int = VECTOR_INDEX_RERANK_FACTOR
+    ):
+        if isinstance(embeddings, QuantizedMatrix):
+            self.matrix = embeddings
+            precision = embeddings.precision
+        else:
+            blocks = embeddings if isinstance(embeddings, list) else [embeddings]
+            self.matrix = QuantizedMatrix(blocks, precision)
+        self.source = source
+        self.rerank_factor = rerank_factor if precision != "float32" and source is not None else 0
+        self.ivf: Optional["IVFIndex"] = None
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def _rows(self, mask: Mask) -> Optional[np.ndarray]:
+        if mask is None:
+            return None
+        if isinstance(mask, slice):
+            return np.arange(len(self))[mask]
+        mask = np.asarray(mask)
+        if mask.dtype == bool:
+            return np.flatnonzero(mask)
+        return mask.astype(np.int64, copy=False)
+
+    def exact_search(self, query: np.ndarray, top_k: int = 10, mask: Mask = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores every (selected) row against the query."""
+        query = normalize_rows(query)[0]
+        rows = self._rows(mask)
+        scores = self.matrix.scores(query, rows)
+        best = top_k_from_scores(scores, top_k)
+        if rows is None:
+            return best, scores[best]
+        return rows[best], scores[best]
+
+    def rerank(self, query: np.ndarray, candidates: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Re-scores candidates against their original float32 rows."""
+        if len(candidates) == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+        scores = normalize_rows(self.source[candidates]) @ normalize_rows(query)[0]
+        best = top_k_from_scores(scores, top_k)
+        return candidates[best], scores[best]
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 10,
+        mask: Mask = None,
+        nprobe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the indices and cosine scores of the ``top_k`` most similar rows.
+
+        Uses the approximate index when one was built, otherwise exact search.
+        Filtered queries that select few rows are always answered exactly.
+        """
+        if not self.rerank_factor:
+            return self._search(query, top_k, mask, nprobe)
+        candidates, _ = self._search(query, top_k * self.rerank_factor, mask, nprobe)
+        return self.rerank(query, candidates, top_k)
+
+    def _search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        mask: Mask,
+        nprobe: Optional[int]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if self.ivf is None:
+            return self.exact_search(query, top_k, mask)
+
+        rows = self._rows(mask)
+        if rows is not None and len(rows) <= self.ivf.expected_candidates(nprobe):
+            return self.exact_search(query, top_k, rows)
+        indices, scores = self.ivf.search(query, top_k, mask=rows, nprobe=nprobe)
+        if len(indices) < min(top_k, len(self) if rows is None else len(rows)):
+            # The probed clusters did not hold enough rows passing the filter
+            return self.exact_search(query, top_k, rows)
+        return indices, scores
+
+    def search_batch(
+        self,
+        queries: np.ndarray,
+        top_k: int = 10,
+        mask: Mask = None,
+        block_size: int = 256
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k search for many queries at once; row ``i`` of the returned
+        indices and scores answers ``queries[i]``.
+
+        Exact search scores a block of queries with one matrix-matrix product
+        instead of one matrix-vector product per query. With an IVF index the
+        queries are answered one by one.
+        """
+        queries = normalize_rows(queries)
+        rows = self._rows(mask)
+        n = len(self) if rows is None else len(rows)
+        k = min(top_k, n)
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        if k <= 0:
+            return indices, scores
+
+        if self.ivf is not None:
+            for i, query in enumerate(queries):
+                indices[i], scores[i] = self.search(query, k, rows)
+            return indices, scores
+
+        candidates = min(k * self.rerank_factor, n) if self.rerank_factor else k
+        for start in range(0, len(queries), block_size):
+            block_scores = self.matrix.scores_batch(queries[start:start + block_size], rows)
+            best = np.argpartition(block_scores, n - candidates, axis=1)[:, n - candidates:]
+            best_scores = np.take_along_axis(block_scores, best, axis=1)
+            if rows is not None:
+                best = rows[best]
+            if self.rerank_factor:
+                for i in range(len(best)):
+                    indices[start + i], scores[start + i] = self.rerank(queries[start + i], best[i], k)
+                continue
+            order = np.argsort(-best_scores, axis=1)
+            indices[start:start + block_size] = np.take_along_axis(best, order, axis=1)
+            scores[start:start + block_size] = np.take_along_axis(best_scores, order, axis=1)
+        return indices, scores
+
+    def build_ivf(self, n_lists: Optional[int] = None, n_iter: int = 10, seed: int = 0) -> "IVFIndex":
+        """Builds an inverted-file approximate index over the matrix."""
+        self.ivf = IVFIndex(self.matrix, n_lists=n_lists, n_iter=n_iter, seed=seed)
+        return self.ivf
+
+    @classmethod
+    def for_corpus(cls, embeddings: Union[np.ndarray, List[np.ndarray]], source=None) -> "VectorIndex":
+        """Index at the configured precision, plus an IVF index for corpora above ``ANN_MIN_ROWS`` rows."""
+        index = cls(embeddings, source=source)
+        if len(index) >= ANN_MIN_ROWS:
+            logger.info(f"Building IVF index over {len(index)} vectors")
+            index.build_ivf()
+        return index
+
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are clustered with spherical k-means and a query
+    only scores the rows of its ``nprobe`` closest clusters.
+
+    The inverted lists are stored CSR-style: ``order`` holds the row ids sorted
+    by cluster and ``offsets[c]:offsets[c + 1]`` is the slice of cluster ``c``.
+    """
+
+    def __init__(
+        self,
+        matrix: QuantizedMatrix,
+        n_lists: Optional[int] = None,
+        n_iter: int = 10,
+        seed: int = 0,
+        batch_size: int = 65536
+    ):
+        self.matrix = matrix
+        self.batch_size = batch_size
+        n = matrix.shape[0]
+        self.n_lists = max(1, min(n, n_lists or int(4 * np.sqrt(n))))
+        self.nprobe = max(1, self.n_lists // 16)
+
+        rng = np.random.default_rng(seed)
+        self.centroids = matrix[rng.choice(n, self.n_lists, replace=False)].copy()
+        # k-means is trained on a sample; all rows are assigned at the end
+        sample = matrix[rng.choice(n, min(n, self.n_lists * 256), replace=False)]
+        for _ in range(n_iter):
+            assignment = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=self.n_lists) == 0
+            # Empty clusters are re-seeded with random sample rows
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            self.centroids = normalize_rows(sums)
+
+        assignment = self._assign(matrix)
+        self.order = np.argsort(assignment, kind="stable")
+        self.offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=self.n_lists), out=self.offsets[1:])
+
+    @classmethod
+    def from_arrays(
+        cls,
+        matrix: QuantizedMatrix,
+        centroids: np.ndarray,
+        order: np.ndarray,
+        offsets: np.ndarray
+    ) -> "IVFIndex":
+        """Restores a trained index from its centroids and inverted lists."""
+        ivf = cls.__new__(cls)
+        ivf.matrix = matrix
+        ivf.batch_size = 65536
+        ivf.centroids, ivf.order, ivf.offsets = centroids, order, offsets
+        ivf.n_lists = len(centroids)
+        ivf.nprobe = max(1, ivf.n_lists // 16)
+        return ivf
+
+    def _assign(self, rows: np.ndarray) -> np.ndarray:
+        assignment = np.empty(rows.shape[0], dtype=np.int64)
+        for start in range(0, rows.shape[0], self.batch_size):
+            block = rows[start:start + self.batch_size]
+            assignment[start:start + self.batch_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignment
+
+    def expected_candidates(self, nprobe: Optional[int] = None) -> int:
+        """Average number of rows scored by a query probing ``nprobe`` clusters."""
+        return int(self.matrix.shape[0] * (nprobe or self.nprobe) / self.n_lists)
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 10,
+        mask: Optional[np.ndarray] = None,
+        nprobe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        query = normalize_rows(query)[0]
+        probes = top_k_from_scores(self.centroids @ query, nprobe or self.nprobe)
+        candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes])
+        if mask is not None:
+            candidates = candidates[np.isin(candidates, mask)]
+        scores = self.matrix.scores(query, candidates)
+        best = top_k_from_scores(scores, top_k)
+        return candidates[best], scores[best]
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Modules are imported flat, as when the app runs from the tractian_hackathon directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Ingestion stages run in a thread instead of a process pool
+os.environ.setdefault("INGESTION_WORKERS", "0")
@@ -0,0 +1,64 @@
+from services.ingestion import chunk_pages, get_encoding, split_blocks, split_text_with_boundaries
+
+PAGE = (
+    "12.5 Dispositivos de parada de emergência\n"
+    "As máquinas devem ser equipadas com um ou mais dispositivos de parada de emergência.\n"
+    "\n"
+    "Os dispositivos devem ser posicionados em locais de fácil acesso.\n"
+    "12.6 Componentes pressurizados\n"
+    "Devem ser adotadas medidas adicionais de proteção das mangueiras.\n"
+)
+
+
+def tokens(text):
+    return len(get_encoding().encode_ordinary(text))
+
+
+def test_blocks_follow_blank_lines_and_headings():
+    blocks = [PAGE[start:end] for start, end in split_blocks(PAGE)]
+    assert [block.split("\n")[0] for block in blocks] == [
+        "12.5 Dispositivos de parada de emergência",
+        "Os dispositivos devem ser posicionados em locais de fácil acesso.",
+        "12.6 Componentes pressurizados",
+    ]
+    assert "".join(blocks) == PAGE
+
+
+def test_chunks_respect_the_limit_and_keep_their_offsets():
+    text = "\n\n".join(f"Parágrafo {i}: " + "o operador deve inspecionar a proteção móvel. " * 6 for i in range(12))
+    chunks = split_text_with_boundaries(text, max_tokens=120, overlap_tokens=0)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk["text"] == text[chunk["start"]:chunk["end"]]
+        assert chunk["tokens"] <= 120
+    # Without overlap the chunks follow one another; only blank lines fall between them
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous["end"] <= chunk["start"] and not text[previous["end"]:chunk["start"]].strip()
+
+
+def test_whole_trailing_blocks_are_repeated_as_overlap():
+    paragraphs = [f"Item {i}. A proteção deve impedir o acesso à zona de perigo." for i in range(20)]
+    text = "\n\n".join(paragraphs)
+    chunks = split_text_with_boundaries(text, max_tokens=60, overlap_tokens=20)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        shared = text[chunk["start"]:previous["end"]]
+        # The overlap is made of whole paragraphs and stays within the budget
+        assert chunk["start"] < previous["end"]
+        assert shared.strip() in paragraphs
+        assert tokens(shared.strip()) <= 20
+
+
+def test_overlong_paragraph_is_cut_at_sentence_ends():
+    sentences = [f"Frase número {i} sobre o bloqueio e a etiquetagem da máquina." for i in range(40)]
+    text = " ".join(sentences)
+    chunks = split_text_with_boundaries(text, max_tokens=50, overlap_tokens=0)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk["tokens"] <= 50
+        assert chunk["text"].rstrip().endswith(".")
+
+
+def test_chunks_of_each_page_carry_page_and_hash():
+    chunks = chunk_pages({0: PAGE, 2: "Página sem título, apenas uma observação curta."}, ["h0", "h1", "h2"])
+    assert {(chunk["page"], chunk["page_hash"]) for chunk in chunks} == {(0, "h0"), (2, "h2")}
+    assert all(chunk["language"] in ("pt", "und") for chunk in chunks)
@@ -0,0 +1,72 @@
+import types
+import asyncio
+import pytest
+from services.embedding_batcher import EmbeddingBatcher, pack_batches
+from services.embeddings import OpenAIEmbeddingBackend
+
+
+def test_batches_respect_token_and_input_limits():
+    assert pack_batches([40, 40, 40, 10], max_tokens=100, max_inputs=10) == [range(0, 2), range(2, 4)]
+    assert pack_batches([1] * 5, max_tokens=100, max_inputs=2) == [range(0, 2), range(2, 4), range(4, 5)]
+
+
+def test_oversized_input_gets_a_batch_of_its_own():
+    assert pack_batches([10, 500, 10], max_tokens=100, max_inputs=10) == [range(0, 1), range(1, 2), range(2, 3)]
+    assert pack_batches([], max_tokens=100, max_inputs=10) == []
+
+
+class FlakyClient:
+    """Fails the first call of every batch starting with ``fail_on``."""
+
+    def __init__(self, fail_on):
+        self.fail_on = set(fail_on)
+        self.calls = []
+
+    async def create_embeddings(self, input, model):
+        self.calls.append(list(input))
+        if input[0] in self.fail_on:
+            self.fail_on.discard(input[0])
+            raise RuntimeError("rate limited")
+        return types.SimpleNamespace(data=[
+            types.SimpleNamespace(index=i, embedding=[float(text)]) for i, text in reversed(list(enumerate(input)))
+        ])
+
+
+def test_only_failed_batches_are_resent_and_order_is_kept():
+    client = FlakyClient(fail_on={"2"})
+    batcher = EmbeddingBatcher(client, "model", max_tokens=2, attempts=2)
+
+    embeddings = asyncio.run(batcher.embed([str(i) for i in range(6)], token_counts=[1] * 6))
+
+    assert embeddings == [[float(i)] for i in range(6)]
+    assert sorted(map(tuple, client.calls)) == [("0", "1"), ("2", "3"), ("2", "3"), ("4", "5")]
+    assert batcher.stats()["batches"] == 3 and batcher.stats()["tokens"] == 6
+
+
+class DownClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def create_embeddings(self, input, model):
+        self.calls += 1
+        raise RuntimeError("down")
+
+
+def test_batch_failing_every_attempt_raises():
+    client = DownClient()
+    batcher = EmbeddingBatcher(client, "model", attempts=2)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(batcher.embed(["a"], token_counts=[1]))
+    assert client.calls == 2
+
+
+def test_query_batches_are_counted_apart_from_documents():
+    backend = OpenAIEmbeddingBackend(FlakyClient(fail_on=()), "model")
+
+    asyncio.run(backend.embed(["1", "2", "3"], token_counts=[1, 1, 1]))
+    queries = asyncio.run(backend.embed_queries(["4", "5"]))
+
+    assert queries.tolist() == [[4.0], [5.0]]
+    stats = backend.stats()
+    assert stats["texts"] == 3 and stats["queries"]["texts"] == 2
@@ -0,0 +1,38 @@
+import asyncio
+import numpy as np
+from services.embeddings import HashingEmbeddingBackend
+
+
+def test_vectors_are_deterministic_and_unit_norm():
+    texts = ["Prensa hidráulica travada", "vazamento de óleo no redutor", ""]
+    first = HashingEmbeddingBackend(dim=256).embed_sync(texts)
+    # A new instance, as in another worker process, maps text to the same vectors
+    second = asyncio.run(HashingEmbeddingBackend(dim=256).embed(texts))
+    assert first.shape == (3, 256) and first.dtype == np.float32
+    np.testing.assert_array_equal(first, second)
+    np.testing.assert_allclose(np.linalg.norm(first[:2], axis=1), 1.0, rtol=1e-5)
+    assert not first[2].any()
+
+
+def test_accents_case_and_spacing_do_not_change_the_vector():
+    backend = HashingEmbeddingBackend(dim=256)
+    np.testing.assert_allclose(
+        backend.embed_text("Prensa  HIDRÁULICA travada"),
+        backend.embed_text("prensa hidraulica travada"),
+    )
+
+
+def test_lexical_overlap_ranks_first():
+    backend = HashingEmbeddingBackend(dim=512)
+    documents = backend.embed_sync([
+        "bloqueio e etiquetagem antes da manutenção",
+        "vazamento de óleo no redutor da esteira",
+        "proteção fixa da prensa hidráulica",
+    ])
+    query = asyncio.run(backend.embed_query("vazamento de oleo no redutor"))
+    assert int(np.argmax(documents @ query)) == 1
+
+
+def test_name_identifies_dimension_and_ngrams():
+    assert HashingEmbeddingBackend(dim=256, ngram_sizes=(3, 4, 5)).name == "hashing-char3-5-256"
+    assert HashingEmbeddingBackend(dim=512, ngram_sizes=(3, 4, 5)).name != HashingEmbeddingBackend(dim=256, ngram_sizes=(3, 4, 5)).name
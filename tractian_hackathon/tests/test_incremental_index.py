@@ -0,0 +1,170 @@
+import os
+import types
+import asyncio
+import numpy as np
+import pytest
+import PyPDF2
+from services.corpus_store import CorpusStore
+from services.embeddings import HashingEmbeddingBackend
+from services.llm_service import catalog_embeddings, index_document, reuse_pages
+
+MANUAL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts", "nr-12-atualizada-2022-1.pdf")
+HEADER = "Categoria;Descrição do Material/Equipamento;Código SAP;;\n"
+backend = HashingEmbeddingBackend(dim=64)
+
+
+class FakeEmbeddingsClient:
+    """Embeds through the hashing backend and counts the texts sent."""
+
+    def __init__(self):
+        self.texts = []
+
+    async def create_embeddings(self, input, model):
+        texts = input if isinstance(input, list) else [input]
+        self.texts.extend(texts)
+        matrix = backend.embed_sync(texts)
+        return types.SimpleNamespace(
+            data=[types.SimpleNamespace(index=i, embedding=row.tolist()) for i, row in enumerate(matrix)]
+        )
+
+
+def write_catalog(path, rows):
+    path.write_text(HEADER + "".join(f"Ferramentas;{name};{code};;\n" for name, code in rows), encoding="utf-8")
+    return str(path)
+
+
+def write_manual(path, pages):
+    reader = PyPDF2.PdfReader(MANUAL)
+    writer = PyPDF2.PdfWriter()
+    for page in pages:
+        writer.add_page(reader.pages[page])
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def index(path, client, store, kind="catalog"):
+    return asyncio.run(index_document(path, kind, client, store))
+
+
+def assert_aligned(doc):
+    """Every live chunk sits on its own page and its embedding row is the one of its text."""
+    live_chunks = doc.live_chunks
+    assert len(live_chunks) == len(doc.live_embeddings)
+    for chunk, row in zip(live_chunks, doc.live_embeddings):
+        assert chunk["page_hash"] == doc.page_hashes[chunk["page"]]
+        np.testing.assert_allclose(row, backend.embed_text(chunk["text"]), atol=1e-6)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CorpusStore(str(tmp_path / "index"))
+
+
+ROWS = [(f"Equipamento {i}", f"MAT{i:03d}") for i in range(10)]
+
+
+def test_reuse_pages_pairs_repeated_hashes_in_order():
+    assert reuse_pages(["a", "b", "a"], ["a", "a", "a", "c", "b"]) == {0: 0, 1: 2, 4: 1}
+
+
+def test_inserted_row_only_embeds_the_new_row(tmp_path, store):
+    client = FakeEmbeddingsClient()
+    path = write_catalog(tmp_path / "catalog.csv", ROWS)
+    index(path, client, store)
+    assert len(client.texts) == len(ROWS)
+
+    client.texts.clear()
+    rows = ROWS[:4] + [("Luva isolante", "MAT100")] + ROWS[4:]
+    write_catalog(tmp_path / "catalog.csv", rows)
+    doc = index(path, client, store)
+
+    assert client.texts == ["Descrição: Luva isolante | Código SAP: MAT100 | Categoria: Ferramentas"]
+    assert sorted(chunk["page"] for chunk in doc.live_chunks) == list(range(len(rows)))
+    assert_aligned(doc)
+
+
+def test_removed_rows_are_tombstoned_and_pages_shift(tmp_path, store):
+    client = FakeEmbeddingsClient()
+    path = write_catalog(tmp_path / "catalog.csv", ROWS)
+    index(path, client, store)
+
+    client.texts.clear()
+    rows = ROWS[:2] + ROWS[3:]
+    write_catalog(tmp_path / "catalog.csv", rows)
+    doc = index(path, client, store)
+
+    assert client.texts == []
+    assert len(doc.live_chunks) == len(rows)
+    assert_aligned(doc)
+    expected = backend.embed_sync([f"Descrição: {name} | Código SAP: {code} | Categoria: Ferramentas" for name, code in rows])
+    np.testing.assert_allclose(catalog_embeddings(doc, path), expected, atol=1e-6)
+
+
+def test_duplicate_rows_keep_their_own_embedding(tmp_path, store):
+    client = FakeEmbeddingsClient()
+    rows = ROWS[:3] + [ROWS[1]]
+    path = write_catalog(tmp_path / "catalog.csv", rows)
+    index(path, client, store)
+
+    # A row inserted before the duplicates moves both of them
+    rows = [("Capacete", "MAT200")] + rows + [ROWS[1]]
+    write_catalog(tmp_path / "catalog.csv", rows)
+    doc = index(path, client, store)
+
+    assert len(client.texts) == 4 + 2
+    assert_aligned(doc)
+    embeddings = catalog_embeddings(doc, path)
+    assert np.all(np.linalg.norm(embeddings, axis=1) > 0)
+
+
+@pytest.mark.skipif(not os.path.exists(MANUAL), reason="NR-12 manual not available")
+def test_manual_page_insertion_and_removal(tmp_path, store):
+    client = FakeEmbeddingsClient()
+    path = write_manual(tmp_path / "manual.pdf", range(0, 6))
+    removed_hash = index(path, client, store, kind="pdf").page_hashes[2]
+
+    client.texts.clear()
+    # Page 2 removed and page 10 inserted in front
+    write_manual(tmp_path / "manual.pdf", [10, 0, 1, 3, 4, 5])
+    doc = index(path, client, store, kind="pdf")
+
+    assert client.texts and all(chunk["page"] == 0 for chunk in doc.chunks if chunk["text"] in client.texts)
+    assert removed_hash not in {chunk["page_hash"] for chunk in doc.live_chunks}
+    assert_aligned(doc)
+
+
+def test_replaced_source_still_in_use_keeps_its_entry(tmp_path, store):
+    client = FakeEmbeddingsClient()
+    shared = write_catalog(tmp_path / "shared.csv", ROWS)
+    shared_doc = index(shared, client, store)
+    upload = write_catalog(tmp_path / "upload.csv", ROWS[:9])
+
+    # Another corpus still uses the replaced catalog, so its mapping and entry stay
+    doc = asyncio.run(index_document(upload, "catalog", client, store, replaces=shared, in_use={shared, upload}))
+    assert store.find_source(shared, {}).content_hash == shared_doc.content_hash
+    assert os.path.isdir(store.entry_dir(shared_doc.content_hash))
+
+    # Once nothing uses it, the next revision drops both
+    revision = write_catalog(tmp_path / "revision.csv", ROWS[:8])
+    asyncio.run(index_document(revision, "catalog", client, store, replaces=upload, in_use={revision}))
+    assert store.find_source(upload, {}) is None
+    assert not os.path.isdir(store.entry_dir(doc.content_hash))
+
+
+def test_saving_an_existing_entry_keeps_the_published_directory(store):
+    pages = ["pagina"]
+    chunks = [{"text": "pagina", "page": 0}, {"text": "removida", "page": 0, "deleted": True}]
+    embeddings = backend.embed_sync(["pagina", "removida"])
+    store.save("abc", {"kind": "catalog"}, pages, chunks, embeddings)
+    published = os.stat(store.entry_dir("abc")).st_ino
+
+    # A second writer of the same build discards its copy
+    store.save("abc", {"kind": "catalog"}, pages, chunks, embeddings)
+    assert os.stat(store.entry_dir("abc")).st_ino == published
+
+    # Compaction changes the rows under the same hash, so the entry is swapped
+    doc = store.compact("abc")
+    assert os.stat(store.entry_dir("abc")).st_ino != published
+    assert len(doc.chunks) == 1 and doc.embeddings.shape == (1, 64)
+    assert os.listdir(store.root) == ["abc"]
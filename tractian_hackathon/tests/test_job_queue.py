@@ -0,0 +1,217 @@
+import json
+import asyncio
+import pytest
+from pymongo.errors import DuplicateKeyError
+from services import job_queue
+from services.job_queue import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, JobQueueFull
+
+
+def matches(document, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, option) for option in condition):
+                return False
+        elif isinstance(condition, dict):
+            for operator, value in condition.items():
+                if operator == "$in" and document.get(key) not in value:
+                    return False
+                if operator == "$lt" and not (key in document and document[key] < value):
+                    return False
+                if operator == "$exists" and (key in document) != value:
+                    return False
+        elif document.get(key) != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    """The subset of a pymongo collection used by JobQueue, shared between queues like a database."""
+
+    def __init__(self):
+        self.documents = []
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find_one(self, query, projection=None):
+        return next((dict(document) for document in self.documents if matches(document, query)), None)
+
+    def replace_one(self, query, replacement, upsert=False):
+        for i, document in enumerate(self.documents):
+            if matches(document, query):
+                self.documents[i] = dict(replacement)
+                return
+        if any(document["id"] == replacement["id"] for document in self.documents):
+            raise DuplicateKeyError("id")
+        self.documents.append(dict(replacement))
+
+    def find_one_and_update(self, query, update, projection=None, return_document=None):
+        for document in self.documents:
+            if matches(document, query):
+                document.update(update["$set"])
+                return dict(document)
+        return None
+
+    def update_many(self, query, update):
+        for document in self.documents:
+            if matches(document, query):
+                document.update(update["$set"])
+
+    def delete_many(self, query):
+        self.documents = [document for document in self.documents if not matches(document, query)]
+
+
+def make_queue(handler, collection=None, filename="jobs.json", **kwargs):
+    queue = JobQueue(handler, filename=filename, **kwargs)
+    queue._get_collection = lambda: collection
+    return queue
+
+
+async def wait_for(queue, job_id, statuses=(SUCCEEDED, FAILED)):
+    for _ in range(200):
+        job = await queue.get(job_id)
+        if job is not None and job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not reach {statuses}")
+
+
+async def echo(job, set_stage):
+    set_stage("working")
+    return {"echo": job["payload"]["n"]}
+
+
+def test_jobs_run_and_are_persisted_to_the_file(tmp_path):
+    filename = str(tmp_path / "jobs.json")
+
+    async def scenario():
+        queue = make_queue(echo, filename=filename)
+        await queue.start()
+        job = queue.submit("text", {"n": 1})
+        done = await wait_for(queue, job["id"])
+        await queue.stop()
+        return done
+
+    done = asyncio.run(scenario())
+    assert done["result"] == {"echo": 1} and done["stage"] == "done"
+    with open(filename, encoding="utf-8") as f:
+        assert [job["status"] for job in json.load(f)] == [SUCCEEDED]
+
+
+def test_full_queue_rejects_submissions(tmp_path):
+    async def scenario():
+        queue = make_queue(echo, filename=str(tmp_path / "jobs.json"), workers=0, max_size=1)
+        await queue.start()
+        queue.submit("text", {"n": 1})
+        with pytest.raises(JobQueueFull):
+            queue.submit("text", {"n": 2})
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_interrupted_file_jobs_are_resumed_or_failed(tmp_path):
+    filename = str(tmp_path / "jobs.json")
+    jobs = [
+        {"id": "resumable", "kind": "text", "payload": {"n": 1}, "status": RUNNING, "stage": "working",
+         "result": None, "error": None, "created_at": 0, "updated_at": 0},
+        {"id": "lost", "kind": "microphone", "payload": {"n": 2}, "status": QUEUED, "stage": "queued",
+         "result": None, "error": None, "created_at": 0, "updated_at": 0},
+    ]
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(jobs, f)
+
+    async def scenario():
+        queue = make_queue(echo, filename=filename, can_resume=lambda job: job["kind"] != "microphone")
+        await queue.start()
+        resumed = await wait_for(queue, "resumable")
+        lost = await queue.get("lost")
+        await queue.stop()
+        return resumed, lost
+
+    resumed, lost = asyncio.run(scenario())
+    assert resumed["status"] == SUCCEEDED
+    assert lost["status"] == FAILED and "restart" in lost["error"]
+
+
+def test_running_job_of_a_live_worker_is_not_taken_over(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_LEASE", 0.3)
+    collection = FakeCollection()
+    runs = []
+
+    async def slow(job, set_stage):
+        runs.append(job["id"])
+        await asyncio.sleep(1.0)
+        return {}
+
+    async def scenario():
+        first = make_queue(slow, collection)
+        await first.start()
+        job = first.submit("text", {"n": 1})
+        await wait_for(first, job["id"], statuses=(RUNNING,))
+
+        # A second worker starting while the first one renews its lease leaves the job alone
+        second = make_queue(slow, collection)
+        await second.start()
+        await asyncio.sleep(0.5)
+        assert runs == [job["id"]]
+
+        # Once the first worker stops, its lease is released and the second one takes the job over
+        await first.stop()
+        await asyncio.sleep(0.3)
+        assert runs == [job["id"], job["id"]]
+        done = await wait_for(second, job["id"])
+        await second.stop()
+        return done, second.owner
+
+    done, owner = asyncio.run(scenario())
+    assert done["status"] == SUCCEEDED and done["owner"] == owner
+
+
+def test_finished_jobs_are_evicted_from_memory_but_stay_readable(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_LEASE", 0.06)
+    monkeypatch.setattr(job_queue, "JOB_MEMORY_TTL", 0.0)
+    collection = FakeCollection()
+
+    async def scenario():
+        queue = make_queue(echo, collection)
+        await queue.start()
+        job = queue.submit("text", {"n": 3})
+        await wait_for(queue, job["id"])
+        await asyncio.sleep(0.1)
+        in_memory = job["id"] in queue.jobs
+        stored = await queue.get(job["id"])
+        await queue.stop()
+        return in_memory, stored
+
+    in_memory, stored = asyncio.run(scenario())
+    assert not in_memory
+    assert stored["result"] == {"echo": 3}
+
+
+def test_on_finished_runs_for_failed_and_abandoned_jobs_only(tmp_path):
+    filename = str(tmp_path / "jobs.json")
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump([{"id": "lost", "kind": "microphone", "payload": {}, "status": QUEUED, "stage": "queued",
+                    "result": None, "error": None, "created_at": 0, "updated_at": 0}], f)
+    finished = []
+
+    async def failing(job, set_stage):
+        if job["payload"]["n"] == 1:
+            raise RuntimeError("transcription failed")
+        await asyncio.sleep(10)
+
+    async def scenario():
+        queue = make_queue(failing, filename=filename, can_resume=lambda job: job["kind"] != "microphone",
+                           on_finished=lambda job: finished.append(job["id"]))
+        await queue.start()
+        failed = queue.submit("audio", {"n": 1})
+        interrupted = queue.submit("audio", {"n": 2})
+        await wait_for(queue, failed["id"])
+        await wait_for(queue, interrupted["id"], statuses=(RUNNING,))
+        # A job interrupted by a shutdown is resumed later, so what it uses is kept
+        await queue.stop()
+        return failed["id"]
+
+    failed_id = asyncio.run(scenario())
+    assert finished == ["lost", failed_id]
@@ -0,0 +1,34 @@
+from services.language import UNDETERMINED, detect_language, language_keep_mask, request_language
+
+
+def test_manual_paragraphs_are_tagged_with_their_language():
+    assert detect_language(
+        "O motor deve ser instalado em local ventilado, sem exposição à umidade, e a manutenção das partes "
+        "elétricas só pode ser feita com a máquina desligada."
+    ) == "pt"
+    assert detect_language(
+        "The motor must be installed in a ventilated place and the bearings should be lubricated "
+        "according to the interval shown on the nameplate."
+    ) == "en"
+    assert detect_language(
+        "El motor debe ser instalado en un lugar ventilado y los rodamientos deben ser lubricados "
+        "según la indicación de la placa de identificación."
+    ) == "es"
+
+
+def test_tables_and_part_numbers_are_undetermined():
+    assert detect_language("W22 IR3 Premium 75 kW 4P 225S/M 380/660 V 60 Hz") == UNDETERMINED
+    assert detect_language("") == UNDETERMINED
+
+
+def test_short_requests_fall_back_to_the_default_language():
+    assert request_language("prensa travada") == "pt"
+    assert request_language("the bearing of the motor is noisy") == "en"
+
+
+def test_translations_are_dropped_and_single_language_documents_kept_whole():
+    trilingual = ["pt", "en", "es", UNDETERMINED, "pt"]
+    assert language_keep_mask(trilingual, ["pt"]) == [True, False, False, True, True]
+    # An English-only brochure has no Portuguese chunk, so nothing is dropped
+    assert language_keep_mask(["en", "en", UNDETERMINED], ["pt"]) == [True, True, True]
+    assert language_keep_mask(trilingual, []) == [True] * 5
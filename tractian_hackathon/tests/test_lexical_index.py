@@ -0,0 +1,49 @@
+import numpy as np
+from services.lexical_index import BM25Index, SortedVocabulary, reciprocal_rank_fusion
+
+TEXTS = [
+    "Item 12.38.1: as zonas de perigo das máquinas devem possuir sistemas de segurança",
+    "Motor W22 carcaça 225S/M com rolamentos lubrificados",
+    "Inspeção visual da proteção fixa da prensa",
+]
+
+
+def test_bm25_matches_compound_identifiers_exactly():
+    index = BM25Index(TEXTS)
+    best, scores = index.search("o que diz o item 12.38.1?", top_k=3)
+    assert best[0] == 0 and scores[0] > 0
+
+    best, _ = index.search("carcaça 225s/m", top_k=1)
+    assert best.tolist() == [1]
+
+
+def test_bm25_search_respects_the_mask_and_skips_unmatched_texts():
+    index = BM25Index(TEXTS)
+    best, _ = index.search("proteção da prensa", top_k=3, mask=np.array([0, 1]))
+    assert 2 not in best.tolist()
+    assert index.search("inexistente", top_k=3)[0].tolist() == []
+
+
+def test_restored_index_scores_like_the_original():
+    index = BM25Index(TEXTS)
+    terms, term_ids = index.sorted_vocabulary()
+    restored = BM25Index.from_arrays(
+        SortedVocabulary(terms, term_ids), index.doc_ids, index.term_freqs, index.offsets, index.idf, index.length_norm
+    )
+    np.testing.assert_allclose(restored.scores("rolamentos da prensa"), index.scores("rolamentos da prensa"))
+
+
+def test_rrf_favours_items_ranked_by_both_lists():
+    dense = np.array([1, 2, 3])
+    lexical = np.array([3, 4, 1])
+
+    best, scores = reciprocal_rank_fusion([dense, lexical], top_k=3, k=60)
+
+    assert best.tolist() == [1, 3, 2]
+    assert scores[0] == np.float32(1 / 61 + 1 / 63)
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_rrf_truncates_to_top_k():
+    best, scores = reciprocal_rank_fusion([np.arange(10)], top_k=4)
+    assert best.tolist() == [0, 1, 2, 3] and len(scores) == 4
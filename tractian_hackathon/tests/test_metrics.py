@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+from services import metrics
+from services.metrics import Histogram, render_metrics, span, timed
+
+
+def test_buckets_are_cumulative_and_inclusive():
+    histogram = Histogram("test_seconds", "Test durations.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "retrieve")
+    assert histogram.render() == [
+        "# HELP test_seconds Test durations.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="retrieve",le="0.1"} 2',
+        'test_seconds_bucket{stage="retrieve",le="1.0"} 3',
+        'test_seconds_bucket{stage="retrieve",le="+Inf"} 4',
+        'test_seconds_sum{stage="retrieve"} 3.65',
+        'test_seconds_count{stage="retrieve"} 4',
+    ]
+
+
+def test_label_values_are_escaped_and_unlabelled_series_have_no_braces():
+    labelled = Histogram("test_seconds", "Test durations.", ("model",), buckets=(1.0,))
+    labelled.observe(0.5, 'gpt "mini"\\\n')
+    assert 'test_seconds_count{model="gpt \\"mini\\"\\\\\\n"} 1' in labelled.render()
+
+    plain = Histogram("plain_seconds", "Plain.", (), buckets=(1.0,))
+    plain.observe(0.5)
+    assert plain.render()[2:] == ['plain_seconds_bucket{le="1.0"} 1', 'plain_seconds_bucket{le="+Inf"} 1',
+                                 "plain_seconds_sum 0.5", "plain_seconds_count 1"]
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    histogram = Histogram("stage_seconds", "Stages.", ("stage", "status"))
+    monkeypatch.setattr(metrics, "STAGE_SECONDS", histogram)
+    monkeypatch.setattr(metrics, "HISTOGRAMS", [histogram])
+    return histogram
+
+
+def test_spans_record_their_status(stages):
+    with span("retrieve"):
+        pass
+    with pytest.raises(ValueError):
+        with span("retrieve"):
+            raise ValueError("falhou")
+    assert sorted(stages.series) == [("retrieve", "error"), ("retrieve", "ok")]
+
+
+def test_timed_wraps_functions_and_coroutines(stages):
+    @timed("embed")
+    def embed():
+        return 1
+
+    @timed("generate")
+    async def generate():
+        return 2
+
+    assert embed() == 1 and asyncio.run(generate()) == 2
+    assert sorted(stages.series) == [("embed", "ok"), ("generate", "ok")]
+    text = render_metrics()
+    assert text.endswith("\n") and 'stage_seconds_count{stage="generate",status="ok"} 1' in text
@@ -0,0 +1,59 @@
+import types
+import asyncio
+import pytest
+from models import SafetyResponse
+from services.model_cascade import ModelCascade
+
+VALID = SafetyResponse(ordem_servico=[])
+INVALID = SafetyResponse(ordem_servico=[])
+
+
+def completion(parsed):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(parsed=parsed))])
+
+
+def run(cascade, answers):
+    """Runs a generation where ``answers[model]`` is the parsed response or the exception of each model."""
+    calls = []
+
+    async def complete(model):
+        calls.append(model)
+        if isinstance(answers[model], Exception):
+            raise answers[model]
+        return completion(answers[model])
+
+    result = asyncio.run(cascade.generate(complete, lambda response: [] if response is VALID else ["invalid"]))
+    return result, calls
+
+
+def test_valid_answer_of_the_first_model_is_kept():
+    cascade = ModelCascade(["small", "large"])
+    result, calls = run(cascade, {"small": VALID, "large": VALID})
+    assert result is VALID and calls == ["small"]
+    assert cascade.stats()["escalation_rate"] == 0.0
+
+
+@pytest.mark.parametrize("small", [INVALID, None, RuntimeError("timeout")])
+def test_rejected_missing_or_failed_answer_escalates(small):
+    cascade = ModelCascade(["small", "large"])
+    result, calls = run(cascade, {"small": small, "large": VALID})
+    assert result is VALID and calls == ["small", "large"]
+    stats = cascade.stats()
+    assert stats["escalated"] == 1 and stats["tiers"]["small"]["escalation_rate"] == 1.0
+
+
+def test_last_model_answer_is_kept_even_when_invalid():
+    cascade = ModelCascade(["small", "large"])
+    result, _ = run(cascade, {"small": INVALID, "large": INVALID})
+    assert result is INVALID
+
+
+def test_last_model_error_is_raised():
+    cascade = ModelCascade(["small", "large"])
+    with pytest.raises(RuntimeError):
+        run(cascade, {"small": INVALID, "large": RuntimeError("down")})
+
+
+def test_at_least_one_model_is_required():
+    with pytest.raises(ValueError):
+        ModelCascade([])
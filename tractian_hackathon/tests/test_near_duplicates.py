@@ -0,0 +1,40 @@
+import numpy as np
+from services.near_duplicates import minhash, near_duplicate_mask
+from services.vector_index import maximal_marginal_relevance
+
+CLAUSE = (
+    "As máquinas e equipamentos devem possuir dispositivos de parada de emergência "
+    "que possam ser acionados de forma rápida e segura pelo operador e por outras pessoas"
+)
+
+
+def test_short_texts_have_no_signature():
+    assert minhash("parada de emergência") is None
+
+
+def test_repeated_clause_is_marked_and_distinct_text_is_kept():
+    signatures = [
+        minhash(CLAUSE),
+        minhash(CLAUSE + " expostas"),
+        minhash("O motor deve ser desenergizado, bloqueado e etiquetado antes de qualquer intervenção de manutenção elétrica"),
+        None,
+    ]
+    assert near_duplicate_mask(signatures, threshold=0.8) == [False, True, False, False]
+    assert near_duplicate_mask(signatures, threshold=0) == [False] * 4
+
+
+def test_known_signatures_are_compared_against_but_never_marked():
+    signatures = [minhash(CLAUSE), minhash(CLAUSE)]
+    assert near_duplicate_mask(signatures, known=2) == [False, False]
+    assert near_duplicate_mask(signatures + [minhash(CLAUSE)], known=2) == [False, False, True]
+
+
+def test_mmr_skips_a_near_copy_of_a_picked_row():
+    matrix = np.array([[1.0, 0.0], [0.999, 0.045], [0.0, 1.0]], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    candidates = np.array([0, 1, 2])
+    relevance = np.array([1.0, 0.95, 0.6])
+
+    assert maximal_marginal_relevance(matrix, candidates, relevance, 2, 0.7).tolist() == [0, 2]
+    # Relevance alone keeps the copy
+    assert maximal_marginal_relevance(matrix, candidates, relevance, 2, 1.0).tolist() == [0, 1]
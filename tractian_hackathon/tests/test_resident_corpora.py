@@ -0,0 +1,57 @@
+import asyncio
+import types
+from services.corpus_registry import ResidentCorpora
+
+MB = 2**20
+
+
+def loader(version, size, calls):
+    async def load():
+        calls.append(version)
+        await asyncio.sleep(0.01)
+        return types.SimpleNamespace(version=version, resident_bytes=size)
+    return load
+
+
+def test_least_recently_used_corpus_is_evicted_over_budget():
+    calls = []
+
+    async def scenario():
+        corpora = ResidentCorpora(memory_budget=25 * MB)
+        await corpora.get("a", loader("a", 10 * MB, calls))
+        await corpora.get("b", loader("b", 10 * MB, calls))
+        # "a" is used again, so loading "c" evicts "b"
+        await corpora.get("a", loader("a", 10 * MB, calls))
+        await corpora.get("c", loader("c", 10 * MB, calls))
+        return corpora
+
+    corpora = asyncio.run(scenario())
+    stats = corpora.stats()
+    assert list(corpora.entries) == ["a", "c"]
+    assert calls == ["a", "b", "c"]
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 3, 1)
+    assert stats["resident_bytes"] == 20 * MB
+
+
+def test_corpus_over_the_budget_on_its_own_stays_loaded():
+    async def scenario():
+        corpora = ResidentCorpora(memory_budget=5 * MB)
+        await corpora.get("a", loader("a", 4 * MB, []))
+        big = await corpora.get("b", loader("b", 8 * MB, []))
+        return corpora, big
+
+    corpora, big = asyncio.run(scenario())
+    assert list(corpora.entries) == ["b"] and big.version == "b"
+    assert corpora.evictions == 1
+
+
+def test_concurrent_misses_share_one_load():
+    calls = []
+
+    async def scenario():
+        corpora = ResidentCorpora(memory_budget=100 * MB)
+        return await asyncio.gather(*(corpora.get("a", loader("a", MB, calls)) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert calls == ["a"]
+    assert all(result is results[0] for result in results)
@@ -0,0 +1,173 @@
+import types
+import asyncio
+import numpy as np
+import pytest
+from models import SafetyResponse, SafetySolution
+from services import response_cache
+from services.response_cache import SemanticResponseCache
+
+VERSION = "corpus-v1"
+
+
+def answer(problema):
+    return SafetyResponse(ordem_servico=[SafetySolution(
+        problema=problema, passos=[], equipamentos_necessarios=[], observacoes=[], referencias=[], prioridade="alta"
+    )])
+
+
+def vector(i, dim=8):
+    row = np.zeros(dim, dtype=np.float32)
+    row[i] = 1.0
+    return row
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def make_cache(tmp_path, **kwargs):
+    return SemanticResponseCache(filename=str(tmp_path / "response_cache.jsonl"), flush_delay=0, **kwargs)
+
+
+def test_similar_problem_hits_and_other_versions_miss(tmp_path, clock):
+    async def scenario():
+        cache = make_cache(tmp_path)
+        await cache.store(vector(0), VERSION, "prensa travada", answer("prensa travada"))
+        near = vector(0) + 0.01 * vector(1)
+        return (
+            await cache.lookup(near, VERSION),
+            await cache.lookup(vector(1), VERSION),
+            await cache.lookup(vector(0), "corpus-v2"),
+            cache.stats(),
+        )
+
+    hit, other_problem, other_version, stats = asyncio.run(scenario())
+    assert hit.ordem_servico[0].problema == "prensa travada"
+    assert other_problem is None and other_version is None
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    async def scenario():
+        cache = make_cache(tmp_path, ttl=60)
+        await cache.store(vector(0), VERSION, "prensa travada", answer("prensa travada"))
+        clock[0] += 30
+        fresh = await cache.lookup(vector(0), VERSION)
+        clock[0] += 31
+        expired = await cache.lookup(vector(0), VERSION)
+        await cache.flush()
+        return fresh, expired
+
+    fresh, expired = asyncio.run(scenario())
+    assert fresh is not None and expired is None
+
+    # Expired entries are not loaded back either
+    async def reload():
+        cache = make_cache(tmp_path, ttl=60)
+        return await cache.lookup(vector(0), VERSION)
+
+    assert asyncio.run(reload()) is None
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    async def scenario():
+        cache = make_cache(tmp_path, max_entries=2)
+        for i in range(2):
+            await cache.store(vector(i), VERSION, f"problema {i}", answer(f"problema {i}"))
+            clock[0] += 1
+        # Problem 0 is used again, so problem 1 is now the least recently used
+        await cache.lookup(vector(0), VERSION)
+        clock[0] += 1
+        await cache.store(vector(2), VERSION, "problema 2", answer("problema 2"))
+        return sorted(entry["problema"] for entry in cache.entries.values()), cache.stats()["evictions"]
+
+    kept, evictions = asyncio.run(scenario())
+    assert kept == ["problema 0", "problema 2"] and evictions == 1
+
+
+def test_log_is_replayed_with_removals_and_last_used(tmp_path, clock):
+    async def scenario():
+        cache = make_cache(tmp_path, max_entries=2)
+        for i in range(3):
+            await cache.store(vector(i), VERSION, f"problema {i}", answer(f"problema {i}"))
+            clock[0] += 1
+        await cache.lookup(vector(1), VERSION)
+        await cache.flush()
+        return {entry_id: entry["last_used"] for entry_id, entry in cache.entries.items()}
+
+    last_used = asyncio.run(scenario())
+
+    async def reload():
+        cache = make_cache(tmp_path, max_entries=2)
+        await cache.lookup(vector(2), "corpus-v2")
+        reloaded = {entry_id: entry["last_used"] for entry_id, entry in cache.entries.items()}
+        return await cache.lookup(vector(2), VERSION), reloaded
+
+    hit, reloaded = asyncio.run(reload())
+    assert hit.ordem_servico[0].problema == "problema 2"
+    assert reloaded == last_used
+
+
+def test_log_is_compacted_once_mostly_superseded(tmp_path, clock):
+    async def scenario():
+        cache = make_cache(tmp_path, max_entries=1)
+        for i in range(120):
+            await cache.store(vector(i % 8), VERSION, f"problema {i}", answer(f"problema {i}"))
+            await cache.flush()
+            clock[0] += 1
+
+    asyncio.run(scenario())
+    with open(tmp_path / "response_cache.jsonl", encoding="utf-8") as f:
+        records = f.readlines()
+    assert len(records) < 120
+
+
+class FakeCollection:
+    """The subset of a pymongo collection used by SemanticResponseCache."""
+
+    def __init__(self):
+        self.documents = {}
+        self.updates = []
+
+    def find(self, query, projection=None):
+        return [dict(document) for document in self.documents.values()]
+
+    def insert_many(self, documents):
+        for document in documents:
+            self.documents[document["id"]] = dict(document)
+
+    def delete_many(self, query):
+        for entry_id in query["id"]["$in"]:
+            self.documents.pop(entry_id, None)
+
+    def bulk_write(self, requests, ordered=True):
+        self.updates.extend(requests)
+
+
+def test_database_is_used_when_available_and_the_log_otherwise(tmp_path, clock):
+    collection = FakeCollection()
+
+    async def scenario(get_db):
+        cache = make_cache(tmp_path, get_db=get_db)
+        await cache.store(vector(0), VERSION, "prensa travada", answer("prensa travada"))
+        await cache.flush()
+        return cache
+
+    cache = asyncio.run(scenario(lambda: {response_cache.RESPONSE_CACHE_COLLECTION: collection}))
+    assert cache.collection is collection and len(collection.documents) == 1
+    assert not (tmp_path / "response_cache.jsonl").exists()
+
+    async def reload():
+        cache = make_cache(tmp_path, get_db=lambda: {response_cache.RESPONSE_CACHE_COLLECTION: collection})
+        hit = await cache.lookup(vector(0), VERSION)
+        await cache.flush()
+        return hit
+
+    # The hit's last_used is written back to the database
+    assert asyncio.run(reload()) is not None and len(collection.updates) == 1
+
+    cache = asyncio.run(scenario(lambda: None))
+    assert cache.collection is None and (tmp_path / "response_cache.jsonl").exists()
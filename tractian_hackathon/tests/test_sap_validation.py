@@ -0,0 +1,68 @@
+from models import Equipament, SafetyResponse, SafetySolution
+from services.catalog_service import CatalogItem, SapCodeIndex, validate_sap_codes
+
+CATALOG = [
+    CatalogItem("Serra Circular", "MAT001", "Ferramentas de Corte"),
+    CatalogItem("Disco de Corte", "MAT002", "Ferramentas de Corte"),
+    CatalogItem("Luva Isolante de Borracha", "EPI-010", "EPI"),
+    CatalogItem("Sem código", "", "EPI"),
+]
+
+
+def response(*equipments):
+    return SafetyResponse(ordem_servico=[SafetySolution(
+        problema="Prensa sem proteção",
+        passos=[],
+        equipamentos_necessarios=[Equipament(nome=nome, sap_code=code, quantidade=1) for nome, code in equipments],
+        observacoes=[],
+        referencias=[],
+        prioridade="alta",
+    )])
+
+
+def test_exact_codes_are_valid_regardless_of_separators_and_case():
+    index = SapCodeIndex(CATALOG)
+    assert "MAT001" in index
+    assert "epi010" in index and "EPI 010" in index
+    assert "" not in index
+
+    report = validate_sap_codes(response(("Serra", "mat-001")), index)
+    assert report == {"valid": 1, "fixed": [], "unknown": []}
+
+
+def test_wrong_code_is_resolved_from_the_equipment_name():
+    index = SapCodeIndex(CATALOG)
+    safety_response = response(("Disco de corte", "MAT999"))
+
+    report = validate_sap_codes(safety_response, index)
+
+    equipment = safety_response.ordem_servico[0].equipamentos_necessarios[0]
+    assert report["fixed"] == [{"from": "MAT999", "to": "MAT002", "nome": "Disco de corte"}]
+    assert (equipment.sap_code, equipment.nome) == ("MAT002", "Disco de Corte")
+
+
+def test_mistyped_code_is_resolved_from_the_closest_code():
+    index = SapCodeIndex(CATALOG)
+    safety_response = response(("Item", "EPI-01O"))
+
+    report = validate_sap_codes(safety_response, index)
+
+    assert report["fixed"][0]["to"] == "EPI-010"
+
+
+def test_unresolvable_code_is_kept_and_flagged():
+    index = SapCodeIndex(CATALOG)
+    safety_response = response(("Guindaste", "XYZ"))
+
+    report = validate_sap_codes(safety_response, index)
+
+    solution = safety_response.ordem_servico[0]
+    assert report["unknown"] == [{"sap_code": "XYZ", "nome": "Guindaste"}]
+    assert solution.equipamentos_necessarios[0].sap_code == "XYZ"
+    assert "XYZ" in solution.observacoes[0]
+
+
+def test_autocomplete_prefers_code_prefixes():
+    index = SapCodeIndex(CATALOG)
+    assert [item.sap_code for item in index.autocomplete("MAT", limit=2)] == ["MAT001", "MAT002"]
+    assert index.autocomplete("luva", limit=1)[0].sap_code == "EPI-010"
@@ -0,0 +1,57 @@
+import os
+import asyncio
+import numpy as np
+from services.shared_index import SharedIndex, prune_shared_indexes, publish_once, write_shared_index
+
+
+def test_file_set_round_trips_memory_mapped(tmp_path):
+    path = str(tmp_path / "v1")
+    embeddings = np.arange(12, dtype=np.float32).reshape(3, 4)
+    write_shared_index(
+        path,
+        arrays={"embeddings": embeddings, "empty": np.zeros((0, 4), dtype=np.int8)},
+        texts={"chunks": ["Proteção", "", "Parada de emergência — 12.5"], "none": []},
+        meta={"version": "v1", "files": ["manual.pdf"]},
+    )
+    shared = SharedIndex(path)
+    assert shared.meta == {"version": "v1", "files": ["manual.pdf"]}
+
+    array = shared.array("embeddings")
+    assert isinstance(array, np.memmap) and not array.flags.writeable
+    np.testing.assert_array_equal(array, embeddings)
+    assert shared.array("empty").shape == (0, 4)
+
+    chunks = shared.texts("chunks")
+    assert len(chunks) == 3 and list(chunks) == ["Proteção", "", "Parada de emergência — 12.5"]
+    assert chunks[-1] == "Parada de emergência — 12.5" and chunks[1:] == ["", "Parada de emergência — 12.5"]
+    assert len(shared.texts("none")) == 0
+    assert shared.nbytes == sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    # Nothing but the published directory is left behind
+    assert os.listdir(tmp_path) == ["v1"]
+
+
+def test_publish_once_builds_only_the_first_time(tmp_path):
+    path = str(tmp_path / "shared" / "v1")
+    builds = []
+
+    async def build():
+        builds.append(path)
+        await asyncio.sleep(0.01)
+        write_shared_index(path, {"rows": np.ones(2, dtype=np.float32)}, {}, {"version": "v1"})
+
+    async def scenario():
+        # Concurrent loaders wait on the lock and map the set the first one wrote
+        first = await asyncio.gather(*(publish_once(path, build) for _ in range(3)))
+        later = await publish_once(path, build)
+        return first + [later]
+
+    indexes = asyncio.run(scenario())
+    assert len(builds) == 1
+    assert all(index.meta == {"version": "v1"} for index in indexes)
+
+
+def test_prune_keeps_the_current_sets(tmp_path):
+    for name in ("old", "current"):
+        write_shared_index(str(tmp_path / name), {}, {}, {"version": name})
+    assert prune_shared_indexes(["current"], root=str(tmp_path)) == ["old"]
+    assert os.listdir(tmp_path) == ["current"]
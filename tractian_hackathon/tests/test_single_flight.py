@@ -0,0 +1,82 @@
+import asyncio
+from models import SafetyResponse, SafetySolution
+from services import llm_service
+from services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return object()
+
+    async def scenario():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+        return results, flights.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert len(calls) == 1 and all(result is results[0] for result in results)
+    assert stats == {"in_flight": 0, "started": 1, "coalesced": 4}
+
+
+def test_exception_reaches_every_waiter_and_the_key_is_released():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model unavailable")
+
+    async def scenario():
+        flights = SingleFlight()
+        outcomes = await asyncio.gather(*(flights.do("key", fail) for _ in range(3)), return_exceptions=True)
+        # A later call starts a new execution instead of reusing the failure
+        retry = await flights.do("key", lambda: asyncio.sleep(0, result="ok"))
+        return outcomes, retry
+
+    outcomes, retry = asyncio.run(scenario())
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert retry == "ok"
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        flights = SingleFlight()
+        first = asyncio.ensure_future(flights.do("key", work))
+        second = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == ("done", True)
+
+
+def test_identical_problems_make_one_generation_and_get_their_own_copy(tmp_path, monkeypatch):
+    calls = []
+
+    async def generate(pdf_paths, csv_path, problema, client, use_cache):
+        calls.append(problema)
+        await asyncio.sleep(0.01)
+        return SafetyResponse(ordem_servico=[SafetySolution(
+            problema=problema, passos=[], equipamentos_necessarios=[], observacoes=[], referencias=[], prioridade="alta"
+        )])
+
+    monkeypatch.setattr(llm_service, "_generate_safety_response", generate)
+    catalog = tmp_path / "catalog.csv"
+    catalog.write_text("Categoria;Descrição;Código SAP\n", encoding="utf-8")
+    problems = ["Prensa travada!", "prensa   travada", "PRENSA TRAVADA"]
+
+    async def scenario():
+        return await asyncio.gather(*(
+            llm_service.process_documents_with_assistant([], str(catalog), problema, client=None)
+            for problema in problems
+        ))
+
+    responses = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert len({id(response) for response in responses}) == 3
+    assert all(response == responses[0] for response in responses)
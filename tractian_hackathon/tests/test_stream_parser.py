@@ -0,0 +1,77 @@
+import json
+from models import SafetySolution, SafetyStep
+from services.stream_parser import ServiceOrderStreamParser
+
+
+def step(order, description):
+    return {
+        "ordem": order,
+        "descricao": description,
+        "justificativa": "NR-12",
+        "medidas_seguranca": ["Usar EPI"],
+        "duracao": "10min",
+    }
+
+
+def solution(problem, steps):
+    return {
+        "problema": problem,
+        "passos": steps,
+        "equipamentos_necessarios": [{"nome": "Chave", "sap_code": "MAT001", "quantidade": 1}],
+        "observacoes": [],
+        "referencias": [],
+        "prioridade": "alta",
+    }
+
+
+def feed_in_pieces(text, size):
+    parser = ServiceOrderStreamParser()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return events
+
+
+def test_steps_then_solutions_are_emitted_as_they_complete():
+    document = {"ordem_servico": [
+        solution("Prensa", [step(1, "Bloquear"), step(2, "Inspecionar")]),
+        solution("Esteira", [step(1, "Parar")]),
+    ]}
+
+    events = feed_in_pieces(json.dumps(document, ensure_ascii=False), 7)
+
+    assert [(kind, index) for kind, index, _ in events] == [
+        ("step", 0), ("step", 0), ("solution", 0), ("step", 1), ("solution", 1)
+    ]
+    assert isinstance(events[0][2], SafetyStep) and events[1][2].descricao == "Inspecionar"
+    assert isinstance(events[2][2], SafetySolution) and events[4][2].problema == "Esteira"
+
+
+def test_braces_brackets_and_quotes_inside_strings_are_not_structure():
+    tricky = 'Trocar a {tampa} [lado "A"], usar: chave, e \\ depois } ] { ['
+    document = {"ordem_servico": [solution('Painel "B" {quebrado}', [step(1, tricky)])]}
+
+    for size in (1, 3, 64):
+        events = feed_in_pieces(json.dumps(document, ensure_ascii=False), size)
+        assert [kind for kind, _, _ in events] == ["step", "solution"]
+        assert events[0][2].descricao == tricky
+        assert events[1][2].problema == 'Painel "B" {quebrado}'
+
+
+def test_escaped_quote_split_across_deltas():
+    text = json.dumps({"ordem_servico": [solution("a", [step(1, 'diz "pare"')])]})
+    split = text.index('\\"') + 1
+
+    parser = ServiceOrderStreamParser()
+    events = parser.feed(text[:split]) + parser.feed(text[split:])
+
+    assert events[0][2].descricao == 'diz "pare"'
+
+
+def test_invalid_objects_are_skipped():
+    document = {"ordem_servico": [solution("a", [{"ordem": 1, "descricao": "sem campos"}, step(2, "ok")])]}
+
+    events = feed_in_pieces(json.dumps(document), 5)
+
+    # The solution itself fails validation because of its invalid step
+    assert [(kind, obj.descricao) for kind, _, obj in events] == [("step", "ok")]
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from services.vector_index import VectorIndex, normalize_rows, top_k_from_scores
+
+
+def clustered(rows, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    data = centers[rng.integers(0, clusters, rows)] + 0.3 * rng.standard_normal((rows, dim)).astype(np.float32)
+    queries = centers[rng.integers(0, clusters, 20)] + 0.3 * rng.standard_normal((20, dim)).astype(np.float32)
+    return data, queries
+
+
+def brute_force(data, query, top_k, rows=None):
+    rows = np.arange(len(data)) if rows is None else np.asarray(rows)
+    scores = normalize_rows(data[rows]) @ normalize_rows(query)[0]
+    return rows[np.argsort(-scores, kind="stable")[:top_k]]
+
+
+def test_top_k_is_sorted_and_handles_small_inputs():
+    scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+    assert top_k_from_scores(scores, 2).tolist() == [1, 3]
+    assert top_k_from_scores(scores, 10).tolist() == [1, 3, 2, 0]
+    assert top_k_from_scores(scores, 0).tolist() == []
+
+
+def test_exact_search_matches_brute_force():
+    data, queries = clustered(500)
+    index = VectorIndex(data, precision="float32")
+    for query in queries:
+        indices, scores = index.search(query, top_k=5)
+        assert indices.tolist() == brute_force(data, query, 5).tolist()
+        assert np.all(np.diff(scores) <= 0)
+
+
+@pytest.mark.parametrize("kind", ["bool", "indices", "slice"])
+def test_masked_search_returns_full_matrix_indices_inside_the_mask(kind):
+    data, queries = clustered(300)
+    index = VectorIndex(data, precision="float32")
+    selected = np.arange(100, 200)
+    mask = {
+        "bool": np.isin(np.arange(300), selected),
+        "indices": selected,
+        "slice": slice(100, 200),
+    }[kind]
+    indices, _ = index.search(queries[0], top_k=5, mask=mask)
+    assert indices.tolist() == brute_force(data, queries[0], 5, selected).tolist()
+
+
+def test_search_batch_matches_single_queries_with_and_without_mask():
+    data, queries = clustered(400)
+    index = VectorIndex(data, precision="float32")
+    mask = np.arange(400) % 3 == 0
+    for batch_mask in (None, mask):
+        batch_indices, batch_scores = index.search_batch(queries, top_k=7, mask=batch_mask, block_size=8)
+        for query, row, row_scores in zip(queries, batch_indices, batch_scores):
+            indices, scores = index.search(query, top_k=7, mask=batch_mask)
+            assert row.tolist() == indices.tolist()
+            np.testing.assert_allclose(row_scores, scores, rtol=1e-5)
+
+
+def test_ivf_recall_against_exact_search():
+    data, queries = clustered(4000, clusters=40)
+    index = VectorIndex(data, precision="float32")
+    index.build_ivf(n_lists=32)
+    hits = 0
+    for query in queries:
+        exact = set(index.exact_search(query, top_k=10)[0].tolist())
+        approximate = index.search(query, top_k=10, nprobe=8)[0]
+        hits += len(exact & set(approximate.tolist()))
+    assert hits / (10 * len(queries)) >= 0.9
+
+
+def test_ivf_falls_back_to_exact_search_for_selective_masks():
+    data, queries = clustered(4000, clusters=40)
+    index = VectorIndex(data, precision="float32")
+    index.build_ivf(n_lists=32)
+    rows = np.arange(0, 4000, 200)
+    indices, _ = index.search(queries[0], top_k=5, mask=rows)
+    assert indices.tolist() == brute_force(data, queries[0], 5, rows).tolist()